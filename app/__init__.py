@@ -1,6 +1,21 @@
 from flask import Flask
 from config import Config
 from .services.gemini_service import GeminiService
+from .services.response_cache import ResponseCache
+from .services.executor import GenerationExecutor
+from .services.job_queue import GenerationJobQueue
+from .services.single_flight import SingleFlight, DatabaseLockBackend
+from .services.resilience import ResilientCaller, TokenBucket, RetryPolicy, CircuitBreaker
+from .services.fake_gemini import FakeGenerativeModel
+from .services.submissions import FieldIdCache, WriteBehindBuffer, register_invalidation
+from .services.analytics import AggregateBuffer, update_aggregates
+from .services.form_cache import RenderedFormCache, deploy_fingerprint, deploy_time, register_versioning
+from .services.template_index import TemplateIndex, register_staleness
+from .services.instrumentation import SamplingProfiler, register_instrumentation
+from .services.database import engine_options, register_engine_events
+from .services.user_cache import UserCache, register_invalidation as register_user_invalidation
+from .services.passwords import PasswordHasher, AttemptLimiter
+from .services.assets import AssetManifest, register_assets
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
@@ -10,22 +25,211 @@ migrate = Migrate()
 login = LoginManager()
 login.login_view = 'main.login'
 gemini_service = None
+generation_executor = None
+generation_jobs = None
+submission_fields = None
+response_buffer = None
+record_analytics = None
+analytics_buffer = None
+form_pages = None
+user_cache = None
+password_hasher = None
+login_limiter = None
+static_assets = None
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
 
     db.init_app(app)
+    with app.app_context():
+        register_engine_events(db.engine, app.config)
     migrate.init_app(app, db)
     login.init_app(app)
 
-    global gemini_service
-    if app.config['GEMINI_API_KEY']:
-        gemini_service = GeminiService(app.config['GEMINI_API_KEY'])
+    global gemini_service, generation_executor, generation_jobs, submission_fields, response_buffer, \
+        record_analytics, analytics_buffer, form_pages, user_cache, password_hasher, login_limiter, static_assets
+    password_hasher = PasswordHasher(
+        method=app.config['PASSWORD_HASH_METHOD'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+        timeout=app.config['PASSWORD_HASH_TIMEOUT'],
+        nice=app.config['PASSWORD_HASH_NICE']
+    )
+
+    if app.config['GEMINI_API_KEY'] or app.config['GEMINI_FAKE']:
+        cache = None
+        if app.config['GEMINI_CACHE_ENABLED']:
+            cache = ResponseCache(
+                max_entries=app.config['GEMINI_CACHE_MAX_ENTRIES'],
+                ttl=app.config['GEMINI_CACHE_TTL'],
+                sqlite_path=app.config['GEMINI_CACHE_SQLITE_PATH']
+            )
+        single_flight = None
+        if app.config['SINGLE_FLIGHT_ENABLED']:
+            lock_backend = None
+            if app.config['SINGLE_FLIGHT_DB_LOCKS']:
+                lock_backend = DatabaseLockBackend(app, wait_timeout=app.config['SINGLE_FLIGHT_WAIT_TIMEOUT'])
+            single_flight = SingleFlight(lock_backend)
+        resilience = ResilientCaller(
+            rate_limiter=TokenBucket(
+                rate=app.config['GEMINI_RATE_LIMIT_RPM'] / 60,
+                capacity=app.config['GEMINI_RATE_LIMIT_BURST']
+            ),
+            retry_policy=RetryPolicy(
+                max_attempts=app.config['GEMINI_MAX_ATTEMPTS'],
+                base_delay=app.config['GEMINI_RETRY_BASE_DELAY'],
+                max_delay=app.config['GEMINI_RETRY_MAX_DELAY']
+            ),
+            breaker=CircuitBreaker(
+                failure_threshold=app.config['GEMINI_BREAKER_THRESHOLD'],
+                reset_timeout=app.config['GEMINI_BREAKER_RESET']
+            ),
+            rate_limit_wait=app.config['GEMINI_RATE_LIMIT_WAIT']
+        )
+        templates = None
+        if app.config['TEMPLATE_REUSE_ENABLED']:
+            templates = TemplateIndex(
+                app,
+                threshold=app.config['TEMPLATE_MATCH_THRESHOLD'],
+                refresh_interval=app.config['TEMPLATE_INDEX_REFRESH']
+            )
+            register_staleness(templates)
+        gemini_service = GeminiService(
+            app.config['GEMINI_API_KEY'] or 'fake',
+            cache=cache,
+            single_flight=single_flight,
+            resilience=resilience,
+            structured_output=app.config['GEMINI_STRUCTURED_OUTPUT'],
+            templates=templates,
+            template_refresh=app.config['TEMPLATE_BACKGROUND_REFRESH'],
+            max_input_tokens=app.config['GEMINI_MAX_INPUT_TOKENS'],
+            thinking_budget=app.config['GEMINI_THINKING_BUDGET'],
+            lazy=app.config['GEMINI_LAZY_INIT'] or app.config['GEMINI_FAKE']
+        )
+        if app.config['GEMINI_FAKE']:
+            gemini_service.model = FakeGenerativeModel(
+                latency=app.config['GEMINI_FAKE_LATENCY'],
+                error_rate=app.config['GEMINI_FAKE_ERROR_RATE']
+            )
+        elif app.config['GEMINI_LAZY_INIT'] and app.config['GEMINI_PREWARM']:
+            gemini_service.prewarm(delay=app.config['GEMINI_PREWARM_DELAY'])
+        generation_executor = GenerationExecutor(
+            max_workers=app.config['GENERATION_MAX_WORKERS'],
+            max_pending=app.config['GENERATION_MAX_PENDING'],
+            timeout=app.config['GENERATION_TIMEOUT'],
+            max_streams=app.config['GENERATION_STREAM_MAX']
+        )
+        generation_jobs = GenerationJobQueue(
+            app,
+            gemini_service,
+            max_workers=app.config['JOB_QUEUE_WORKERS'],
+            max_queued=app.config['JOB_QUEUE_MAX_QUEUED'],
+            heartbeat_interval=app.config['JOB_QUEUE_HEARTBEAT'],
+            stale_after=app.config['JOB_QUEUE_STALE_AFTER'],
+            max_attempts=app.config['JOB_QUEUE_MAX_ATTEMPTS']
+        )
+
+    submission_fields = FieldIdCache(
+        max_entries=app.config['SUBMISSION_FIELD_CACHE_SIZE'],
+        ttl=app.config['SUBMISSION_FIELD_CACHE_TTL']
+    )
+    register_invalidation(submission_fields)
+    record_analytics = None
+    analytics_buffer = None
+    if app.config['ANALYTICS_ENABLED']:
+        bucket_width = app.config['ANALYTICS_HISTOGRAM_BUCKET_WIDTH']
+        if app.config['RESPONSE_WRITE_BEHIND']:
+            # Counters are updated once per write-behind batch, in the batch's transaction
+            record_analytics = lambda submissions: update_aggregates(submissions, bucket_width)
+        else:
+            analytics_buffer = AggregateBuffer(
+                app,
+                bucket_width=bucket_width,
+                flush_interval=app.config['ANALYTICS_FLUSH_INTERVAL']
+            )
+    response_buffer = None
+    if app.config['RESPONSE_WRITE_BEHIND']:
+        response_buffer = WriteBehindBuffer(
+            app,
+            max_batch=app.config['RESPONSE_BUFFER_MAX_BATCH'],
+            max_latency=app.config['RESPONSE_BUFFER_MAX_LATENCY'],
+            on_insert=record_analytics,
+            field_cache=submission_fields,
+            dead_letter_path=app.config['RESPONSE_DEAD_LETTER_PATH']
+        )
+
+    form_pages = None
+    if app.config['FORM_CACHE_ENABLED']:
+        form_pages = RenderedFormCache(
+            max_entries=app.config['FORM_CACHE_SIZE'],
+            disk_dir=app.config['FORM_CACHE_DIR'],
+            version_ttl=app.config['FORM_CACHE_VERSION_TTL'],
+            fingerprint=deploy_fingerprint(app),
+            deployed_at=deploy_time(app)
+        )
+    register_versioning(form_pages)
+
+    static_assets = None
+    if app.config['ASSETS_ENABLED']:
+        manifest = AssetManifest(app.static_folder, max_age=app.config['ASSETS_MAX_AGE'])
+        if manifest:
+            static_assets = manifest
+            register_assets(app, static_assets)
+
+    user_cache = None
+    if app.config['USER_CACHE_ENABLED']:
+        user_cache = UserCache(
+            max_entries=app.config['USER_CACHE_SIZE'],
+            ttl=app.config['USER_CACHE_TTL'],
+            session_claims=app.config['USER_SESSION_CLAIMS'],
+            claims_ttl=app.config['USER_SESSION_CLAIMS_TTL']
+        )
+        register_user_invalidation(user_cache)
+
+    login_limiter = None
+    if app.config['LOGIN_LIMIT_ENABLED']:
+        login_limiter = AttemptLimiter(
+            {'ip': app.config['LOGIN_LIMIT_PER_IP'], 'email': app.config['LOGIN_LIMIT_PER_EMAIL']},
+            window=app.config['LOGIN_LIMIT_WINDOW']
+        )
+
+    if app.config['INSTRUMENTATION_ENABLED']:
+        profiler = None
+        if app.config['PROFILER_ENABLED']:
+            profiler = SamplingProfiler(
+                app.config['PROFILER_DIR'],
+                interval=app.config['PROFILER_INTERVAL'],
+                slow_threshold=app.config['PROFILER_SLOW_THRESHOLD']
+            )
+        register_instrumentation(app, 'main', profiler=profiler, sql_warn_threshold=app.config['INSTRUMENTATION_SQL_WARN'])
+
+    from app.cli import register_commands
+    register_commands(app)
 
     from app.main.routes import main
     app.register_blueprint(main)
 
     return app
 
+
+def start_background_services():
+    """
+    Start the process pool and background threads that only server processes need
+
+    Called by gunicorn's post_worker_init hook and by run.py for the development server.
+    flask CLI commands build the app without starting them; the services also start
+    themselves on first use.
+    """
+    # First: the hashing processes are forked while the process has no other threads
+    if password_hasher is not None:
+        password_hasher.start()
+    if generation_jobs is not None:
+        generation_jobs.start()
+    if response_buffer is not None:
+        response_buffer.start()
+    if analytics_buffer is not None:
+        analytics_buffer.start()
+
 from app import models
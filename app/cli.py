@@ -0,0 +1,65 @@
+import click
+
+
+def register_commands(app):
+    """Register the project's flask CLI commands on the application"""
+
+    @app.cli.command('analytics-backfill')
+    @click.option('--form-id', type=int, default=None, help='Only rebuild this form.')
+    def analytics_backfill(form_id):
+        """Rebuild the response analytics tables from existing responses."""
+        from app.services.analytics import backfill
+
+        written = backfill(form_id, bucket_width=app.config['ANALYTICS_HISTOGRAM_BUCKET_WIDTH'])
+        click.echo(', '.join(f'{table}: {count} rows' for table, count in written.items()))
+
+    @app.cli.command('responses-migrate')
+    @click.option('--mode', type=click.Choice(['rows', 'compact', 'packed']), default=None,
+                  help='Target storage mode; defaults to RESPONSE_STORAGE_MODE.')
+    @click.option('--form-id', type=int, default=None, help='Only migrate this form.')
+    @click.option('--batch-size', type=int, default=500, help='Responses re-encoded per transaction.')
+    def responses_migrate(mode, form_id, batch_size):
+        """Re-encode stored responses in another answer storage mode."""
+        from app.services.answer_storage import migrate_storage
+
+        counts = migrate_storage(
+            mode or app.config['RESPONSE_STORAGE_MODE'],
+            form_id,
+            batch_size=batch_size,
+            max_packed_length=app.config['RESPONSE_PACKED_MAX_LENGTH']
+        )
+        click.echo(f"{counts['responses']} responses migrated, {counts['fields']} fields given options, "
+                   f"answer rows {counts['rows_before']} -> {counts['rows_after']}")
+
+    @app.cli.command('responses-archive')
+    @click.option('--form-id', type=int, default=None, help='Only archive this form.')
+    @click.option('--retention-days', type=int, default=None,
+                  help='Retention of forms without their own; defaults to ARCHIVE_RETENTION_DAYS.')
+    @click.option('--format', 'fmt', type=click.Choice(['auto', 'parquet', 'jsonl']), default=None,
+                  help='Archive file format; defaults to ARCHIVE_FORMAT.')
+    @click.option('--dry-run', is_flag=True, help='Only report what would be archived.')
+    def responses_archive(form_id, retention_days, fmt, dry_run):
+        """Move responses older than their form's retention into monthly archive files."""
+        from app.services.archive import archive_responses
+
+        counts = archive_responses(
+            app.config['ARCHIVE_RETENTION_DAYS'] if retention_days is None else retention_days,
+            form_id,
+            preferred_format=fmt or app.config['ARCHIVE_FORMAT'],
+            dry_run=dry_run
+        )
+        verb = 'would be archived' if dry_run else 'archived'
+        click.echo(f"{counts['responses']} responses in {counts['partitions']} monthly partitions "
+                   f"of {counts['forms']} forms {verb}")
+
+    @app.cli.command('assets-build')
+    @click.option('--clean', is_flag=True, help='Remove earlier builds first.')
+    def assets_build(clean):
+        """Write content-hashed, precompressed copies of the static files and their manifest."""
+        from app.services.assets import build_assets
+
+        stats = build_assets(app.static_folder, clean=clean)
+        line = f"{stats['files']} files ({stats['bytes']:,} bytes), {stats['variants']} compressed variants, " \
+               f"gzip {stats['gzip_bytes']:,} bytes"
+        line += f", brotli {stats['br_bytes']:,} bytes" if stats['brotli'] else ' (install brotli for .br variants)'
+        click.echo(line)
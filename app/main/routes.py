@@ -1,10 +1,24 @@
-from flask import render_template, request, jsonify, flash, redirect, url_for
+from flask import render_template, request, jsonify, flash, redirect, url_for, Response, stream_with_context, abort, \
+    current_app
 from app.main import main
-from app import gemini_service, db
+from app import (gemini_service, generation_executor, generation_jobs, submission_fields, response_buffer,
+                 analytics_buffer, form_pages, user_cache, password_hasher, login_limiter,
+                 static_assets, db)
+from app.services.executor import GenerationRejected, GenerationTimeout
+from app.services.job_queue import JobQueueFull
+from app.services.submissions import record_response
+from app.services.responses import form_fields, responses_page, response_counts
+from app.services.export import EXPORT_FORMATS, iter_response_rows, export_chunks, parquet_available
+from app.services.analytics import form_analytics
+from app.services.batch import generate_batch
+from app.services.answer_storage import field_choices
+from app.services.field_parser import parse_options
+from app.services.instrumentation import metrics
+from app.services.slugs import insert_with_unique_slug, insert_with_unique_slugs
+from app.services.passwords import HasherBusy
 from app.models import User, Form, FormField, FormResponse, ResponseAnswer
 from flask_login import current_user, login_user, logout_user, login_required
-import string
-import random
+import json
 
 @main.route('/')
 def index():
@@ -19,14 +33,37 @@ def login():
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
+        email_key = email.strip().casefold() if email else None
+        if login_limiter and not login_limiter.allow({'ip': _client_ip(), 'email': email_key}):
+            flash('Too many login attempts. Please wait a few minutes and try again.', 'danger')
+            return render_template('login.html'), 429
         user = User.query.filter_by(email=email).first()
-        if user is None or not user.check_password(password):
-            flash('Invalid email or password', 'danger')
-            return redirect(url_for('main.login'))
+        try:
+            if user is None or not user.check_password(password):
+                flash('Invalid email or password', 'danger')
+                return redirect(url_for('main.login'))
+            if user.password_needs_rehash():
+                user.set_password(password)
+                db.session.commit()
+                password_hasher.count_rehash()
+        except HasherBusy:
+            flash('The server is busy. Please try again in a moment.', 'danger')
+            return render_template('login.html'), 503
+        if login_limiter:
+            login_limiter.reset([('email', email_key)])
         login_user(user)
         return redirect(url_for('main.index'))
     return render_template('login.html')
 
+
+def _client_ip():
+    """Client address, taken from X-Forwarded-For behind LOGIN_TRUSTED_PROXIES proxies"""
+    hops = current_app.config['LOGIN_TRUSTED_PROXIES']
+    route = request.access_route
+    if hops and len(route) >= hops:
+        return route[-hops]
+    return request.remote_addr
+
 @main.route('/logout')
 def logout():
     logout_user()
@@ -56,7 +93,11 @@ def signup():
             return redirect(url_for('main.signup'))
 
         new_user = User(email=email)
-        new_user.set_password(password)
+        try:
+            new_user.set_password(password)
+        except HasherBusy:
+            flash('The server is busy. Please try again in a moment.', 'danger')
+            return redirect(url_for('main.signup'))
         db.session.add(new_user)
         db.session.commit()
 
@@ -77,64 +118,228 @@ def finalize_form():
     if not fields:
         return jsonify({'success': False, 'error': 'No fields provided.'}), 400
 
-    slug = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
-    while Form.query.filter_by(url_slug=slug).first() is not None:
-        slug = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+    new_form = insert_with_unique_slug(_new_form(title, theme, fields))
+    db.session.commit()
+
+    return jsonify({'success': True, 'url': url_for('main.view_form', slug=new_form.url_slug, _external=True)})
 
-    new_form = Form(title=title, theme=theme, url_slug=slug, author=current_user)
-    db.session.add(new_form)
+
+def _new_form(title, theme, fields):
+    """
+    Build a new form owned by the current user, with its fields, outside the session
+    
+    Args:
+        title: Form title
+        theme: Theme name
+        fields: Field dictionaries as sent by the editor (label, dataType, options or enumValues, validation)
+    
+    Returns:
+        The transient Form, to be inserted with insert_with_unique_slug(s)
+    """
+    new_form = Form(title=title, theme=theme, user_id=current_user.id)
 
     for field_data in fields:
+        options = field_data.get('options')
+        if not isinstance(options, list):
+            options = parse_options(field_data.get('enumValues') or '')
+        options = [str(option).strip() for option in options if str(option).strip()]
         form_field = FormField(
             label=field_data.get('label'),
             field_type=field_data.get('dataType'),
-            options=field_data.get('enumValues'),
+            options=json.dumps(options) if options else None,
             required='required' in field_data.get('validation', ''),
             form=new_form
         )
-        db.session.add(form_field)
+        form_field.choices = field_choices(form_field, options)
+
+    return new_form
 
-    db.session.commit()
 
-    return jsonify({'success': True, 'url': url_for('main.view_form', slug=slug, _external=True)})
+def _editor_fields(fields):
+    """Convert fields parsed by GeminiService to the shape sent by the editor"""
+    return [
+        {
+            'label': field['label'],
+            'dataType': field['type'],
+            'options': field['options'] if isinstance(field['options'], list) else parse_options(field['options'] or ''),
+            'validation': field['validation']
+        }
+        for field in fields
+    ]
 
 
 @main.route('/form/<slug>', methods=['GET', 'POST'])
 def view_form(slug):
-    form = Form.query.filter_by(url_slug=slug).first_or_404()
     if request.method == 'POST':
-        new_response = FormResponse(form=form)
-        db.session.add(new_response)
-
-        for field in form.fields:
-            value = request.form.get(f'field-{field.id}')
-            answer = ResponseAnswer(
-                field_id=field.id,
-                value=value,
-                response=new_response
-            )
-            db.session.add(answer)
-
-        db.session.commit()
+        fields = submission_fields.get(slug)
+        if fields is None:
+            abort(404)
+        values = [request.form.get(f'field-{field_id}') for field_id in fields.field_ids]
+
+        if response_buffer is not None:
+            response_buffer.submit(fields, values)
+        elif not record_response(fields, values, on_commit=analytics_buffer.add if analytics_buffer else None):
+            # Deleted by another worker while still in this worker's cache
+            submission_fields.invalidate(slug=slug)
+            abort(404)
         return render_template('thank_you.html')
-        
-    return render_template('view_form.html', form=form)
+
+    if form_pages is None:
+        form = Form.query.filter_by(url_slug=slug).first_or_404()
+        return render_template('view_form.html', form=form, fields=form_fields(form.id))
+
+    version = form_pages.version(slug)
+    if version is None:
+        abort(404)
+
+    etag = form_pages.etag(slug, version.version)
+    last_modified = form_pages.last_modified(version)
+    if request.if_none_match.contains(etag) or (
+            not request.if_none_match and request.if_modified_since
+            and last_modified <= request.if_modified_since.replace(tzinfo=None)):
+        form_pages.count_not_modified()
+        return _cacheable(Response(status=304), etag, last_modified)
+
+    page = form_pages.get(slug, version)
+    if page is None:
+        form = db.session.get(Form, version.form_id)
+        html = render_template('view_form.html', form=form, fields=form_fields(form.id))
+        page = form_pages.set(slug, version, html)
+    return _cacheable(Response(page.html, mimetype='text/html'), page.etag, page.last_modified)
+
+
+def _cacheable(response, etag, last_modified):
+    """Add validators so browsers and CDNs can revalidate the public form page cheaply"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['FORM_CACHE_MAX_AGE']
+    return response
 
 
 @main.route('/dashboard')
 @login_required
 def dashboard():
-    forms = current_user.forms.order_by(Form.timestamp.desc()).all()
-    return render_template('dashboard.html', forms=forms)
+    forms = Form.query.filter_by(user_id=current_user.id).order_by(Form.timestamp.desc()).all()
+    counts = response_counts([form.id for form in forms])
+    return render_template('dashboard.html', forms=forms, counts=counts)
+
+
+RESPONSES_PAGE_SIZE = 50
+RESPONSES_MAX_PAGE_SIZE = 500
+
+
+def _page_args():
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', RESPONSES_PAGE_SIZE, type=int)
+    return after, max(1, min(limit, RESPONSES_MAX_PAGE_SIZE))
 
 
 @main.route('/form/<int:form_id>/responses')
 @login_required
 def view_responses(form_id):
     form = Form.query.get_or_404(form_id)
-    if form.author != current_user:
+    if form.user_id != current_user.id:
         return redirect(url_for('main.dashboard'))
-    return render_template('view_responses.html', form=form)
+    after, limit = _page_args()
+    fields = form_fields(form.id)
+    rows, next_after = responses_page(form.id, [field.id for field in fields], after_id=after, limit=limit)
+    return render_template('view_responses.html', form=form, fields=fields, rows=rows,
+                           after=after, next_after=next_after, limit=limit)
+
+
+@main.route('/form/<int:form_id>/responses.json')
+@login_required
+def responses_api(form_id):
+    """
+    Paginated responses API
+    
+    Query parameters:
+    after: id of the last response of the previous page
+    limit: page size (default 50, max 500)
+    
+    Returns:
+    JSON with the form's fields, one row of values per response (aligned with
+    the fields) and the cursor for the next page
+    """
+    form = Form.query.get_or_404(form_id)
+    if form.user_id != current_user.id:
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    after, limit = _page_args()
+    fields = form_fields(form.id)
+    rows, next_after = responses_page(form.id, [field.id for field in fields], after_id=after, limit=limit)
+    return jsonify({
+        'success': True,
+        'fields': [{'id': field.id, 'label': field.label, 'type': field.field_type} for field in fields],
+        'responses': [
+            {'id': row['id'], 'timestamp': row['timestamp'].isoformat() if row['timestamp'] else None,
+             'values': row['values']}
+            for row in rows
+        ],
+        'next_after': next_after
+    })
+
+
+@main.route('/form/<int:form_id>/export.<fmt>')
+@login_required
+def export_responses(form_id, fmt):
+    """
+    Stream all responses of a form as CSV, JSON Lines or Parquet
+    
+    Rows are read with a server-side cursor and encoded as they arrive,
+    so memory use stays constant regardless of the number of responses.
+    """
+    form = Form.query.get_or_404(form_id)
+    if form.user_id != current_user.id:
+        return redirect(url_for('main.dashboard'))
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': f'Unsupported export format: {fmt}'}), 400
+    if fmt == 'parquet' and not parquet_available():
+        return jsonify({'success': False, 'error': 'Parquet export requires the pyarrow package.'}), 501
+
+    fields = form_fields(form.id)
+    rows = iter_response_rows(form.id, [field.id for field in fields])
+    response = Response(stream_with_context(export_chunks(fmt, fields, rows)), mimetype=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="form-{form.id}-responses.{fmt}"'
+    return response
+
+
+@main.route('/form/<int:form_id>/analytics')
+@login_required
+def view_analytics(form_id):
+    """
+    Summary statistics for a form's responses
+    
+    Returns:
+    JSON with submissions per day, option counts for select fields and
+    min/max/mean/histogram for number fields, read from precomputed aggregates
+    """
+    form = Form.query.get_or_404(form_id)
+    if form.user_id != current_user.id:
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    return jsonify({'success': True, **form_analytics(form.id)})
+
+
+@main.route('/form/<int:form_id>/retention', methods=['POST'])
+@login_required
+def set_retention(form_id):
+    """
+    Set how many days a form's responses stay in the database before archival
+    
+    Expects JSON with "days": a number of days, 0 to never archive, or null for
+    the ARCHIVE_RETENTION_DAYS default
+    """
+    form = Form.query.get_or_404(form_id)
+    if form.user_id != current_user.id:
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    data = request.get_json(silent=True) or {}
+    days = data.get('days')
+    if days is not None and (not isinstance(days, int) or isinstance(days, bool) or days < 0):
+        return jsonify({'success': False, 'error': 'days must be a non-negative integer or null'}), 400
+    form.retention_days = days
+    db.session.commit()
+    return jsonify({'success': True, 'retention_days': form.retention_days})
 
 
 @main.route('/generate', methods=['POST'])
@@ -144,11 +349,13 @@ def generate_fields():
     
     Expected JSON payload:
     {
-        "prompt": "user's form description (enhanced with context)"
+        "prompt": "user's form description (enhanced with context)",
+        "async": false
     }
     
     Returns:
-    JSON response with generated fields or error
+    JSON response with generated fields or error. With "async": true the
+    request is queued and a 202 response with the job id is returned instead.
     """
     if not gemini_service:
         return jsonify({
@@ -173,8 +380,35 @@ def generate_fields():
                 'error': 'Prompt cannot be empty'
             }), 400
         
-        # Generate fields using Gemini service with enhanced prompt
-        result = gemini_service.generate_form_fields(user_prompt)
+        if data.get('async'):
+            try:
+                job_id = generation_jobs.enqueue(user_prompt)
+            except JobQueueFull:
+                return jsonify({
+                    'success': False,
+                    'error': 'The server is busy generating other forms. Please try again in a few seconds.'
+                }), 503
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status_url': url_for('main.generation_job_status', job_id=job_id),
+                'result_url': url_for('main.generation_job_result', job_id=job_id)
+            }), 202
+
+        # Generate fields using Gemini service with enhanced prompt, off the request thread
+        try:
+            user_id = current_user.id if current_user.is_authenticated else None
+            result = generation_executor.run(gemini_service.generate_form_fields, user_prompt, user_id)
+        except GenerationRejected:
+            return jsonify({
+                'success': False,
+                'error': 'The server is busy generating other forms. Please try again in a few seconds.'
+            }), 503
+        except GenerationTimeout:
+            return jsonify({
+                'success': False,
+                'error': 'Request timed out. The AI service is busy. Please try again in a few seconds.'
+            }), 504
         
         if result['success']:
             return jsonify(result), 200
@@ -188,10 +422,217 @@ def generate_fields():
         }), 500
 
 
+@main.route('/generate/batch', methods=['POST'])
+def generate_batch_fields():
+    """
+    Generate fields for many forms in one request
+    
+    Expected JSON payload:
+    {
+        "items": [{"prompt": "...", "title": "optional", "theme": "optional"}, ...],
+        "parallelism": 4,
+        "finalize": false
+    }
+    
+    Returns:
+    JSON with one result per item, in order. Items fail independently. With
+    "finalize": true (login required) every successful item is saved as a form
+    in a single transaction and its result includes the public URL.
+    """
+    if not gemini_service:
+        return jsonify({
+            'success': False,
+            'error': 'API key not configured. Please set GEMINI_API_KEY environment variable.'
+        }), 500
+
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'error': 'Missing items in request'}), 400
+    if len(items) > current_app.config['GENERATION_BATCH_MAX_ITEMS']:
+        return jsonify({
+            'success': False,
+            'error': f"At most {current_app.config['GENERATION_BATCH_MAX_ITEMS']} items per batch"
+        }), 400
+    if any(not isinstance(item, dict) or not str(item.get('prompt') or '').strip() for item in items):
+        return jsonify({'success': False, 'error': 'Every item needs a non-empty prompt'}), 400
+
+    finalize = bool(data.get('finalize'))
+    if finalize and not current_user.is_authenticated:
+        return jsonify({'success': False, 'error': 'Login required to finalize forms'}), 401
+
+    max_parallelism = current_app.config['GENERATION_BATCH_MAX_PARALLELISM']
+    parallelism = data.get('parallelism') or max_parallelism
+    if not isinstance(parallelism, int) or isinstance(parallelism, bool) or parallelism < 1:
+        return jsonify({'success': False, 'error': 'parallelism must be a positive integer'}), 400
+    parallelism = min(parallelism, max_parallelism)
+    try:
+        results = generate_batch(
+            generation_executor,
+            gemini_service,
+            [item['prompt'] for item in items],
+            parallelism=parallelism,
+            # Stay below the gunicorn worker timeout however large the batch
+            timeout=min(current_app.config['GENERATION_TIMEOUT'] * len(items) / parallelism,
+                        current_app.config['GENERATION_BATCH_TIMEOUT'])
+        )
+    except GenerationRejected:
+        return jsonify({
+            'success': False,
+            'error': 'The server is busy generating other forms. Please try again in a few seconds.'
+        }), 503
+
+    if finalize:
+        created = [
+            (result, _new_form(item.get('title', 'My Form'), item.get('theme'), _editor_fields(result['fields'])))
+            for item, result in zip(items, results) if result['success'] and result['fields']
+        ]
+        insert_with_unique_slugs([form for _, form in created])
+        db.session.commit()
+        for result, form in created:
+            result['url'] = url_for('main.view_form', slug=form.url_slug, _external=True)
+
+    succeeded = sum(1 for result in results if result['success'])
+    return jsonify({
+        'success': succeeded > 0,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results
+    })
+
+
+@main.route('/generate/jobs/<job_id>')
+def generation_job_status(job_id):
+    """Report the status of a queued generation job"""
+    job = generation_jobs.get(job_id) if generation_jobs else None
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    job.pop('result')
+    return jsonify({'success': True, **job})
+
+
+@main.route('/generate/jobs/<job_id>/result')
+def generation_job_result(job_id):
+    """
+    Return the result of a queued generation job
+    
+    Returns:
+    The same JSON as a synchronous /generate call once the job has finished,
+    or 202 with the job status while it is still queued or running
+    """
+    job = generation_jobs.get(job_id) if generation_jobs else None
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    if job['status'] in ('queued', 'running'):
+        return jsonify({'success': True, 'job_id': job_id, 'status': job['status']}), 202
+    result = job['result']
+    return jsonify(result), 200 if result.get('success') else 500
+
+
+@main.route('/generate/stream', methods=['POST'])
+def generate_fields_stream():
+    """
+    Streaming variant of /generate
+    
+    Expected JSON payload:
+    {
+        "prompt": "user's form description (enhanced with context)"
+    }
+    
+    Returns:
+    Newline-delimited JSON events: one {"event": "field", ...} per generated field
+    as soon as it is complete, followed by {"event": "done", ...} or {"event": "error", ...}
+    """
+    if not gemini_service:
+        return jsonify({
+            'success': False,
+            'error': 'API key not configured. Please set GEMINI_API_KEY environment variable.'
+        }), 500
+
+    data = request.get_json(silent=True)
+    if not data or 'prompt' not in data:
+        return jsonify({
+            'success': False,
+            'error': 'Missing prompt in request'
+        }), 400
+
+    user_prompt = data['prompt']
+    if not user_prompt.strip():
+        return jsonify({
+            'success': False,
+            'error': 'Prompt cannot be empty'
+        }), 400
+
+    # The model is read on the bounded generation pool, so slow streams cannot take every request thread
+    try:
+        events = generation_executor.stream(gemini_service.stream_form_fields, user_prompt,
+                                            timeout=current_app.config['GENERATION_STREAM_TIMEOUT'])
+    except GenerationRejected:
+        return jsonify({
+            'success': False,
+            'error': 'The server is busy generating other forms. Please try again in a few seconds.'
+        }), 503
+
+    def generate():
+        try:
+            for event in events:
+                yield json.dumps(event) + '\n'
+        except GenerationTimeout:
+            yield json.dumps({
+                'event': 'error',
+                'error': 'Request timed out. The AI service is busy. Please try again in a few seconds.'
+            }) + '\n'
+        except Exception as e:
+            yield json.dumps({'event': 'error', 'error': f'Server error: {str(e)}'}) + '\n'
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @main.route('/health')
 def health():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'api_configured': gemini_service is not None
+        'api_configured': gemini_service is not None,
+        'client_initialized': gemini_service.initialized if gemini_service else None,
+        'cache': gemini_service.cache.stats() if gemini_service and gemini_service.cache else None,
+        'templates': gemini_service.templates.stats() if gemini_service and gemini_service.templates else None,
+        'token_usage': gemini_service.usage.stats() if gemini_service else None,
+        'executor': generation_executor.stats() if generation_executor else None,
+        'jobs': generation_jobs.stats() if generation_jobs else None,
+        'single_flight': gemini_service.single_flight.stats() if gemini_service and gemini_service.single_flight else None,
+        'resilience': gemini_service.resilience.stats() if gemini_service and gemini_service.resilience else None,
+        'form_pages': form_pages.stats() if form_pages else None,
+        'user_cache': user_cache.stats() if user_cache else None,
+        'passwords': password_hasher.stats() if password_hasher else None,
+        'login_limiter': login_limiter.stats() if login_limiter else None,
+        'static_assets': static_assets.stats() if static_assets else None,
+        'submissions': {
+            'field_cache': submission_fields.stats(),
+            'write_behind': response_buffer.stats() if response_buffer else None,
+            'analytics': analytics_buffer.stats() if analytics_buffer else None
+        }
     })
+
+
+@main.route('/metrics')
+def prometheus_metrics():
+    """Request, stage and SQL metrics in the Prometheus text format"""
+    if not current_app.config['INSTRUMENTATION_ENABLED']:
+        abort(404)
+    gauges = {}
+    if gemini_service and gemini_service.cache:
+        cache = gemini_service.cache.stats()
+        gauges.update({'formgen_gemini_cache_hits': cache['hits'], 'formgen_gemini_cache_misses': cache['misses']})
+    if gemini_service:
+        usage = gemini_service.usage.stats()
+        gauges.update({'formgen_gemini_input_tokens': usage['input_tokens'],
+                       'formgen_gemini_output_tokens': usage['output_tokens']})
+    if generation_executor:
+        gauges['formgen_generation_pending'] = generation_executor.stats()['pending']
+    if response_buffer:
+        gauges['formgen_write_behind_queued'] = response_buffer.stats()['queued']
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
@@ -6,7 +6,10 @@ from flask_login import UserMixin
 
 @login.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    from app import user_cache
+    if user_cache is not None:
+        return user_cache.load(int(id))
+    return db.session.get(User, int(id))
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -18,10 +21,22 @@ class User(UserMixin, db.Model):
         return '<User {}>'.format(self.email)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        from app import password_hasher
+        if password_hasher is None:
+            self.password_hash = generate_password_hash(password)
+        else:
+            self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        from app import password_hasher
+        if password_hasher is None:
+            return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        """Whether the stored hash was made with other parameters than PASSWORD_HASH_METHOD"""
+        from app import password_hasher
+        return password_hasher is not None and password_hasher.needs_rehash(self.password_hash)
 
 class Form(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -30,9 +45,14 @@ class Form(db.Model):
     theme = db.Column(db.String(50))
     url_slug = db.Column(db.String(8), unique=True, index=True)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    version = db.Column(db.Integer, default=1, server_default='1', nullable=False)  # Bumped whenever the form or its fields change
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    analytics_epoch = db.Column(db.Integer, default=0, server_default='0')  # Bumped by analytics backfill; see AggregateBuffer
+    retention_days = db.Column(db.Integer)  # Days responses stay in the database before archival; None uses ARCHIVE_RETENTION_DAYS, 0 never archives
     fields = db.relationship('FormField', backref='form', lazy='dynamic', cascade="all, delete-orphan")
     responses = db.relationship('FormResponse', backref='form', lazy='dynamic', cascade="all, delete-orphan")
+    archives = db.relationship('ResponseArchive', backref='form', lazy='dynamic', cascade="all, delete-orphan")
 
     def __repr__(self):
         return '<Form {}>'.format(self.title)
@@ -41,21 +61,100 @@ class FormField(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     label = db.Column(db.String(140))
     field_type = db.Column(db.String(50))
-    options = db.Column(db.String(500))  # For select, radio, etc.
+    options = db.Column(db.String(500))  # JSON list for select, radio, etc.; older fields hold comma-separated text
     required = db.Column(db.Boolean, default=False)
     form_id = db.Column(db.Integer, db.ForeignKey('form.id'))
+    choices = db.relationship('FieldOption', backref='field', order_by='FieldOption.position',
+                              cascade="all, delete-orphan")
+
+    @property
+    def option_values(self):
+        """Choices in display order, from the FieldOption rows, or the options column for fields without rows"""
+        if self.choices:
+            return [choice.value for choice in self.choices]
+        from app.services.answer_storage import stored_options
+        return stored_options(self.options)
 
     def __repr__(self):
         return '<FormField {}>'.format(self.label)
 
+class FieldOption(db.Model):
+    field_id = db.Column(db.Integer, db.ForeignKey('form_field.id'), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)  # Stored in ResponseAnswer.option_index
+    value = db.Column(db.String(500))
+
 class FormResponse(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.datetime.utcnow)
-    form_id = db.Column(db.Integer, db.ForeignKey('form.id'))
+    form_id = db.Column(db.Integer, db.ForeignKey('form.id'), index=True)
+    packed = db.Column(db.Text)  # JSON {field_id: value or option index} in the 'packed' storage mode
     answers = db.relationship('ResponseAnswer', backref='response', lazy='dynamic', cascade="all, delete-orphan")
 
 class ResponseAnswer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     field_id = db.Column(db.Integer, db.ForeignKey('form_field.id'))
     value = db.Column(db.String(2000))
-    response_id = db.Column(db.Integer, db.ForeignKey('form_response.id'))
+    option_index = db.Column(db.Integer)  # Set instead of value for option answers in the compact storage modes
+    response_id = db.Column(db.Integer, db.ForeignKey('form_response.id'), index=True)
+
+class ResponseArchive(db.Model):
+    # One month of a form's responses moved out of the database into a file under ARCHIVE_DIR
+    __table_args__ = (db.UniqueConstraint('form_id', 'month'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    form_id = db.Column(db.Integer, db.ForeignKey('form.id'), index=True)
+    month = db.Column(db.String(7))  # YYYY-MM of the response timestamps
+    path = db.Column(db.String(300))  # Relative to ARCHIVE_DIR
+    format = db.Column(db.String(20))  # parquet or jsonl
+    row_count = db.Column(db.Integer, default=0)
+    first_response_id = db.Column(db.Integer)
+    last_response_id = db.Column(db.Integer)
+    first_timestamp = db.Column(db.DateTime)
+    last_timestamp = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    def __repr__(self):
+        return '<ResponseArchive {} {}>'.format(self.form_id, self.month)
+
+class GenerationJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    prompt_key = db.Column(db.String(64), index=True)
+    prompt = db.Column(db.Text)
+    status = db.Column(db.String(20), index=True, default='queued')  # queued, running, done, failed
+    result = db.Column(db.Text)  # JSON encoded generate_form_fields result
+    error = db.Column(db.String(500))
+    timestamp = db.Column(db.DateTime, index=True, default=datetime.datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+    owner = db.Column(db.String(32))  # Instance id of the GenerationJobQueue running the job
+    heartbeat_at = db.Column(db.DateTime, index=True)  # Refreshed by the owner until the job finishes
+    attempts = db.Column(db.Integer, default=0, server_default='0')  # Runs started, including takeovers
+
+    def __repr__(self):
+        return '<GenerationJob {} {}>'.format(self.id, self.status)
+
+class GenerationLock(db.Model):
+    key = db.Column(db.String(64), primary_key=True)
+    owner = db.Column(db.String(100))
+    expires_at = db.Column(db.DateTime, index=True)
+
+class FormDailyCount(db.Model):
+    form_id = db.Column(db.Integer, db.ForeignKey('form.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, default=0)
+
+class FieldValueCount(db.Model):
+    field_id = db.Column(db.Integer, db.ForeignKey('form_field.id'), primary_key=True)
+    value = db.Column(db.String(200), primary_key=True)
+    count = db.Column(db.Integer, default=0)
+
+class FieldNumericStat(db.Model):
+    field_id = db.Column(db.Integer, db.ForeignKey('form_field.id'), primary_key=True)
+    count = db.Column(db.Integer, default=0)
+    total = db.Column(db.Float, default=0.0)
+    minimum = db.Column(db.Float)
+    maximum = db.Column(db.Float)
+
+class FieldHistogramBucket(db.Model):
+    field_id = db.Column(db.Integer, db.ForeignKey('form_field.id'), primary_key=True)
+    lower = db.Column(db.Float, primary_key=True)
+    count = db.Column(db.Integer, default=0)
@@ -1,3 +1,25 @@
 from .gemini_service import GeminiService
+from .response_cache import ResponseCache
+from .executor import GenerationExecutor, GenerationRejected, GenerationTimeout
+from .job_queue import GenerationJobQueue, JobQueueFull
+from .single_flight import SingleFlight, DatabaseLockBackend
+from .resilience import ResilientCaller, TokenBucket, RetryPolicy, CircuitBreaker, CircuitOpenError, RateLimitExceeded
+from .fake_gemini import FakeGenerativeModel
+from .submissions import FieldIdCache, WriteBehindBuffer, record_response
+from .analytics import AggregateBuffer, update_aggregates, form_analytics, backfill
+from .form_cache import RenderedFormCache
+from .batch import generate_batch
+from .template_index import TemplateIndex, register_staleness
+from .answer_storage import STORAGE_MODES, migrate_storage
+from .user_cache import UserCache, UserSnapshot
+from .passwords import PasswordHasher, HasherBusy, AttemptLimiter
+from .assets import AssetManifest, build_assets
 
-__all__ = ['GeminiService']
\ No newline at end of file
+__all__ = ['GeminiService', 'ResponseCache', 'GenerationExecutor', 'GenerationRejected', 'GenerationTimeout',
+           'GenerationJobQueue', 'JobQueueFull', 'SingleFlight', 'DatabaseLockBackend',
+           'ResilientCaller', 'TokenBucket', 'RetryPolicy', 'CircuitBreaker', 'CircuitOpenError', 'RateLimitExceeded',
+           'FakeGenerativeModel', 'FieldIdCache', 'WriteBehindBuffer', 'record_response',
+           'AggregateBuffer', 'update_aggregates', 'form_analytics', 'backfill', 'RenderedFormCache', 'generate_batch',
+           'TemplateIndex', 'register_staleness', 'STORAGE_MODES', 'migrate_storage',
+           'UserCache', 'UserSnapshot', 'PasswordHasher', 'HasherBusy', 'AttemptLimiter',
+           'AssetManifest', 'build_assets']
\ No newline at end of file
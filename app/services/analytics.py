@@ -0,0 +1,504 @@
+import atexit
+import logging
+import math
+import threading
+from collections import Counter
+from typing import Dict, Iterable, Optional, Sequence
+
+from sqlalchemy import case
+
+logger = logging.getLogger(__name__)
+
+OPTION_TYPES = ('select', 'radio', 'checkbox')
+NUMERIC_TYPES = ('number', 'range')
+MAX_VALUE_LENGTH = 200
+
+DEFAULT_BUCKET_WIDTH = 10.0
+
+
+def _to_number(value: Optional[str]) -> Optional[float]:
+    if value is None or value == '':
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _bucket(number: float, width: float) -> float:
+    return math.floor(number / width) * width
+
+
+def _increment(model, key_columns: Sequence[str], rows: Sequence[Dict[str, any]], add_columns: Sequence[str],
+               min_columns: Sequence[str] = (), max_columns: Sequence[str] = ()):
+    """Insert aggregate rows, or fold them into existing rows with the same key"""
+    from app import db
+
+    if not rows:
+        return
+    # Same key order in every writer, so concurrent batches cannot deadlock on each other's rows
+    rows = sorted(rows, key=lambda row: tuple(row[column] for column in key_columns))
+    table = model.__table__
+    dialect = db.session.get_bind().dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        update = {column: table.c[column] + stmt.excluded[column] for column in add_columns}
+        for column in min_columns:
+            update[column] = case((stmt.excluded[column] < table.c[column], stmt.excluded[column]),
+                                  else_=table.c[column])
+        for column in max_columns:
+            update[column] = case((stmt.excluded[column] > table.c[column], stmt.excluded[column]),
+                                  else_=table.c[column])
+        db.session.execute(stmt.on_conflict_do_update(index_elements=list(key_columns), set_=update), rows)
+        return
+
+    for row in rows:
+        key = [table.c[column] == row[column] for column in key_columns]
+        update = {column: table.c[column] + row[column] for column in add_columns}
+        for column in min_columns:
+            update[column] = case((table.c[column] > row[column], row[column]), else_=table.c[column])
+        for column in max_columns:
+            update[column] = case((table.c[column] < row[column], row[column]), else_=table.c[column])
+        if db.session.execute(table.update().where(*key).values(**update)).rowcount == 0:
+            db.session.execute(table.insert().values(**row))
+
+
+def update_aggregates(submissions: Iterable[tuple], bucket_width: float = DEFAULT_BUCKET_WIDTH):
+    """
+    Fold a batch of submissions into the per-form and per-field aggregate tables
+
+    Runs in the caller's transaction, so aggregates commit together with the responses.
+
+    Args:
+        submissions: (form_id, field_ids, values, timestamp, field_types, option_indexes) tuples
+        bucket_width: Width of the numeric histogram buckets
+    """
+    from app.models import FormDailyCount, FieldValueCount, FieldNumericStat, FieldHistogramBucket
+
+    daily = Counter()
+    options = Counter()
+    histogram = Counter()
+    numeric = {}
+
+    for form_id, field_ids, values, timestamp, field_types, _ in submissions:
+        daily[(form_id, timestamp.date())] += 1
+        for field_id, value, field_type in zip(field_ids, values, field_types):
+            if field_type in OPTION_TYPES:
+                if value:
+                    options[(field_id, value[:MAX_VALUE_LENGTH])] += 1
+            elif field_type in NUMERIC_TYPES:
+                number = _to_number(value)
+                if number is None:
+                    continue
+                stat = numeric.setdefault(field_id, [0, 0.0, number, number])
+                stat[0] += 1
+                stat[1] += number
+                stat[2] = min(stat[2], number)
+                stat[3] = max(stat[3], number)
+                histogram[(field_id, _bucket(number, bucket_width))] += 1
+
+    _increment(FormDailyCount, ('form_id', 'day'),
+               [{'form_id': f, 'day': d, 'count': c} for (f, d), c in daily.items()], ('count',))
+    _increment(FieldValueCount, ('field_id', 'value'),
+               [{'field_id': f, 'value': v, 'count': c} for (f, v), c in options.items()], ('count',))
+    _increment(FieldNumericStat, ('field_id',),
+               [{'field_id': f, 'count': s[0], 'total': s[1], 'minimum': s[2], 'maximum': s[3]}
+                for f, s in numeric.items()],
+               ('count', 'total'), min_columns=('minimum',), max_columns=('maximum',))
+    _increment(FieldHistogramBucket, ('field_id', 'lower'),
+               [{'field_id': f, 'lower': b, 'count': c} for (f, b), c in histogram.items()], ('count',))
+
+
+def form_epochs(form_ids: Iterable[int], lock: str = 'key_share') -> Dict[int, int]:
+    """
+    Read the analytics epoch of forms, locking their rows against a concurrent backfill
+
+    Args:
+        form_ids: Ids of the forms
+        lock: 'key_share' for writers of responses, 'share' for counter flushes, 'update' for backfill;
+            only PostgreSQL takes row locks, SQLite relies on its single write transaction
+
+    Returns:
+        Mapping of form id to epoch for the forms that exist
+    """
+    from app import db
+    from app.models import Form
+
+    query = db.select(Form.id, db.func.coalesce(Form.analytics_epoch, 0)).where(Form.id.in_(list(form_ids)))
+    if lock == 'key_share':
+        query = query.with_for_update(read=True, key_share=True)
+    elif lock == 'share':
+        query = query.with_for_update(read=True)
+    else:
+        query = query.with_for_update()
+    return dict(db.session.execute(query).all())
+
+
+class AggregateBuffer:
+    """
+    Folds committed submissions into the aggregate tables once per flush instead of once per submission
+
+    Used when responses are written synchronously: each submission would otherwise upsert the
+    same FormDailyCount row in its own transaction, serializing concurrent writers on that row.
+    Submissions carry the form's analytics_epoch read in their transaction. backfill bumps the
+    epoch, so submissions it already counted are dropped here rather than counted twice.
+    Counts still buffered when the process dies are lost; analytics-backfill restores them.
+    """
+
+    def __init__(self, app, bucket_width: float = DEFAULT_BUCKET_WIDTH, flush_interval: float = 1.0,
+                 max_pending: int = 10000):
+        """
+        Initialize the buffer; its flush thread starts with start() or the first add
+
+        Args:
+            app: Flask application, used to open an app context in the flush thread
+            bucket_width: Width of the numeric histogram buckets
+            flush_interval: Maximum seconds a submission waits before being counted
+            max_pending: Buffered submissions that trigger an early flush
+        """
+        self.app = app
+        self.bucket_width = bucket_width
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self.flushed = 0
+        self.flushes = 0
+        self.dropped = 0
+        self.failed = 0
+        self._thread = None
+
+    def start(self):
+        """Start the flush thread"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='analytics-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, submissions: Sequence[tuple], epochs: Dict[int, int]):
+        """
+        Queue committed submissions for the next flush
+
+        Args:
+            submissions: Tuples as passed to update_aggregates
+            epochs: Analytics epoch of each submission's form, read in the transaction that wrote it
+        """
+        self.start()
+        with self._lock:
+            for submission in submissions:
+                self._queue(submission, epochs.get(submission[0]))
+            if self._count >= self.max_pending:
+                self._wake.set()
+
+    def _queue(self, submission: tuple, epoch: Optional[int]):
+        if epoch is None:
+            return
+        current = self._pending.get(submission[0])
+        if current is None or epoch > current[0]:
+            # Submissions of an older epoch were counted by the backfill that started the new one
+            if current is not None:
+                self._count -= len(current[1])
+                self.dropped += len(current[1])
+            current = self._pending[submission[0]] = (epoch, [])
+        elif epoch < current[0]:
+            self.dropped += 1
+            return
+        current[1].append(submission)
+        self._count += 1
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """Fold everything buffered into the aggregate tables in one transaction"""
+        from app import db
+        from app.services.database import begin_write
+
+        with self._lock:
+            pending, self._pending, self._count = self._pending, {}, 0
+        if not pending:
+            return
+
+        with self.app.app_context():
+            try:
+                begin_write(db.session)
+                epochs = form_epochs(pending, lock='share')
+                submissions = []
+                dropped = 0
+                for form_id, (epoch, form_submissions) in pending.items():
+                    if epochs.get(form_id) == epoch:
+                        submissions.extend(form_submissions)
+                    else:
+                        dropped += len(form_submissions)
+                update_aggregates(submissions, self.bucket_width)
+                db.session.commit()
+                with self._lock:
+                    self.flushed += len(submissions)
+                    self.flushes += 1
+                    self.dropped += dropped
+            except Exception:
+                db.session.rollback()
+                logger.exception('Failed to update analytics for %d submissions; retrying with the next flush',
+                                 sum(len(form_submissions) for _, form_submissions in pending.values()))
+                with self._lock:
+                    self.failed += 1
+                    for form_id, (epoch, form_submissions) in pending.items():
+                        for submission in form_submissions:
+                            self._queue(submission, epoch)
+            finally:
+                db.session.remove()
+
+    def close(self, timeout: float = 5.0):
+        """Stop the flush thread after a final flush"""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'pending': self._count,
+                'flushed': self.flushed,
+                'flushes': self.flushes,
+                'dropped': self.dropped,
+                'failed': self.failed
+            }
+
+
+def form_analytics(form_id: int) -> Dict[str, any]:
+    """
+    Read the precomputed aggregates of a form
+
+    Args:
+        form_id: Id of the form
+
+    Returns:
+        Dictionary with submissions per day and per-field option counts or numeric statistics
+    """
+    from app import db
+    from app.models import FormField, FormDailyCount, FieldValueCount, FieldNumericStat, FieldHistogramBucket
+
+    fields = db.session.execute(
+        db.select(FormField.id, FormField.label, FormField.field_type)
+        .where(FormField.form_id == form_id, FormField.field_type.in_(OPTION_TYPES + NUMERIC_TYPES))
+        .order_by(FormField.id)
+    ).all()
+    field_ids = [field.id for field in fields]
+
+    option_counts = {}
+    for field_id, value, count in db.session.execute(
+            db.select(FieldValueCount.field_id, FieldValueCount.value, FieldValueCount.count)
+            .where(FieldValueCount.field_id.in_(field_ids))
+            .order_by(FieldValueCount.count.desc())):
+        option_counts.setdefault(field_id, {})[value] = count
+
+    numeric = {stat.field_id: stat for stat in db.session.execute(
+        db.select(FieldNumericStat).where(FieldNumericStat.field_id.in_(field_ids))).scalars()}
+
+    histograms = {}
+    for field_id, lower, count in db.session.execute(
+            db.select(FieldHistogramBucket.field_id, FieldHistogramBucket.lower, FieldHistogramBucket.count)
+            .where(FieldHistogramBucket.field_id.in_(field_ids))
+            .order_by(FieldHistogramBucket.lower)):
+        histograms.setdefault(field_id, []).append({'lower': lower, 'count': count})
+
+    summaries = []
+    for field in fields:
+        summary = {'field_id': field.id, 'label': field.label, 'type': field.field_type}
+        if field.field_type in OPTION_TYPES:
+            summary['option_counts'] = option_counts.get(field.id, {})
+        else:
+            stat = numeric.get(field.id)
+            summary.update({
+                'count': stat.count if stat else 0,
+                'min': stat.minimum if stat else None,
+                'max': stat.maximum if stat else None,
+                'mean': stat.total / stat.count if stat and stat.count else None,
+                'histogram': histograms.get(field.id, [])
+            })
+        summaries.append(summary)
+
+    per_day = db.session.execute(
+        db.select(FormDailyCount.day, FormDailyCount.count)
+        .where(FormDailyCount.form_id == form_id)
+        .order_by(FormDailyCount.day)
+    ).all()
+    return {
+        'submissions_per_day': [{'day': day.isoformat(), 'count': count} for day, count in per_day],
+        'fields': summaries
+    }
+
+
+def backfill(form_id: Optional[int] = None, bucket_width: float = DEFAULT_BUCKET_WIDTH,
+             chunksize: int = 100000) -> Dict[str, int]:
+    """
+    Rebuild the aggregate tables from existing responses with vectorized pandas group-bys
+
+    Responses are read in chunks whose partial aggregates are combined, so memory is bounded.
+    Archived responses are read back from their partition files. The forms are locked for the
+    whole rebuild, so submissions wait for it instead of being lost or counted twice, and their
+    analytics epoch is bumped so AggregateBuffer drops counts this rebuild already includes.
+
+    Args:
+        form_id: Only rebuild this form; all forms when None
+        bucket_width: Width of the numeric histogram buckets
+        chunksize: Rows read from the database per chunk
+
+    Returns:
+        Number of aggregate rows written per table
+    """
+    import numpy as np
+    import pandas as pd
+    from app import db
+    from app.models import (Form, FormField, FieldOption, FormResponse, ResponseAnswer,
+                            FormDailyCount, FieldValueCount, FieldNumericStat, FieldHistogramBucket,
+                            ResponseArchive)
+    from app.services.answer_storage import load_options, unpack
+    from app.services.archive import iter_archived
+    from app.services.database import begin_write
+
+    form_filter = [FormResponse.form_id == form_id] if form_id is not None else []
+    field_query = db.select(FormField.id).where(FormField.field_type.in_(OPTION_TYPES + NUMERIC_TYPES))
+    if form_id is not None:
+        field_query = field_query.where(FormField.form_id == form_id)
+
+    begin_write(db.session)
+    form_ids = [form_id] if form_id is not None else db.session.execute(db.select(Form.id)).scalars().all()
+    form_ids = list(form_epochs(form_ids, lock='update'))
+    db.session.execute(
+        Form.__table__.update().where(Form.id.in_(form_ids))
+        .values(analytics_epoch=db.func.coalesce(Form.analytics_epoch, 0) + 1)
+    )
+
+    db.session.execute(FormDailyCount.__table__.delete().where(FormDailyCount.form_id.in_(form_ids)))
+    for model in (FieldValueCount, FieldNumericStat, FieldHistogramBucket):
+        db.session.execute(model.__table__.delete().where(model.field_id.in_(field_query)))
+
+    connection = db.session.connection()
+
+    daily_parts = []
+    for chunk in pd.read_sql(
+            db.select(FormResponse.form_id, FormResponse.timestamp).where(*form_filter),
+            connection, chunksize=chunksize):
+        chunk['day'] = pd.to_datetime(chunk['timestamp']).dt.date
+        daily_parts.append(chunk.groupby(['form_id', 'day']).size())
+
+    option_parts, numeric_parts, histogram_parts = [], [], []
+
+    def aggregate(chunk):
+        options = chunk[chunk['field_type'].isin(OPTION_TYPES) & chunk['value'].fillna('').ne('')]
+        if not options.empty:
+            values = options['value'].str.slice(0, MAX_VALUE_LENGTH)
+            option_parts.append(options.groupby(['field_id', values]).size())
+
+        numbers = chunk[chunk['field_type'].isin(NUMERIC_TYPES)].copy()
+        numbers['number'] = pd.to_numeric(numbers['value'], errors='coerce')
+        numbers = numbers[np.isfinite(numbers['number'])]
+        if not numbers.empty:
+            numeric_parts.append(numbers.groupby('field_id')['number'].agg(['count', 'sum', 'min', 'max']))
+            numbers['lower'] = np.floor(numbers['number'] / bucket_width) * bucket_width
+            histogram_parts.append(numbers.groupby(['field_id', 'lower']).size())
+
+    # Option answers stored as an index are resolved through FieldOption in SQL
+    answers = (
+        db.select(ResponseAnswer.field_id, FormField.field_type,
+                  db.func.coalesce(ResponseAnswer.value, FieldOption.value).label('value'))
+        .join(FormField, FormField.id == ResponseAnswer.field_id)
+        .outerjoin(FieldOption, (FieldOption.field_id == ResponseAnswer.field_id)
+                   & (FieldOption.position == ResponseAnswer.option_index))
+        .where(ResponseAnswer.field_id.in_(field_query))
+    )
+    for chunk in pd.read_sql(answers, connection, chunksize=chunksize):
+        aggregate(chunk)
+
+    # Answers in packed blobs are decoded in Python, one chunk of responses at a time
+    field_types = dict(db.session.execute(
+        db.select(FormField.id, FormField.field_type).where(FormField.id.in_(field_query))).all())
+    options = load_options(list(field_types))
+    packed = db.select(FormResponse.packed).where(FormResponse.packed.isnot(None), *form_filter)
+    for chunk in pd.read_sql(packed, connection, chunksize=chunksize):
+        decoded = [(field_id, field_types[field_id], value)
+                   for blob in chunk['packed']
+                   for field_id, value in unpack(blob, options).items() if field_id in field_types]
+        if decoded:
+            aggregate(pd.DataFrame(decoded, columns=['field_id', 'field_type', 'value']))
+
+    # Archived responses are read back from their partition files
+    for archived_form_id in db.session.execute(
+            db.select(ResponseArchive.form_id).where(ResponseArchive.form_id.in_(form_ids)).distinct()).scalars():
+        days, decoded = [], []
+        for _, timestamp, values in iter_archived(archived_form_id):
+            days.append(timestamp)
+            decoded.extend((field_id, field_types[field_id], value)
+                           for field_id, value in values.items() if field_id in field_types)
+            if len(days) >= chunksize:
+                daily_parts.append(_archived_days(pd, archived_form_id, days))
+                days = []
+            if len(decoded) >= chunksize:
+                aggregate(pd.DataFrame(decoded, columns=['field_id', 'field_type', 'value']))
+                decoded = []
+        if days:
+            daily_parts.append(_archived_days(pd, archived_form_id, days))
+        if decoded:
+            aggregate(pd.DataFrame(decoded, columns=['field_id', 'field_type', 'value']))
+
+    written = {}
+
+    def combine_counts(parts):
+        return pd.concat(parts).groupby(level=list(range(parts[0].index.nlevels))).sum() if parts else None
+
+    daily = combine_counts(daily_parts)
+    rows = [{'form_id': int(f), 'day': d, 'count': int(c)} for (f, d), c in daily.items()] if daily is not None else []
+    _insert_all(FormDailyCount, rows)
+    written['daily'] = len(rows)
+
+    option_counts = combine_counts(option_parts)
+    rows = [{'field_id': int(f), 'value': v, 'count': int(c)}
+            for (f, v), c in option_counts.items()] if option_counts is not None else []
+    _insert_all(FieldValueCount, rows)
+    written['options'] = len(rows)
+
+    rows = []
+    if numeric_parts:
+        numeric = pd.concat(numeric_parts).groupby(level=0).agg({'count': 'sum', 'sum': 'sum', 'min': 'min', 'max': 'max'})
+        rows = [{'field_id': int(f), 'count': int(r['count']), 'total': float(r['sum']),
+                 'minimum': float(r['min']), 'maximum': float(r['max'])} for f, r in numeric.iterrows()]
+    _insert_all(FieldNumericStat, rows)
+    written['numeric'] = len(rows)
+
+    histogram = combine_counts(histogram_parts)
+    rows = [{'field_id': int(f), 'lower': float(b), 'count': int(c)}
+            for (f, b), c in histogram.items()] if histogram is not None else []
+    _insert_all(FieldHistogramBucket, rows)
+    written['histogram'] = len(rows)
+
+    db.session.commit()
+    return written
+
+
+def _archived_days(pd, form_id, timestamps):
+    chunk = pd.DataFrame({'form_id': form_id, 'day': pd.to_datetime(pd.Series(timestamps)).dt.date})
+    return chunk.groupby(['form_id', 'day']).size()
+
+
+def _insert_all(model, rows):
+    from app import db
+
+    if rows:
+        db.session.execute(model.__table__.insert(), rows)
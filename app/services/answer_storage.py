@@ -0,0 +1,260 @@
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .analytics import OPTION_TYPES
+
+STORAGE_MODES = ('rows', 'compact', 'packed')
+
+# Free-text types that always keep their own ResponseAnswer row
+LONG_TYPES = ('textarea',)
+
+
+def stored_options(options: Optional[str]) -> List[str]:
+    """
+    Read the FormField.options column
+
+    New fields store a JSON list; fields created before that hold comma-separated text,
+    which is split the way the form page used to render it.
+
+    Args:
+        options: Value of the column
+
+    Returns:
+        Option values in display order
+    """
+    if not options:
+        return []
+    if options.startswith('['):
+        try:
+            values = json.loads(options)
+        except ValueError:
+            values = None
+        if isinstance(values, list):
+            return [str(value) for value in values]
+    return [option.strip() for option in options.split(',')]
+
+
+def field_choices(field, options: Optional[Sequence[str]] = None) -> list:
+    """
+    Build the FieldOption rows for a FormField
+
+    Args:
+        field: The FormField
+        options: Parsed option values; read from the options column when None
+
+    Returns:
+        FieldOption rows by position, or an empty list for fields without options
+    """
+    from app.models import FieldOption
+
+    if field.field_type not in OPTION_TYPES:
+        return []
+    if options is None:
+        options = stored_options(field.options)
+    return [FieldOption(position=position, value=value) for position, value in enumerate(options)]
+
+
+def load_options(field_ids: Sequence[int]) -> Dict[int, List[str]]:
+    """
+    Load the option lists of many fields with one query
+
+    Args:
+        field_ids: Ids of the fields
+
+    Returns:
+        Mapping of field id to its option values by position; fields without options are omitted
+    """
+    from app import db
+    from app.models import FieldOption
+
+    options = {}
+    if not field_ids:
+        return options
+    for field_id, position, value in db.session.execute(
+            db.select(FieldOption.field_id, FieldOption.position, FieldOption.value)
+            .where(FieldOption.field_id.in_(list(field_ids)))
+            .order_by(FieldOption.field_id, FieldOption.position)):
+        values = options.setdefault(field_id, [])
+        values.extend([None] * (position - len(values)))
+        values.append(value)
+    return options
+
+
+def option_indexes(field_ids: Sequence[int], field_types: Sequence[str]) -> Tuple[Optional[Dict[str, int]], ...]:
+    """
+    Build the value to option index lookups used when encoding answers
+
+    Returns:
+        One dictionary per field, aligned with field_ids, or None for fields without options
+    """
+    option_ids = [field_id for field_id, field_type in zip(field_ids, field_types) if field_type in OPTION_TYPES]
+    options = load_options(option_ids)
+    indexes = []
+    for field_id in field_ids:
+        values = options.get(field_id)
+        indexes.append({value: index for index, value in reversed(list(enumerate(values)))} if values else None)
+    return tuple(indexes)
+
+
+def encode(field_ids: Sequence[int], values: Sequence[Optional[str]], field_types: Sequence[str],
+           indexes: Optional[Sequence[Optional[Dict[str, int]]]], mode: str = 'rows',
+           max_packed_length: int = 200) -> Tuple[Optional[str], List[Dict[str, any]]]:
+    """
+    Encode one submission for storage
+
+    Args:
+        field_ids: Field ids of the form
+        values: Submitted values, aligned with field_ids
+        field_types: Field types, aligned with field_ids
+        indexes: Option index lookups from option_indexes, aligned with field_ids
+        mode: 'rows' (one text row per answer), 'compact' (option answers stored as an index)
+            or 'packed' (compact, with short answers in one JSON blob on the response)
+        max_packed_length: Longest text answer put in the packed blob
+
+    Returns:
+        The FormResponse.packed value and the ResponseAnswer rows (without response_id)
+    """
+    packed = {}
+    rows = []
+    for position, (field_id, value, field_type) in enumerate(zip(field_ids, values, field_types)):
+        index = None
+        if mode != 'rows' and value is not None and indexes and indexes[position]:
+            index = indexes[position].get(value)
+
+        if mode == 'packed' and index is not None:
+            packed[str(field_id)] = index
+        elif mode == 'packed' and value is None:
+            continue
+        elif mode == 'packed' and field_type not in LONG_TYPES and len(value) <= max_packed_length:
+            packed[str(field_id)] = value
+        elif index is not None:
+            rows.append({'field_id': field_id, 'value': None, 'option_index': index})
+        else:
+            rows.append({'field_id': field_id, 'value': value, 'option_index': None})
+    return (json.dumps(packed, separators=(',', ':')) if packed else None), rows
+
+
+def decode_value(field_id: int, value: Optional[str], option_index: Optional[int],
+                 options: Dict[int, List[str]]) -> Optional[str]:
+    """Return the text of a stored answer, resolving an option index"""
+    if option_index is None:
+        return value
+    choices = options.get(field_id)
+    return choices[option_index] if choices and 0 <= option_index < len(choices) else None
+
+
+def unpack(packed: Optional[str], options: Dict[int, List[str]]) -> Dict[int, Optional[str]]:
+    """
+    Decode a FormResponse.packed blob
+
+    Returns:
+        Mapping of field id to answer text
+    """
+    if not packed:
+        return {}
+    answers = {}
+    for key, stored in json.loads(packed).items():
+        field_id = int(key)
+        answers[field_id] = decode_value(field_id, None, stored, options) if isinstance(stored, int) else stored
+    return answers
+
+
+def ensure_field_options(form_id: Optional[int] = None) -> int:
+    """
+    Create missing FieldOption rows for option fields created before the side table existed
+
+    Returns:
+        Number of fields given options
+    """
+    from app import db
+    from app.models import FieldOption, FormField
+
+    query = (
+        db.select(FormField)
+        .where(FormField.field_type.in_(OPTION_TYPES), FormField.options.isnot(None),
+               ~db.exists().where(FieldOption.field_id == FormField.id))
+    )
+    if form_id is not None:
+        query = query.where(FormField.form_id == form_id)
+    count = 0
+    for field in db.session.execute(query).scalars():
+        field.choices = field_choices(field)
+        count += 1
+    db.session.commit()
+    return count
+
+
+def migrate_storage(mode: str, form_id: Optional[int] = None, batch_size: int = 500,
+                    max_packed_length: int = 200) -> Dict[str, int]:
+    """
+    Re-encode stored responses in another storage mode, one committed batch at a time
+
+    Args:
+        mode: Target storage mode
+        form_id: Only migrate this form; all forms when None
+        batch_size: Responses re-encoded per transaction
+        max_packed_length: Longest text answer put in the packed blob
+
+    Returns:
+        Counts of fields given options, responses migrated and answer rows before and after
+    """
+    from app import db
+    from app.models import FormField, FormResponse, ResponseAnswer
+
+    if mode not in STORAGE_MODES:
+        raise ValueError(f'Unknown storage mode: {mode}')
+
+    counts = {'fields': ensure_field_options(form_id), 'responses': 0, 'rows_before': 0, 'rows_after': 0}
+    form_fields = {}
+    after_id = 0
+    while True:
+        query = db.select(FormResponse.id, FormResponse.form_id, FormResponse.packed).where(FormResponse.id > after_id)
+        if form_id is not None:
+            query = query.where(FormResponse.form_id == form_id)
+        responses = db.session.execute(query.order_by(FormResponse.id).limit(batch_size)).all()
+        if not responses:
+            break
+        after_id = responses[-1].id
+
+        for response in responses:
+            if response.form_id not in form_fields:
+                fields = db.session.execute(
+                    db.select(FormField.id, FormField.field_type)
+                    .where(FormField.form_id == response.form_id).order_by(FormField.id)
+                ).all()
+                field_ids = [field.id for field in fields]
+                field_types = [field.field_type for field in fields]
+                form_fields[response.form_id] = (
+                    field_ids, field_types, load_options(field_ids), option_indexes(field_ids, field_types)
+                )
+
+        response_forms = {response.id: response.form_id for response in responses}
+        response_ids = list(response_forms)
+        stored = {}
+        for response_id, field_id, value, option_index in db.session.execute(
+                db.select(ResponseAnswer.response_id, ResponseAnswer.field_id,
+                          ResponseAnswer.value, ResponseAnswer.option_index)
+                .where(ResponseAnswer.response_id.in_(response_ids))):
+            options = form_fields[response_forms[response_id]][2]
+            stored.setdefault(response_id, {})[field_id] = decode_value(field_id, value, option_index, options)
+            counts['rows_before'] += 1
+
+        answer_rows = []
+        for response in responses:
+            field_ids, field_types, options, indexes = form_fields[response.form_id]
+            answers = unpack(response.packed, options)
+            answers.update(stored.get(response.id, {}))
+            packed, rows = encode(field_ids, [answers.get(field_id) for field_id in field_ids], field_types,
+                                  indexes, mode, max_packed_length)
+            db.session.execute(
+                FormResponse.__table__.update().where(FormResponse.id == response.id).values(packed=packed)
+            )
+            answer_rows.extend(dict(row, response_id=response.id) for row in rows)
+
+        db.session.execute(ResponseAnswer.__table__.delete().where(ResponseAnswer.response_id.in_(response_ids)))
+        if answer_rows:
+            db.session.execute(ResponseAnswer.__table__.insert(), answer_rows)
+        db.session.commit()
+        counts['responses'] += len(responses)
+        counts['rows_after'] += len(answer_rows)
+    return counts
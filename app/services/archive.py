@@ -0,0 +1,334 @@
+import datetime
+import gzip
+import heapq
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app import db
+from app.models import Form, FormField, FormResponse, ResponseAnswer, ResponseArchive
+
+ARCHIVE_FORMATS = ('auto', 'parquet', 'jsonl')
+PARQUET_ROW_GROUP = 10000
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def resolve_format(preferred: str = 'auto') -> str:
+    """
+    Pick the archive file format: Parquet when pyarrow is installed, JSON Lines otherwise
+
+    Raises:
+        ValueError: If Parquet is requested explicitly but pyarrow is missing
+    """
+    from app.services.export import parquet_available
+
+    if preferred == 'jsonl':
+        return 'jsonl'
+    if parquet_available():
+        return 'parquet'
+    if preferred == 'parquet':
+        raise ValueError('Parquet archives require the pyarrow package.')
+    return 'jsonl'
+
+
+def _extension(fmt: str) -> str:
+    if fmt == 'parquet':
+        return 'parquet'
+    return 'jsonl.zst' if _zstandard() else 'jsonl.gz'
+
+
+def month_bounds(month: str) -> Tuple[datetime.datetime, datetime.datetime]:
+    """Return the first instant of a 'YYYY-MM' month and of the following month"""
+    start = datetime.datetime.strptime(month, '%Y-%m')
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def _open_jsonl(path: str, mode: str):
+    if path.endswith('.zst'):
+        zstandard = _zstandard()
+        if zstandard is None:
+            raise RuntimeError(f'{path} needs the zstandard package to be read')
+        return zstandard.open(path, mode, encoding='utf-8')
+    return gzip.open(path, mode, encoding='utf-8', compresslevel=6)
+
+
+def write_partition(path: str, fmt: str, rows: Iterator[Tuple[int, datetime.datetime, Dict[int, str]]],
+                    field_ids: Sequence[int]) -> Dict[str, any]:
+    """
+    Write one partition file from (response id, timestamp, {field id: value}) rows in id order
+
+    Parquet files have a response_id and submitted_at column and one string column per
+    field, named field_<id>; JSON Lines files hold one {"id", "ts", "values"} object per
+    response. Both are compressed (zstd, or gzip for JSON Lines without zstandard).
+
+    Returns:
+        Row count and the first and last response ids and timestamps
+    """
+    summary = {'row_count': 0, 'first_response_id': None, 'last_response_id': None,
+               'first_timestamp': None, 'last_timestamp': None}
+
+    def track(response_id, timestamp):
+        if summary['first_response_id'] is None:
+            summary['first_response_id'], summary['first_timestamp'] = response_id, timestamp
+        summary['last_response_id'], summary['last_timestamp'] = response_id, timestamp
+        summary['row_count'] += 1
+
+    if fmt == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        columns = [f'field_{field_id}' for field_id in field_ids]
+        schema = pa.schema([('response_id', pa.int64()), ('submitted_at', pa.timestamp('us'))]
+                           + [(column, pa.string()) for column in columns])
+        with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+            batch = []
+
+            def flush():
+                arrays = [pa.array(column, type=schema.field(i).type) for i, column in enumerate(zip(*batch))]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+            for response_id, timestamp, values in rows:
+                track(response_id, timestamp)
+                batch.append([response_id, timestamp] + [values.get(field_id) for field_id in field_ids])
+                if len(batch) >= PARQUET_ROW_GROUP:
+                    flush()
+                    batch = []
+            if batch:
+                flush()
+        return summary
+
+    with _open_jsonl(path, 'wt') as f:
+        for response_id, timestamp, values in rows:
+            track(response_id, timestamp)
+            f.write(json.dumps({'id': response_id, 'ts': timestamp.isoformat() if timestamp else None,
+                                'values': {str(k): v for k, v in values.items() if v is not None}}) + '\n')
+    return summary
+
+
+def read_partition(path: str, fmt: str,
+                   after_id: Optional[int] = None) -> Iterator[Tuple[int, datetime.datetime, Dict[int, str]]]:
+    """Stream the (response id, timestamp, {field id: value}) rows of a partition file in id order"""
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        fields = [(name, int(name[len('field_'):])) for name in parquet.schema_arrow.names if name.startswith('field_')]
+        for batch in parquet.iter_batches(batch_size=PARQUET_ROW_GROUP):
+            for record in batch.to_pylist():
+                if after_id is not None and record['response_id'] <= after_id:
+                    continue
+                yield (record['response_id'], record['submitted_at'],
+                       {field_id: record[name] for name, field_id in fields if record[name] is not None})
+        return
+
+    with _open_jsonl(path, 'rt') as f:
+        for line in f:
+            record = json.loads(line)
+            if after_id is not None and record['id'] <= after_id:
+                continue
+            timestamp = datetime.datetime.fromisoformat(record['ts']) if record['ts'] else None
+            yield record['id'], timestamp, {int(k): v for k, v in record['values'].items()}
+
+
+def archive_path(archive: ResponseArchive) -> str:
+    from flask import current_app
+
+    return os.path.join(current_app.config['ARCHIVE_DIR'], archive.path)
+
+
+def form_archives(form_id: int) -> List[ResponseArchive]:
+    """A form's archived partitions, oldest first"""
+    return db.session.execute(
+        db.select(ResponseArchive).where(ResponseArchive.form_id == form_id).order_by(ResponseArchive.first_response_id)
+    ).scalars().all()
+
+
+def iter_archived(form_id: int, after_id: Optional[int] = None,
+                  archives: Optional[Sequence[ResponseArchive]] = None) -> Iterator[tuple]:
+    """
+    Stream a form's archived responses, merged across partitions in response id order
+
+    Args:
+        form_id: Id of the form
+        after_id: Only responses with a larger id
+        archives: The form's partitions, if already loaded
+
+    Yields:
+        (response id, timestamp, {field id: value})
+    """
+    if archives is None:
+        archives = form_archives(form_id)
+    streams = [read_partition(archive_path(archive), archive.format, after_id) for archive in archives
+               if after_id is None or archive.last_response_id > after_id]
+    if len(streams) == 1:
+        return streams[0]
+    return heapq.merge(*streams, key=lambda row: row[0])
+
+
+def iter_archived_rows(form_id: int, field_ids: Sequence[int], after_id: Optional[int] = None,
+                       archives: Optional[Sequence[ResponseArchive]] = None) -> Iterator[tuple]:
+    """Like iter_archived, with the values aligned with field_ids as in the hot read paths"""
+    for response_id, timestamp, values in iter_archived(form_id, after_id, archives):
+        yield response_id, timestamp, [values.get(field_id) for field_id in field_ids]
+
+
+def archived_counts(form_ids: Sequence[int]) -> Dict[int, int]:
+    """Number of archived responses per form; forms without archives are omitted"""
+    if not form_ids:
+        return {}
+    counts = db.session.execute(
+        db.select(ResponseArchive.form_id, db.func.sum(ResponseArchive.row_count))
+        .where(ResponseArchive.form_id.in_(list(form_ids)))
+        .group_by(ResponseArchive.form_id)
+    )
+    return {form_id: int(count) for form_id, count in counts.all()}
+
+
+def _months(first: datetime.datetime, limit: datetime.datetime) -> Iterator[str]:
+    month = first.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while month < limit:
+        yield month.strftime('%Y-%m')
+        month = (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def archive_month(form_id: int, month: str, fmt: str) -> Optional[ResponseArchive]:
+    """
+    Move one month of a form's responses from the hot tables into a partition file
+
+    The file is written under a new name first; the metadata row and the deletion of
+    the hot rows then commit together, and only after that is an earlier partition of
+    the same month (merged into the new file) removed. A failure leaves the database
+    untouched and at worst an unreferenced file.
+
+    Returns:
+        The partition's metadata, or None if the month had no responses
+    """
+    from flask import current_app
+    from app.services.export import iter_response_rows
+
+    start, end = month_bounds(month)
+    field_ids = [field_id for field_id, in db.session.execute(
+        db.select(FormField.id).where(FormField.form_id == form_id).order_by(FormField.id)).all()]
+    hot = ((response_id, timestamp, {f: v for f, v in zip(field_ids, values) if v is not None})
+           for response_id, timestamp, values in iter_response_rows(form_id, field_ids, start=start, end=end,
+                                                                    include_archived=False))
+    existing = db.session.execute(
+        db.select(ResponseArchive).where(ResponseArchive.form_id == form_id, ResponseArchive.month == month)
+    ).scalar_one_or_none()
+    rows = hot
+    if existing is not None:
+        old_fields = set()
+        old_rows = list(read_partition(archive_path(existing), existing.format))
+        for _, _, values in old_rows:
+            old_fields.update(values)
+        field_ids = sorted(set(field_ids) | old_fields)
+        rows = heapq.merge(iter(old_rows), hot, key=lambda row: row[0])
+
+    directory = os.path.join(current_app.config['ARCHIVE_DIR'], f'form-{form_id}')
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+    relative = f'form-{form_id}/{month}.{stamp}.{_extension(fmt)}'
+    path = os.path.join(current_app.config['ARCHIVE_DIR'], relative)
+    try:
+        summary = write_partition(path, fmt, rows, field_ids)
+        if existing is not None and summary['row_count'] == existing.row_count:
+            os.remove(path)
+            return None
+        if not summary['row_count']:
+            os.remove(path)
+            return None
+
+        archived_ids = (db.select(FormResponse.id)
+                        .where(FormResponse.form_id == form_id, FormResponse.timestamp >= start,
+                               FormResponse.timestamp < end))
+        db.session.execute(ResponseAnswer.__table__.delete().where(ResponseAnswer.response_id.in_(archived_ids)))
+        db.session.execute(FormResponse.__table__.delete().where(
+            FormResponse.form_id == form_id, FormResponse.timestamp >= start, FormResponse.timestamp < end))
+        old_path = archive_path(existing) if existing is not None else None
+        archive = existing or ResponseArchive(form_id=form_id, month=month)
+        archive.path = relative
+        archive.format = fmt
+        for key, value in summary.items():
+            setattr(archive, key, value)
+        archive.created_at = datetime.datetime.utcnow()
+        db.session.add(archive)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    if old_path and os.path.exists(old_path):
+        os.remove(old_path)
+    return archive
+
+
+def archive_responses(default_retention_days: int, form_id: Optional[int] = None, preferred_format: str = 'auto',
+                      now: Optional[datetime.datetime] = None, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Archive every whole month of responses older than each form's retention window
+
+    A form's Form.retention_days overrides the default; 0 keeps its responses hot. Only
+    months that ended before the cutoff are archived, so each month becomes one file.
+
+    Args:
+        default_retention_days: Retention of forms without their own setting; 0 disables archival
+        form_id: Only archive this form
+        preferred_format: 'auto', 'parquet' or 'jsonl'
+        now: Reference time, defaults to the current UTC time
+        dry_run: Only report the months that would be archived
+
+    Returns:
+        Numbers of forms, partitions and responses archived
+    """
+    fmt = resolve_format(preferred_format)
+    now = now or datetime.datetime.utcnow()
+    query = db.select(Form.id, Form.retention_days)
+    if form_id is not None:
+        query = query.where(Form.id == form_id)
+
+    counts = {'forms': 0, 'partitions': 0, 'responses': 0}
+    for current_form_id, retention_days in db.session.execute(query).all():
+        retention = default_retention_days if retention_days is None else retention_days
+        if not retention:
+            continue
+        cutoff = now - datetime.timedelta(days=retention)
+        limit = cutoff.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        oldest = db.session.execute(
+            db.select(db.func.min(FormResponse.timestamp))
+            .where(FormResponse.form_id == current_form_id, FormResponse.timestamp < limit)
+        ).scalar()
+        if oldest is None:
+            continue
+
+        counts['forms'] += 1
+        for month in _months(oldest, limit):
+            if dry_run:
+                start, end = month_bounds(month)
+                pending = db.session.execute(
+                    db.select(db.func.count(FormResponse.id))
+                    .where(FormResponse.form_id == current_form_id, FormResponse.timestamp >= start,
+                           FormResponse.timestamp < end)
+                ).scalar()
+                if pending:
+                    counts['partitions'] += 1
+                    counts['responses'] += pending
+                continue
+            before = db.session.execute(
+                db.select(ResponseArchive.row_count)
+                .where(ResponseArchive.form_id == current_form_id, ResponseArchive.month == month)
+            ).scalar() or 0
+            archive = archive_month(current_form_id, month, fmt)
+            if archive is not None:
+                counts['partitions'] += 1
+                counts['responses'] += archive.row_count - before
+    return counts
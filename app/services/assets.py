@@ -0,0 +1,175 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional
+
+BUILD_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# Files smaller than this are not worth a compressed variant (headers dominate)
+MIN_COMPRESS_SIZE = 512
+
+
+def brotli_available() -> bool:
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def hashed_name(path: str, content: bytes, length: int = 12) -> str:
+    """Insert a content hash before the extension: css/style.css -> css/style.3f9a0c1d2b4e.css"""
+    root, ext = os.path.splitext(path)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:length]}{ext}'
+
+
+def _write(path: str, content: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def build_assets(static_folder: str, clean: bool = False) -> Dict[str, any]:
+    """
+    Write content-hashed copies of the static files, with .gz and .br variants, and a manifest
+
+    Output goes to <static_folder>/dist, so the hashed files are served by the static
+    route. Files of earlier builds are kept unless clean is set: pages rendered and
+    cached before a deploy may still reference them.
+
+    Args:
+        static_folder: The app's static folder
+        clean: Remove earlier builds first
+
+    Returns:
+        Counts of files, variants and bytes before and after compression
+    """
+    build_dir = os.path.join(static_folder, BUILD_DIR)
+    if clean and os.path.isdir(build_dir):
+        shutil.rmtree(build_dir)
+    use_brotli = brotli_available()
+    if use_brotli:
+        import brotli
+
+    manifest = {}
+    stats = {'files': 0, 'variants': 0, 'bytes': 0, 'gzip_bytes': 0, 'br_bytes': 0, 'brotli': use_brotli}
+    for directory, subdirs, files in os.walk(static_folder):
+        if os.path.abspath(directory) == os.path.abspath(static_folder):
+            subdirs[:] = [d for d in subdirs if d != BUILD_DIR]
+        for name in sorted(files):
+            source = os.path.join(directory, name)
+            relative = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                content = f.read()
+            target = f'{BUILD_DIR}/{hashed_name(relative, content)}'
+            manifest[relative] = target
+            _write(os.path.join(static_folder, target), content)
+            stats['files'] += 1
+            stats['bytes'] += len(content)
+
+            if len(content) < MIN_COMPRESS_SIZE or not _compressible(relative):
+                continue
+            variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+            if use_brotli:
+                variants['.br'] = brotli.compress(content, quality=11)
+            for suffix, compressed in variants.items():
+                if len(compressed) < len(content):
+                    _write(os.path.join(static_folder, target + suffix), compressed)
+                    stats['variants'] += 1
+                    stats['gzip_bytes' if suffix == '.gz' else 'br_bytes'] += len(compressed)
+
+    _write(os.path.join(build_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return stats
+
+
+def _compressible(path: str) -> bool:
+    mimetype = mimetypes.guess_type(path)[0] or ''
+    return mimetype.startswith('text/') or mimetype in (
+        'application/javascript', 'application/json', 'image/svg+xml', 'application/xml')
+
+
+class AssetManifest:
+    """Maps static filenames to their content-hashed builds and serves them with immutable caching"""
+
+    def __init__(self, static_folder: str, max_age: int = 31536000):
+        """
+        Load the manifest written by build_assets, if there is one
+
+        Args:
+            static_folder: The app's static folder
+            max_age: Cache lifetime in seconds of hashed files
+        """
+        self.static_folder = static_folder
+        self.max_age = max_age
+        self.mapping = {}
+        path = os.path.join(static_folder, BUILD_DIR, MANIFEST_NAME)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.mapping = json.load(f)
+        self._lock = threading.Lock()
+        self.served = {encoding: 0 for encoding, _ in ENCODINGS}
+        self.served['identity'] = 0
+
+    def __bool__(self):
+        return bool(self.mapping)
+
+    def url_defaults(self, endpoint: str, values: Dict[str, any]):
+        """url_defaults callback: point url_for('static', filename=...) at the hashed build"""
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = self.mapping.get(values['filename'], values['filename'])
+
+    def variants(self, filename: str, accepted: List[str]) -> Optional[tuple]:
+        """Return (encoding, path) of the best precompressed variant of a hashed file, if any"""
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted:
+                path = filename + suffix
+                if os.path.isfile(os.path.join(self.static_folder, path)):
+                    return encoding, path
+        return None
+
+    def serve(self, filename: str):
+        """
+        Static view: hashed builds get Cache-Control immutable and a precompressed body when accepted
+
+        Args:
+            filename: Path below the static folder
+
+        Returns:
+            Response for the file
+        """
+        from flask import current_app, request, send_from_directory
+
+        if not filename.startswith(BUILD_DIR + '/'):
+            return current_app.send_static_file(filename)
+
+        accepted = [encoding for encoding, _ in ENCODINGS if request.accept_encodings.quality(encoding) > 0]
+        variant = self.variants(filename, accepted)
+        if variant is None:
+            encoding = 'identity'
+            response = send_from_directory(self.static_folder, filename, max_age=self.max_age)
+        else:
+            encoding, path = variant
+            response = send_from_directory(self.static_folder, path, max_age=self.max_age,
+                                           mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['Content-Encoding'] = encoding
+        with self._lock:
+            self.served[encoding] += 1
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    def stats(self) -> Dict[str, any]:
+        with self._lock:
+            return {'files': len(self.mapping), 'served': dict(self.served)}
+
+
+def register_assets(app, manifest: AssetManifest):
+    """Resolve static URLs through the manifest and serve hashed builds from the static route"""
+    app.url_defaults(manifest.url_defaults)
+    app.view_functions['static'] = manifest.serve
@@ -0,0 +1,79 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Dict, List, Sequence
+
+from app.services.executor import GenerationExecutor, GenerationRejected
+
+BUSY_ERROR = 'The server is busy generating other forms. Please try again in a few seconds.'
+
+
+def generate_batch(executor: GenerationExecutor, service, prompts: Sequence[str], parallelism: int = 4,
+                   timeout: float = 60.0) -> List[Dict[str, any]]:
+    """
+    Generate fields for many prompts concurrently on the shared generation executor
+
+    At most parallelism items are in flight at a time, and each one takes a slot of the
+    executor, so batches count against GENERATION_MAX_PENDING like single generations.
+
+    Args:
+        executor: The app's bounded generation executor
+        service: Object providing generate_form_fields (a GeminiService or a fake)
+        prompts: User prompts, one per form
+        parallelism: Maximum number of prompts generated at the same time
+        timeout: Seconds to wait for the whole batch; unfinished items are reported as timed out
+
+    Returns:
+        One result per prompt, in input order, shaped like generate_form_fields results
+        with an added 'index'; failures of single items do not affect the others
+
+    Raises:
+        GenerationRejected: If the executor has no free slot for the first item
+    """
+    results = [None] * len(prompts)
+    if not prompts:
+        return []
+
+    parallelism = max(1, min(parallelism, executor.max_pending))
+    started = time.monotonic()
+    deadline = started + timeout
+    remaining = list(enumerate(prompts))
+    in_flight = {}
+    while remaining or in_flight:
+        while remaining and len(in_flight) < parallelism:
+            index, prompt = remaining[0]
+            try:
+                in_flight[executor.submit(service.generate_form_fields, prompt)] = index
+            except GenerationRejected:
+                if not in_flight and len(remaining) == len(prompts):
+                    raise
+                if not in_flight:
+                    # The executor is full of other requests' work; the rest of the batch fails fast
+                    for index, _ in remaining:
+                        results[index] = {'success': False, 'error': BUSY_ERROR, 'fields': None}
+                    remaining = []
+                break
+            remaining.pop(0)
+        if not in_flight:
+            break
+
+        done, _ = wait(in_flight, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            index = in_flight.pop(future)
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                results[index] = {'success': False, 'error': f'Server error: {str(e)}', 'fields': None}
+
+    for future in in_flight:
+        future.cancel()
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = {
+                'success': False,
+                'error': f'Request timed out after {time.monotonic() - started:.0f} seconds.',
+                'fields': None
+            }
+        results[index]['index'] = index
+    return results
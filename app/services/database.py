@@ -0,0 +1,107 @@
+from typing import Dict
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+
+def _is_sqlite_memory(url) -> bool:
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(config) -> Dict[str, any]:
+    """
+    Build SQLALCHEMY_ENGINE_OPTIONS for the configured database
+
+    PostgreSQL (and other server databases) get a sized connection pool with pre-ping and
+    recycling, a statement timeout passed as a connection option, or NullPool in PgBouncer
+    mode where PgBouncer does the pooling. SQLite keeps its default pool; its pragmas are
+    applied per connection by register_engine_events.
+
+    Args:
+        config: Flask config mapping
+
+    Returns:
+        Keyword arguments for create_engine
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    backend = url.get_backend_name()
+
+    if backend == 'sqlite':
+        if _is_sqlite_memory(url):
+            return {}
+        return {'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}}
+
+    if config['DB_PGBOUNCER']:
+        # PgBouncer in transaction mode owns the pool and rejects startup options,
+        # so connections are not kept and the timeout is set per transaction instead
+        return {'poolclass': NullPool}
+
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING']
+    }
+    if backend == 'postgresql' and config['DB_STATEMENT_TIMEOUT_MS']:
+        options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"}
+    return options
+
+
+def begin_write(session):
+    """
+    Make sure a SQLite session has a real write transaction open before a SAVEPOINT
+
+    The sqlite3 module only opens a transaction before INSERT, UPDATE or DELETE, so a
+    SAVEPOINT issued first would act as the outer transaction and commit on release, out
+    of the caller's control. BEGIN IMMEDIATE takes the write lock right away and waits
+    for it under the busy timeout. Other databases, and transactions that already wrote,
+    are left alone.
+
+    Args:
+        session: SQLAlchemy session about to call begin_nested
+    """
+    connection = session.connection()
+    if connection.dialect.name != 'sqlite':
+        return
+    if not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def register_engine_events(engine, config):
+    """
+    Apply per-connection settings that cannot be passed to create_engine
+
+    SQLite connections switch to WAL journaling, so readers no longer block the single
+    writer, and get a busy timeout plus the configured synchronous level. In PgBouncer
+    mode every PostgreSQL transaction starts with SET LOCAL statement_timeout.
+
+    Args:
+        engine: SQLAlchemy engine
+        config: Flask config mapping
+    """
+    backend = engine.url.get_backend_name()
+
+    if backend == 'sqlite' and not _is_sqlite_memory(engine.url):
+        pragmas = [
+            f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+            f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+            'PRAGMA temp_store=MEMORY'
+        ]
+        if config['SQLITE_WAL']:
+            pragmas.insert(0, 'PRAGMA journal_mode=WAL')
+
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+    if backend == 'postgresql' and config['DB_PGBOUNCER'] and config['DB_STATEMENT_TIMEOUT_MS']:
+        timeout = int(config['DB_STATEMENT_TIMEOUT_MS'])
+
+        @event.listens_for(engine, 'begin')
+        def set_statement_timeout(connection):
+            connection.exec_driver_sql(f'SET LOCAL statement_timeout = {timeout}')
@@ -0,0 +1,213 @@
+import asyncio
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Iterator, Optional
+
+_STREAM_END = object()
+
+
+class GenerationRejected(Exception):
+    """Raised when the executor already holds its maximum number of pending generations"""
+
+
+class GenerationTimeout(Exception):
+    """Raised when a generation does not finish within its timeout"""
+
+
+class _StreamError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class GenerationExecutor:
+    """Bounded thread pool that runs slow LLM calls off the request thread with per-call timeouts"""
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 16, timeout: float = 30.0, max_streams: int = 4):
+        """
+        Initialize the executor
+
+        Args:
+            max_workers: Number of generations that may run concurrently
+            max_pending: Maximum number of running plus queued generations before new ones are rejected
+            timeout: Default number of seconds a caller waits for a result
+            max_streams: Maximum number of concurrent streams; each one also holds its request thread
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_streams = max_streams
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='generation')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._stream_slots = threading.BoundedSemaphore(max_streams)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Schedule a call on the pool without waiting for it
+
+        Args:
+            fn: Callable to run
+
+        Returns:
+            Future for the call's result
+
+        Raises:
+            GenerationRejected: If max_pending generations are already in flight
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise GenerationRejected('Too many generations in progress')
+
+        with self._lock:
+            self.pending += 1
+        try:
+            # Run in a copy of the caller's context so request-scoped instrumentation follows the call
+            future = self._pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        """
+        Run a call on the pool and wait for its result
+
+        Args:
+            fn: Callable to run
+            timeout: Seconds to wait, defaults to the executor's timeout
+
+        Returns:
+            The call's return value
+
+        Raises:
+            GenerationRejected: If the executor is saturated
+            GenerationTimeout: If the call does not finish in time; queued calls are cancelled
+        """
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise GenerationTimeout('Generation timed out')
+
+    async def run_async(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        """
+        Awaitable variant of run for asyncio callers
+
+        Args:
+            fn: Callable to run
+            timeout: Seconds to wait, defaults to the executor's timeout
+
+        Returns:
+            The call's return value
+        """
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout or self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise GenerationTimeout('Generation timed out')
+
+    def stream(self, fn: Callable[..., Iterator], *args, timeout: Optional[float] = None, **kwargs) -> Iterator:
+        """
+        Run a generator function on the pool and pass its items on to the calling thread
+
+        The stream holds one of max_streams stream slots and one executor slot until it ends.
+        Slots are taken before this returns, so a saturated executor can be answered with a 503.
+
+        Args:
+            fn: Function returning an iterator, run on a pool thread
+            timeout: Seconds the whole stream may take, defaults to the executor's timeout
+
+        Returns:
+            Iterator over fn's items; it raises GenerationTimeout when the deadline passes and
+            re-raises errors raised by fn
+
+        Raises:
+            GenerationRejected: If max_streams streams or max_pending generations are already in flight
+        """
+        if not self._stream_slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise GenerationRejected('Too many streams in progress')
+
+        items = queue.Queue()
+        stopped = threading.Event()
+
+        def produce():
+            iterator = fn(*args, **kwargs)
+            try:
+                for item in iterator:
+                    if stopped.is_set():
+                        return
+                    items.put(item)
+            except BaseException as e:
+                items.put(_StreamError(e))
+            finally:
+                close = getattr(iterator, 'close', None)
+                if close is not None:
+                    close()
+                items.put(_STREAM_END)
+
+        try:
+            future = self.submit(produce)
+        except BaseException:
+            self._stream_slots.release()
+            raise
+        future.add_done_callback(lambda _: self._stream_slots.release())
+        return self._consume(future, items, stopped, time.monotonic() + (timeout or self.timeout))
+
+    def _consume(self, future: Future, items: queue.Queue, stopped: threading.Event, deadline: float) -> Iterator:
+        try:
+            while True:
+                try:
+                    item = items.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    with self._lock:
+                        self.timed_out += 1
+                    raise GenerationTimeout('Generation timed out')
+                if item is _STREAM_END:
+                    return
+                if isinstance(item, _StreamError):
+                    raise item.error
+                yield item
+        finally:
+            # The producer stops at its next item; a queued stream never starts
+            stopped.set()
+            future.cancel()
+
+    def _release(self, future: Optional[Future]):
+        with self._lock:
+            self.pending -= 1
+            if future is not None and not future.cancelled():
+                self.completed += 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        """Return executor counters for the health endpoint"""
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'max_streams': self.max_streams,
+                'pending': self.pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,223 @@
+import csv
+import datetime
+import heapq
+import io
+import json
+import re
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from app import db
+from app.models import FormField, FormResponse, ResponseAnswer
+from app.services.answer_storage import decode_value, load_options, unpack
+from app.services.archive import form_archives, iter_archived_rows
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+# Leading characters that make spreadsheet applications evaluate a CSV cell as a formula
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+# Plain numbers such as -5 or +1.5e3 are evaluated to themselves and are left as they are
+_NUMBER = re.compile(r'^[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?$')
+
+
+def iter_response_rows(form_id: int, field_ids: Sequence[int], batch_size: int = 1000,
+                       start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None,
+                       include_archived: bool = True) -> Iterator[Tuple[int, any, List[Optional[str]]]]:
+    """
+    Stream a form's responses, pivoted by field, with a server-side cursor
+
+    Args:
+        form_id: Id of the form
+        field_ids: Field ids in column order
+        batch_size: Rows fetched from the cursor at a time
+        start: Only responses submitted at or after this time (hot rows only)
+        end: Only responses submitted before this time (hot rows only)
+        include_archived: Merge in the form's archived responses
+
+    Yields:
+        (response id, timestamp, values aligned with field_ids) in response id order
+    """
+    rows = _iter_hot_rows(form_id, field_ids, batch_size, start, end)
+    archives = form_archives(form_id) if include_archived else []
+    if not archives:
+        return rows
+    return heapq.merge(iter_archived_rows(form_id, field_ids, archives=archives), rows, key=lambda row: row[0])
+
+
+def _iter_hot_rows(form_id: int, field_ids: Sequence[int], batch_size: int, start: Optional[datetime.datetime],
+                   end: Optional[datetime.datetime]) -> Iterator[Tuple[int, any, List[Optional[str]]]]:
+    positions = {field_id: index for index, field_id in enumerate(field_ids)}
+    options = load_options(field_ids)
+    query = (
+        db.select(FormResponse.id, FormResponse.timestamp, FormResponse.packed,
+                  ResponseAnswer.field_id, ResponseAnswer.value, ResponseAnswer.option_index)
+        .outerjoin(ResponseAnswer, ResponseAnswer.response_id == FormResponse.id)
+        .where(FormResponse.form_id == form_id)
+        .order_by(FormResponse.id)
+        .execution_options(yield_per=batch_size)
+    )
+    if start is not None:
+        query = query.where(FormResponse.timestamp >= start)
+    if end is not None:
+        query = query.where(FormResponse.timestamp < end)
+
+    current_id = None
+    timestamp = None
+    values = None
+    for response_id, response_timestamp, packed, field_id, value, option_index in db.session.execute(query):
+        if response_id != current_id:
+            if current_id is not None:
+                yield current_id, timestamp, values
+            current_id = response_id
+            timestamp = response_timestamp
+            values = [None] * len(field_ids)
+            for packed_field_id, packed_value in unpack(packed, options).items():
+                if packed_field_id in positions:
+                    values[positions[packed_field_id]] = packed_value
+        position = positions.get(field_id)
+        if position is not None:
+            values[position] = decode_value(field_id, value, option_index, options)
+    if current_id is not None:
+        yield current_id, timestamp, values
+
+
+def unique_labels(fields: Sequence[FormField]) -> List[str]:
+    """Return the field labels, suffixing duplicates so they can be used as column names"""
+    seen = {}
+    labels = []
+    for field in fields:
+        label = field.label or f'field_{field.id}'
+        seen[label] = seen.get(label, 0) + 1
+        labels.append(label if seen[label] == 1 else f'{label} ({seen[label]})')
+    return labels
+
+
+def _isoformat(timestamp) -> Optional[str]:
+    return timestamp.isoformat() if timestamp is not None else None
+
+
+def _csv_cell(value: Optional[str]) -> str:
+    """Neutralize text a spreadsheet would run as a formula (CSV injection) by prefixing a quote"""
+    if value is None:
+        return ''
+    if value.startswith(_FORMULA_PREFIXES) and not _NUMBER.match(value):
+        return "'" + value
+    return value
+
+
+def csv_chunks(fields: Sequence[FormField], rows: Iterator[tuple], rows_per_chunk: int = 500) -> Iterator[str]:
+    """
+    Encode rows as CSV, yielding the header straight away and then one chunk per rows_per_chunk rows
+
+    Labels and answers are user input, so cells starting like a formula are prefixed with a quote.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['response_id', 'submitted_at'] + [_csv_cell(label) for label in unique_labels(fields)])
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    for count, (response_id, timestamp, values) in enumerate(rows, 1):
+        writer.writerow([response_id, _isoformat(timestamp)] + [_csv_cell(v) for v in values])
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def jsonl_chunks(fields: Sequence[FormField], rows: Iterator[tuple], rows_per_chunk: int = 500) -> Iterator[str]:
+    """Encode rows as JSON Lines objects keyed by field label"""
+    labels = unique_labels(fields)
+    lines = []
+    for response_id, timestamp, values in rows:
+        record = {'response_id': response_id, 'submitted_at': _isoformat(timestamp)}
+        record['answers'] = dict(zip(labels, values))
+        lines.append(json.dumps(record))
+        if len(lines) >= rows_per_chunk:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that collects bytes so they can be yielded as they are produced"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_chunks(fields: Sequence[FormField], rows: Iterator[tuple], rows_per_group: int = 10000) -> Iterator[bytes]:
+    """
+    Encode rows as Parquet, one row group per rows_per_group rows
+
+    Requires the optional pyarrow package.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [('response_id', pa.int64()), ('submitted_at', pa.timestamp('us'))]
+        + [(label, pa.string()) for label in unique_labels(fields)]
+    )
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+
+    def write_group(batch):
+        arrays = [pa.array(column, type=schema.field(i).type) for i, column in enumerate(zip(*batch))]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+    batch = []
+    for response_id, timestamp, values in rows:
+        batch.append([response_id, timestamp] + list(values))
+        if len(batch) >= rows_per_group:
+            write_group(batch)
+            batch = []
+            yield sink.drain()
+    if batch:
+        write_group(batch)
+    writer.close()
+    yield sink.drain()
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def export_chunks(fmt: str, fields: Sequence[FormField], rows: Iterator[tuple]) -> Iterator:
+    """Dispatch to the encoder for an export format"""
+    if fmt == 'csv':
+        return csv_chunks(fields, rows)
+    if fmt == 'jsonl':
+        return jsonl_chunks(fields, rows)
+    if fmt == 'parquet':
+        return parquet_chunks(fields, rows)
+    raise ValueError(f'Unsupported export format: {fmt}')
@@ -0,0 +1,62 @@
+import random
+import threading
+import time
+from typing import Optional, Sequence
+
+DEFAULT_RESPONSE = """1. Full Name, Enter your complete name, text, required min:2 max:50
+2. Email Address, Your contact email, email, required
+3. Phone Number, Your contact number, tel, optional
+4. Country, Select your country, select, required, [USA, Canada, UK, India, Other]
+5. Comments, Anything else we should know, textarea, optional max:500"""
+
+DEFAULT_ERRORS = (
+    '503 The model is overloaded. Please try again later.',
+    '429 Resource has been exhausted (e.g. check quota).'
+)
+
+
+class FakeResponse:
+    """Minimal stand-in for a google.generativeai response"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Deterministic local replacement for genai.GenerativeModel with injectable latency and errors"""
+
+    def __init__(self, response_text: str = DEFAULT_RESPONSE, latency: float = 0.0, error_rate: float = 0.0,
+                 errors: Sequence[str] = DEFAULT_ERRORS, seed: Optional[int] = 0, chunk_size: int = 40):
+        """
+        Initialize the fake model
+
+        Args:
+            response_text: Text returned for every prompt
+            latency: Seconds each call takes
+            error_rate: Probability (0-1) that a call raises one of errors
+            errors: Error messages to raise, picked at random
+            seed: Seed for the random generator, so runs are reproducible
+            chunk_size: Characters per chunk when streaming
+        """
+        self.response_text = response_text
+        self.latency = latency
+        self.error_rate = error_rate
+        self.errors = errors
+        self.chunk_size = chunk_size
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        with self._lock:
+            self.calls += 1
+            fail = self._random.random() < self.error_rate
+            error = self._random.choice(self.errors) if fail else None
+        if self.latency:
+            time.sleep(self.latency)
+        if error is not None:
+            raise Exception(error)
+        if stream:
+            text = self.response_text
+            return [FakeResponse(text[i:i + self.chunk_size]) for i in range(0, len(text), self.chunk_size)]
+        return FakeResponse(self.response_text)
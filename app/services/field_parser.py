@@ -0,0 +1,211 @@
+import json
+import re
+from typing import Dict, List, Optional
+
+FIELD_KEYS = ('label', 'description', 'type', 'validation', 'options')
+
+# JSON schema for the structured-output mode, in the OpenAPI subset accepted as a response schema
+FIELDS_SCHEMA = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'properties': {
+            'label': {'type': 'string'},
+            'description': {'type': 'string'},
+            'type': {'type': 'string'},
+            'validation': {'type': 'string'},
+            'options': {'type': 'array', 'items': {'type': 'string'}}
+        },
+        'required': ['label', 'type']
+    }
+}
+
+_QUOTES = {'"': '"', '“': '”'}
+_NUMBERING = re.compile(r'^(\d+)\s*[.)]\s*(.*)$')
+_CODE_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$', re.IGNORECASE)
+
+
+def split_top_level(text: str, separator: str = ',') -> List[str]:
+    """
+    Split text on a separator in a single pass, ignoring separators inside [brackets] or "quotes"
+
+    Quotes are removed from the output, except inside brackets where they are kept so the
+    bracketed list can be split again. If a quote is never closed the text is split again
+    without quote handling, so a stray quote character cannot swallow the rest of the line.
+
+    Args:
+        text: Text to split
+        separator: Single separator character
+
+    Returns:
+        Stripped parts
+    """
+    parts = _split(text, separator, honour_quotes=True)
+    return parts if parts is not None else _split(text, separator, honour_quotes=False)
+
+
+def _split(text: str, separator: str, honour_quotes: bool) -> Optional[List[str]]:
+    parts = []
+    current = []
+    depth = 0
+    closing_quote = None
+    for char in text:
+        if closing_quote is not None:
+            if char == closing_quote:
+                closing_quote = None
+                if depth:
+                    current.append(char)
+            else:
+                current.append(char)
+            continue
+        if honour_quotes and char in _QUOTES:
+            closing_quote = _QUOTES[char]
+            if depth:
+                current.append(char)
+            continue
+        if char == '[':
+            depth += 1
+        elif char == ']' and depth:
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(''.join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    if closing_quote is not None:
+        return None
+    parts.append(''.join(current).strip())
+    return parts
+
+
+def parse_options(text: str) -> List[str]:
+    """
+    Parse an editor option list ("Yes, \"No, never\"") into option values
+
+    Args:
+        text: Options separated by commas, optionally wrapped in [brackets]; quoted options may contain commas
+
+    Returns:
+        Non-empty option values
+    """
+    text = (text or '').strip()
+    if text.startswith('[') and text.endswith(']'):
+        text = text[1:-1]
+    return [option for option in split_top_level(text) if option]
+
+
+def format_options(options: List[str]) -> str:
+    """
+    Join option values into editor text that parse_options reads back unchanged
+
+    Args:
+        options: Option values
+
+    Returns:
+        Comma-separated options, with options containing a separator, quote or bracket quoted
+    """
+    formatted = []
+    for option in options:
+        if any(char in option for char in ',[]"“”'):
+            option = f'“{option}”' if '"' in option else f'"{option}"'
+        formatted.append(option)
+    return ', '.join(formatted)
+
+
+def parse_field_line(line: str) -> Optional[Dict[str, any]]:
+    """
+    Parse one numbered line ("1. label, description, type, validation, [options]") into a field
+
+    Args:
+        line: One line of the model response
+
+    Returns:
+        Field dictionary, or None if the line is not a field
+    """
+    match = _NUMBERING.match(line.strip())
+    if not match:
+        return None
+
+    parts = split_top_level(match.group(2))
+    if len(parts) < 3:
+        return None
+
+    options = []
+    validation = []
+    for part in parts[3:]:
+        if part.startswith('[') and part.endswith(']'):
+            options = [option for option in split_top_level(part[1:-1]) if option]
+        elif part:
+            validation.append(part)
+
+    return {
+        'label': parts[0].strip('*').strip(),
+        'description': parts[1],
+        'type': parts[2].strip('*').strip(),
+        'validation': ', '.join(validation),
+        'options': options
+    }
+
+
+def parse_structured(response_text: str) -> Optional[List[Dict[str, any]]]:
+    """
+    Parse a structured-output (JSON array) response into fields
+
+    Args:
+        response_text: Raw model response, optionally wrapped in a ```json code fence
+
+    Returns:
+        List of fields, or None if the text is not a JSON array of field objects
+    """
+    text = _CODE_FENCE.sub('', response_text.strip())
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if isinstance(data, dict):
+        data = data.get('fields')
+    if not isinstance(data, list):
+        return None
+
+    fields = []
+    for item in data:
+        if not isinstance(item, dict) or not item.get('label') or not item.get('type'):
+            continue
+        options = item.get('options') or []
+        if isinstance(options, str):
+            options = split_top_level(options.strip('[]'))
+        fields.append({
+            'label': str(item['label']).strip(),
+            'description': str(item.get('description') or '').strip(),
+            'type': str(item['type']).strip(),
+            'validation': str(item.get('validation') or '').strip(),
+            'options': [str(option).strip() for option in options if str(option).strip()]
+        })
+    return fields
+
+
+def parse_response(response_text: str) -> List[Dict[str, any]]:
+    """
+    Parse a model response in either output format
+
+    JSON responses go through parse_structured; anything else, or JSON that does not
+    describe fields, falls back to the numbered-line tokenizer.
+
+    Args:
+        response_text: Raw model response
+
+    Returns:
+        List of fields
+    """
+    stripped = response_text.strip()
+    if stripped.startswith(('[', '{', '```')):
+        fields = parse_structured(stripped)
+        if fields:
+            return fields
+
+    fields = []
+    for line in stripped.split('\n'):
+        field = parse_field_line(line)
+        if field is not None:
+            fields.append(field)
+    return fields
@@ -0,0 +1,267 @@
+import datetime
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Dict, List, Optional
+
+CachedForm = namedtuple('CachedForm', ['html', 'etag', 'last_modified'])
+FormVersion = namedtuple('FormVersion', ['form_id', 'version', 'updated_at'])
+
+
+def _deploy_files(app) -> List[str]:
+    """Paths of the files besides the form that shape a rendered page: the templates and the static asset manifest"""
+    from app.services.assets import BUILD_DIR, MANIFEST_NAME
+
+    template_folder = os.path.join(app.root_path, app.template_folder)
+    paths = [os.path.join(app.static_folder, BUILD_DIR, MANIFEST_NAME)]
+    for directory, _, files in os.walk(template_folder):
+        paths.extend(os.path.join(directory, name) for name in files)
+    return sorted(paths)
+
+
+def deploy_fingerprint(app) -> str:
+    """
+    Hash everything besides the form that shapes a rendered page: the templates and the static asset manifest
+
+    A deploy that changes a template or the hashed asset names changes the fingerprint, so
+    pages cached (and ETags handed out) by the previous deploy are no longer used.
+
+    Args:
+        app: Flask application
+
+    Returns:
+        Short hex digest
+    """
+    digest = hashlib.sha1(f"assets={app.config.get('ASSETS_ENABLED')}".encode('utf-8'))
+    for path in _deploy_files(app):
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            continue
+        digest.update(os.path.relpath(path, app.root_path).encode('utf-8'))
+        digest.update(content)
+    return digest.hexdigest()[:12]
+
+
+def deploy_time(app) -> Optional[datetime.datetime]:
+    """
+    Return when the files hashed by deploy_fingerprint last changed, as a naive UTC datetime
+
+    Pages are never older than this, so clients revalidating by date alone refetch them after a deploy.
+
+    Args:
+        app: Flask application
+
+    Returns:
+        Latest modification time, or None if none of the files exist
+    """
+    mtimes = []
+    for path in _deploy_files(app):
+        try:
+            mtimes.append(os.path.getmtime(path))
+        except OSError:
+            continue
+    if not mtimes:
+        return None
+    return datetime.datetime.utcfromtimestamp(int(max(mtimes)))
+
+
+class RenderedFormCache:
+    """Caches the rendered public page of each form, keyed by slug, form version and deploy fingerprint"""
+
+    def __init__(self, max_entries: int = 512, disk_dir: Optional[str] = None, version_ttl: float = 5.0,
+                 fingerprint: str = '', deployed_at: Optional[datetime.datetime] = None):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Maximum number of rendered pages kept in process memory
+            disk_dir: Optional directory holding a second tier of rendered pages, shared by workers
+            version_ttl: Seconds a slug's version is trusted before it is looked up again;
+                edits made in this process invalidate it immediately
+            fingerprint: Deploy fingerprint (see deploy_fingerprint) mixed into ETags and disk file names
+            deployed_at: Deploy time (see deploy_time); no page is reported as modified before it
+        """
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.version_ttl = version_ttl
+        self.fingerprint = fingerprint
+        self.deployed_at = deployed_at
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._remove_other_deploys()
+        self._pages = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def etag(self, slug: str, version: int) -> str:
+        return hashlib.sha1(f'{slug}:{version}:{self.fingerprint}'.encode('utf-8')).hexdigest()[:16]
+
+    def last_modified(self, version: FormVersion) -> datetime.datetime:
+        """Last-Modified of a form's page: the later of the form's last change and the deploy"""
+        last_modified = version.updated_at or datetime.datetime.utcnow()
+        if self.deployed_at is not None:
+            last_modified = max(last_modified, self.deployed_at)
+        return last_modified.replace(microsecond=0)
+
+    def _remove_other_deploys(self):
+        """Delete pages rendered with another fingerprint; they can never be served again"""
+        suffix = f'-{self.fingerprint}.html'
+        for name in os.listdir(self.disk_dir):
+            if name.endswith('.html') and not name.endswith(suffix):
+                try:
+                    os.remove(os.path.join(self.disk_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    def version(self, slug: str) -> Optional[FormVersion]:
+        """
+        Return the current version of a form, querying only its version columns on a miss
+
+        Args:
+            slug: Public URL slug of the form
+
+        Returns:
+            Form id, version and last modification time, or None if no such form exists
+        """
+        from app import db
+        from app.models import Form
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._versions.get(slug)
+            if entry is not None and entry[0] >= now:
+                return entry[1]
+
+        row = db.session.execute(
+            db.select(Form.id, Form.version, Form.updated_at, Form.timestamp).where(Form.url_slug == slug)
+        ).first()
+        if row is None:
+            return None
+        value = FormVersion(row.id, row.version or 1, row.updated_at or row.timestamp)
+        with self._lock:
+            self._versions[slug] = (now + self.version_ttl, value)
+        return value
+
+    def _disk_path(self, slug: str, version: int) -> str:
+        return os.path.join(self.disk_dir, f'{slug}-{version}-{self.fingerprint}.html')
+
+    def get(self, slug: str, version: FormVersion) -> Optional[CachedForm]:
+        key = (slug, version.version)
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+                self.hits += 1
+                return page
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(slug, version.version), encoding='utf-8') as f:
+                    html = f.read()
+            except FileNotFoundError:
+                pass
+            else:
+                page = self._store(slug, version, html)
+                with self._lock:
+                    self.disk_hits += 1
+                return page
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, slug: str, version: FormVersion, html: str) -> CachedForm:
+        """Store a freshly rendered page in memory and, if configured, on disk"""
+        if self.disk_dir:
+            path = self._disk_path(slug, version.version)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(html)
+            os.replace(tmp_path, path)
+        return self._store(slug, version, html)
+
+    def _store(self, slug: str, version: FormVersion, html: str) -> CachedForm:
+        page = CachedForm(html, self.etag(slug, version.version), self.last_modified(version))
+        with self._lock:
+            self._pages[(slug, version.version)] = page
+            self._pages.move_to_end((slug, version.version))
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+        return page
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def invalidate(self, slug: str):
+        """Forget every cached version of a form"""
+        with self._lock:
+            self._versions.pop(slug, None)
+            for key in [key for key in self._pages if key[0] == slug]:
+                del self._pages[key]
+        if self.disk_dir:
+            for name in os.listdir(self.disk_dir):
+                if name.startswith(f'{slug}-'):
+                    try:
+                        os.remove(os.path.join(self.disk_dir, name))
+                    except FileNotFoundError:
+                        pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'size': len(self._pages)
+            }
+
+
+def register_versioning(cache: Optional[RenderedFormCache] = None):
+    """
+    Bump Form.version whenever a form or one of its fields changes, and drop cached pages
+
+    Args:
+        cache: Cache to invalidate after the change is committed in this process
+    """
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    from app.models import Form, FormField
+
+    @event.listens_for(Session, 'before_flush')
+    def bump_versions(session, flush_context, instances):
+        changed = set()
+        for obj in list(session.dirty) + list(session.deleted):
+            if isinstance(obj, Form) and (obj in session.deleted or session.is_modified(obj)):
+                changed.add(obj)
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, FormField):
+                form = obj.form if obj.form is not None else session.get(Form, obj.form_id)
+                if form is not None and form not in session.new:
+                    changed.add(form)
+
+        for form in changed:
+            if form not in session.deleted:
+                form.version = (form.version or 1) + 1
+                form.updated_at = datetime.datetime.utcnow()
+            if cache is not None:
+                session.info.setdefault('changed_form_slugs', set()).add(form.url_slug)
+
+    if cache is not None:
+        @event.listens_for(Session, 'after_commit')
+        def invalidate_pages(session):
+            for slug in session.info.pop('changed_form_slugs', ()):
+                cache.invalidate(slug)
+
+        @event.listens_for(Session, 'after_rollback')
+        def discard_changes(session):
+            session.info.pop('changed_form_slugs', None)
@@ -1,139 +1,453 @@
-import google.generativeai as genai
-from typing import Optional, Dict, List
+import re
+import threading
+from typing import Optional, Dict, List, Iterator, Tuple, Callable
+from .response_cache import ResponseCache
+from .single_flight import SingleFlight
+from .resilience import ResilientCaller, classify_error
+from .template_index import TemplateIndex
+from .instrumentation import span
+from .prompting import BuiltPrompt, PromptBuilder, TokenUsage, UNCAPPED_THINKING_MIN_OUTPUT_TOKENS, is_thinking_model
+from . import field_parser
 
 
 class GeminiService:
     """Service class to handle Gemini API interactions"""
+
+    DEFAULT_MODEL = "models/gemini-2.5-flash"
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, model_name: str = DEFAULT_MODEL, cache: Optional[ResponseCache] = None,
+                 single_flight: Optional[SingleFlight] = None, resilience: Optional[ResilientCaller] = None,
+                 structured_output: bool = False, templates: Optional[TemplateIndex] = None,
+                 template_refresh: bool = False, max_input_tokens: int = 1000, lazy: bool = False,
+                 thinking_budget: int = 1024):
         """
         Initialize the Gemini service with API key
         
         Args:
             api_key: Google Gemini API key
+            model_name: Name of the Gemini model to use
+            cache: Optional response cache consulted before calling the model
+            single_flight: Optional coalescer sharing one call between concurrent identical prompts
+            resilience: Optional wrapper adding rate limiting, retries and a circuit breaker to model calls
+            structured_output: Ask for a JSON array of fields instead of a numbered list
+            templates: Optional index of finalized forms reused for similar prompts instead of calling the model
+            template_refresh: After a template match, still call the model in the background to fill the cache
+            max_input_tokens: Token budget for the user's prompt; longer prompts are truncated
+            lazy: Import and configure the Gemini client on first use instead of now
+            thinking_budget: Thinking tokens allowed to thinking models, on top of the answer's output limit
         """
         self.api_key = api_key
-        self.model = None
-        self._configure()
+        self.model_name = model_name
+        self.cache = cache
+        self.single_flight = single_flight
+        self.resilience = resilience
+        self.structured_output = structured_output
+        self.templates = templates
+        self.template_refresh = template_refresh
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        self.prompts = PromptBuilder(structured=structured_output, max_input_tokens=max_input_tokens)
+        # Streaming parses the numbered list line by line, whatever the configured output mode
+        self.stream_prompts = self.prompts if not structured_output else PromptBuilder(
+            structured=False, max_input_tokens=max_input_tokens, use_system_instruction=False)
+        self.usage = TokenUsage()
+        self.thinking_budget = thinking_budget if is_thinking_model(model_name) else 0
+        self._model = None
+        self._streaming_model = None
+        self._model_lock = threading.Lock()
+        if not lazy:
+            self._configure()
     
     def _configure(self):
         """Configure the Gemini API with the provided key"""
+        # google.generativeai pulls in grpc and protobuf; importing it here keeps it off the boot path
+        import google.generativeai as genai
+
         genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel("models/gemini-2.5-flash")
+        model = self._new_model(genai, self.prompts.system_instruction)
+        # Streams ask for the numbered list inline, so they cannot share a model carrying the
+        # JSON output system instruction
+        if self.stream_prompts.system_instruction == self.prompts.system_instruction:
+            self._streaming_model = model
+        else:
+            self._streaming_model = self._new_model(genai, self.stream_prompts.system_instruction)
+        self._model = model
+
+    def _new_model(self, genai, system_instruction: Optional[str]):
+        if system_instruction is not None:
+            return genai.GenerativeModel(self.model_name, system_instruction=system_instruction)
+        return genai.GenerativeModel(self.model_name)
+
+    @property
+    def model(self):
+        """The Gemini model, configured on first access in lazy mode"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._configure()
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+        self._streaming_model = model
+
+    @property
+    def streaming_model(self):
+        """The model used by stream_form_fields, configured together with model"""
+        self.model
+        return self._streaming_model
+
+    @property
+    def initialized(self) -> bool:
+        return self._model is not None
+
+    def prewarm(self, delay: float = 0.0) -> threading.Thread:
+        """
+        Configure the client on a background thread, so the first generation does not pay for it
+
+        Args:
+            delay: Seconds to wait first, leaving the CPU to requests served right after boot
+
+        Returns:
+            The started daemon thread
+        """
+        def warm():
+            if delay:
+                threading.Event().wait(delay)
+            try:
+                self.model
+            except Exception:
+                pass  # the first real call configures again and reports the error
+
+        thread = threading.Thread(target=warm, name='gemini-prewarm', daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def clean_prompt(user_prompt: str) -> str:
+        """
+        Strip each line of the prompt, collapse runs of spaces and drop blank lines
+        
+        Args:
+            user_prompt: User's input prompt
+            
+        Returns:
+            Cleaned prompt as it is embedded by PromptBuilder.build
+        """
+        lines = (re.sub(r'[ \t]+', ' ', line).strip() for line in user_prompt.splitlines())
+        return '\n'.join(line for line in lines if line)
+
+    @classmethod
+    def normalize_prompt(cls, user_prompt: str) -> str:
+        """
+        Normalize a user prompt so equivalent requests share a cache key
+        
+        Args:
+            user_prompt: User's input prompt
+            
+        Returns:
+            Cleaned, case-folded prompt
+        """
+        return cls.clean_prompt(user_prompt).casefold()
+
+    @staticmethod
+    def supports_response_schema() -> bool:
+        """Whether the installed client accepts response_mime_type/response_schema in GenerationConfig"""
+        import google.generativeai as genai
+
+        fields = getattr(genai.types.GenerationConfig, '__annotations__', {})
+        return 'response_schema' in fields and 'response_mime_type' in fields
+
+    @staticmethod
+    def supports_thinking_budget() -> bool:
+        """Whether the installed client accepts thinking_config in GenerationConfig"""
+        import google.generativeai as genai
+
+        return 'thinking_config' in getattr(genai.types.GenerationConfig, '__annotations__', {})
+
+    def _generation_config(self, max_output_tokens: int, structured: bool) -> Dict[str, any]:
+        config = {'max_output_tokens': max_output_tokens}
+        if self.thinking_budget:
+            # Thinking tokens count against max_output_tokens; without room for them the answer is cut off
+            if self.supports_thinking_budget():
+                config['thinking_config'] = {'thinking_budget': self.thinking_budget}
+                config['max_output_tokens'] += self.thinking_budget
+            else:
+                config['max_output_tokens'] = max(max_output_tokens + self.thinking_budget,
+                                                  UNCAPPED_THINKING_MIN_OUTPUT_TOKENS)
+        if structured and self.supports_response_schema():
+            config.update({'response_mime_type': 'application/json', 'response_schema': field_parser.FIELDS_SCHEMA})
+        return config
+
+    def _call_model(self, full_prompt: str, **kwargs):
+        """Send a prompt to the model, through the resilience wrapper when configured"""
+        with span('gemini.call'):
+            if self.resilience is None:
+                return self.model.generate_content(full_prompt, **kwargs)
+            return self.resilience.call(lambda: self.model.generate_content(full_prompt, **kwargs))
+
+    def _stream_model(self, full_prompt: str, **kwargs) -> Iterator:
+        """Stream a response; the span and the resilience wrapper cover reading every chunk, not just the request"""
+        with span('gemini.call'):
+            if self.resilience is None:
+                yield from self.streaming_model.generate_content(full_prompt, stream=True, **kwargs)
+            else:
+                yield from self.resilience.stream(
+                    lambda: self.streaming_model.generate_content(full_prompt, stream=True, **kwargs))
+
+    def prompt_key(self, user_prompt: str) -> str:
+        """Return the key identifying equivalent prompts for this model"""
+        return ResponseCache.make_key(self.model_name, self.normalize_prompt(user_prompt))
+
+    def _cached_result(self, key: str) -> Optional[Dict[str, any]]:
+        if self.cache is None:
+            return None
+        cached = self.cache.get(key)
+        if cached is None:
+            return None
+        return {
+            'success': True,
+            'fields': cached['fields'],
+            'raw_response': cached['raw_response'],
+            'cached': True
+        }
     
-    def generate_form_fields(self, user_prompt: str) -> Dict[str, any]:
+    def generate_form_fields(self, user_prompt: str, user_id: Optional[int] = None) -> Dict[str, any]:
         """
         Generate form fields based on user prompt
         
         Args:
             user_prompt: User's description of the form needed
+            user_id: Id of the signed-in requester, whose own forms may be reused as templates
             
         Returns:
             Dictionary containing success status and generated fields or error message
         """
+        key = self.prompt_key(user_prompt)
+        cached = self._cached_result(key)
+        if cached is not None:
+            return cached
+
+        template = self._template_result(user_prompt, key, user_id)
+        if template is not None:
+            return template
+
+        if self.single_flight is not None:
+            result = self.single_flight.do(
+                key,
+                lambda: self._generate(user_prompt, key),
+                lookup=lambda: self._cached_result(key)
+            )
+            return dict(result)
+        return self._generate(user_prompt, key)
+
+    def _template_result(self, user_prompt: str, key: str, user_id: Optional[int]) -> Optional[Dict[str, any]]:
+        if self.templates is None or user_id is None:
+            return None
+        match = self.templates.match(user_prompt, user_id)
+        if match is None:
+            return None
+        if self.template_refresh and self.cache is not None:
+            self._refresh_in_background(user_prompt, key)
+        return {
+            'success': True,
+            'fields': match.fields,
+            'raw_response': '',
+            'template': {'score': match.score}
+        }
+
+    def _refresh_in_background(self, user_prompt: str, key: str):
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._generate(user_prompt, key)
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name='template-refresh', daemon=True).start()
+
+    def _generate(self, user_prompt: str, key: str) -> Dict[str, any]:
         try:
-            full_prompt = self._build_prompt(user_prompt)
-            response = self.model.generate_content(full_prompt)
-            
-            parsed_fields = self.parse_fields(response.text)
+            with span('prompt.build'):
+                built = self._build_prompt(user_prompt)
+            response = self._call_model(
+                built.contents,
+                generation_config=self._generation_config(built.max_output_tokens, self.structured_output)
+            )
+            usage = self.usage.record(built, response.text, getattr(response, 'usage_metadata', None))
+
+            with span('parse_fields'):
+                parsed_fields = self.parse_fields(response.text)
+
+            if self.cache is not None and parsed_fields:
+                self.cache.set(key, {'fields': parsed_fields, 'raw_response': response.text})
 
             return {
                 'success': True,
                 'fields': parsed_fields,
-                'raw_response': response.text
+                'raw_response': response.text,
+                'usage': usage
             }
         except Exception as e:
-            error_message = str(e)
-            
-            # Provide user-friendly error messages
-            if '503' in error_message or 'overloaded' in error_message.lower():
-                user_friendly_message = 'The AI service is currently overloaded. Please wait a moment and try again.'
-            elif 'timeout' in error_message.lower() or 'exceeded' in error_message.lower():
-                user_friendly_message = 'Request timed out. The AI service is busy. Please try again in a few seconds.'
-            elif 'quota' in error_message.lower() or 'rate limit' in error_message.lower():
-                user_friendly_message = 'API quota exceeded. Please try again later or check your API key limits.'
-            elif 'api key' in error_message.lower():
-                user_friendly_message = 'Invalid API key. Please check your Google API key configuration.'
-            else:
-                user_friendly_message = f'AI service error: {error_message}'
-            
             return {
                 'success': False,
-                'error': user_friendly_message,
+                'error': self.friendly_error(e),
                 'fields': None
             }
+
+    def stream_form_fields(self, user_prompt: str) -> Iterator[Dict[str, any]]:
+        """
+        Generate form fields with Gemini's streaming API, yielding each field as soon as its line is complete
+        
+        Args:
+            user_prompt: User's description of the form needed
+            
+        Yields:
+            Event dictionaries: {'event': 'field', 'field': ..., 'line': ...} for every parsed field,
+            then {'event': 'done', 'raw_response': ...}, or {'event': 'error', 'error': ...} on failure
+        """
+        key = self.prompt_key(user_prompt)
+        cached = self._cached_result(key)
+        if cached is not None:
+            for field in cached['fields']:
+                yield {'event': 'field', 'field': field, 'line': None}
+            yield {'event': 'done', 'raw_response': cached['raw_response'], 'cached': True}
+            return
+
+        parser = FieldStreamParser(self.parse_field_line)
+        chunks = []
+        try:
+            built = self._build_prompt(user_prompt, self.stream_prompts)
+            metadata = None
+            for chunk in self._stream_model(built.contents,
+                                            generation_config=self._generation_config(built.max_output_tokens, False)):
+                metadata = getattr(chunk, 'usage_metadata', None) or metadata
+                text = chunk.text
+                chunks.append(text)
+                for line, field in parser.feed(text):
+                    yield {'event': 'field', 'field': field, 'line': line}
+            for line, field in parser.close():
+                yield {'event': 'field', 'field': field, 'line': line}
+        except Exception as e:
+            yield {'event': 'error', 'error': self.friendly_error(e)}
+            return
+
+        raw_response = ''.join(chunks)
+        usage = self.usage.record(built, raw_response, metadata)
+        if self.cache is not None and parser.fields:
+            self.cache.set(key, {'fields': parser.fields, 'raw_response': raw_response})
+        yield {'event': 'done', 'raw_response': raw_response, 'usage': usage}
+
+    @staticmethod
+    def friendly_error(error: Exception) -> str:
+        """
+        Map an exception raised by the Gemini client to a user-friendly message
+        
+        Args:
+            error: Exception raised while calling the model
+            
+        Returns:
+            Message suitable for displaying to the user
+        """
+        error_class = classify_error(error)
+        
+        if error_class == 'circuit_open':
+            return 'The AI service is temporarily unavailable. Please try again in a minute.'
+        elif error_class == 'throttled':
+            return 'Too many forms are being generated right now. Please try again in a few seconds.'
+        elif error_class == 'overloaded':
+            return 'The AI service is currently overloaded. Please wait a moment and try again.'
+        elif error_class == 'timeout':
+            return 'Request timed out. The AI service is busy. Please try again in a few seconds.'
+        elif error_class == 'rate_limited':
+            return 'API quota exceeded. Please try again later or check your API key limits.'
+        elif error_class == 'auth':
+            return 'Invalid API key. Please check your Google API key configuration.'
+        return f'AI service error: {str(error)}'
     
-    def _build_prompt(self, user_prompt: str) -> str:
+    def _build_prompt(self, user_prompt: str, builder: Optional[PromptBuilder] = None) -> BuiltPrompt:
         """
         Build the complete prompt with constraints
         
         Args:
             user_prompt: User's input prompt (may include title, purpose, audience)
+            builder: Prompt builder to use, defaults to the one for the configured output mode
             
         Returns:
-            Complete formatted prompt for Gemini
+            Prompt contents with its output token limit and estimated input tokens
         """
-        return f"""{user_prompt}
-
-Based on the above information, generate a comprehensive form with appropriate fields.
-
-IMPORTANT INSTRUCTIONS:
-- Provide 8-12 essential and important fields
-- Focus on the most critical information needed for this form
-- Consider the target audience and purpose when selecting fields
-- Use appropriate data types for each field
-
-Format each field as a numbered list in comma-separated format:
-"field label, field description, field data type, validation rules, [enumerated values if dropdown/select]"
-
-Example format:
-1. Full Name, Enter your complete name, text, required min:2 max:50
-2. Email Address, Your contact email, email, required
-3. Country, Select your country, select, required, [USA, Canada, UK, India, Other]
-
-Provide ONLY the numbered list of fields. Keep it concise and user-friendly."""
+        return (builder or self.prompts).build(self.clean_prompt(user_prompt))
     
     def parse_fields(self, response_text: str) -> List[Dict[str, str]]:
         """
         Parse the response text into structured field data
         
         Args:
-            response_text: Raw text response from Gemini
+            response_text: Raw text response from Gemini, either JSON or a numbered list
             
         Returns:
             List of dictionaries containing parsed field information
         """
-        fields = []
-        lines = response_text.strip().split('\n')
+        return field_parser.parse_response(response_text)
+
+    @staticmethod
+    def parse_field_line(line: str) -> Optional[Dict[str, any]]:
+        """
+        Parse a single numbered line of the response into a field
         
-        for line in lines:
-            line = line.strip()
-            if not line or not line[0].isdigit():
-                continue
-
-            # Remove numbering
-            parts = line.split('.', 1)
-            if len(parts) < 2:
-                continue
+        Args:
+            line: One line of the Gemini response
             
-            field_data_str = parts[1].strip()
-            field_parts = [p.strip() for p in field_data_str.split(',')]
-
-            if len(field_parts) < 3:
-                continue
-
-            field = {
-                'label': field_parts[0],
-                'description': field_parts[1],
-                'type': field_parts[2],
-                'validation': field_parts[3] if len(field_parts) > 3 else '',
-                'options': field_parts[4] if len(field_parts) > 4 else []
-            }
+        Returns:
+            Dictionary with the parsed field, or None if the line is not a field
+        """
+        return field_parser.parse_field_line(line)
+
+
+class FieldStreamParser:
+    """Incremental parser that turns streamed response text into fields line by line"""
 
-            # Parse options if they exist
-            if isinstance(field['options'], str) and field['options'].startswith('[') and field['options'].endswith(']'):
-                field['options'] = [opt.strip() for opt in field['options'][1:-1].split(',')]
+    def __init__(self, parse_line: Callable[[str], Optional[Dict[str, any]]]):
+        """
+        Initialize the parser
+        
+        Args:
+            parse_line: Function parsing one complete line into a field (or None)
+        """
+        self.parse_line = parse_line
+        self.fields = []
+        self._buffer = ''
 
-            fields.append(field)
+    def feed(self, text: str) -> List[Tuple[str, Dict[str, any]]]:
+        """
+        Add a chunk of streamed text
         
-        return fields
\ No newline at end of file
+        Args:
+            text: Next chunk of the response
+            
+        Returns:
+            (line, field) pairs for every field whose line was completed by this chunk
+        """
+        self._buffer += text
+        *complete, self._buffer = self._buffer.split('\n')
+        return self._parse(complete)
+
+    def close(self) -> List[Tuple[str, Dict[str, any]]]:
+        """Flush the trailing line once the stream has ended"""
+        remainder, self._buffer = self._buffer, ''
+        return self._parse([remainder])
+
+    def _parse(self, lines: List[str]) -> List[Tuple[str, Dict[str, any]]]:
+        parsed = []
+        for line in lines:
+            field = self.parse_line(line)
+            if field is not None:
+                self.fields.append(field)
+                parsed.append((line.strip(), field))
+        return parsed
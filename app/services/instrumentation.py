@@ -0,0 +1,299 @@
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Upper bounds of the per-request SQL statement histogram buckets
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+_request = contextvars.ContextVar('instrumentation_request', default=None)
+_render_started = contextvars.ContextVar('instrumentation_render_started', default=None)
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+
+class RequestRecord:
+    """Spans and SQL statements of the request being handled in the current context"""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.spans = Counter()
+        self.statements = 0
+        self.sql_time = 0.0
+
+
+class Metrics:
+    """Process-wide registry of request, stage and SQL metrics"""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.stages = {}
+        self.statements = {}
+        self.errors = Counter()
+
+    def _histogram(self, table: Dict, key, buckets) -> Histogram:
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram(buckets)
+        return histogram
+
+    def observe_stage(self, name: str, seconds: float):
+        with self._lock:
+            self._histogram(self.stages, name, LATENCY_BUCKETS).observe(seconds)
+
+    def observe_request(self, endpoint: str, status: int, seconds: float, statements: int):
+        with self._lock:
+            self._histogram(self.requests, endpoint, LATENCY_BUCKETS).observe(seconds)
+            self._histogram(self.statements, endpoint, STATEMENT_BUCKETS).observe(statements)
+            if status >= 500:
+                self.errors[endpoint] += 1
+
+    def render(self, extra: Optional[Dict[str, float]] = None) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format
+
+        Args:
+            extra: Additional gauges (name to value) to include, e.g. cache sizes
+
+        Returns:
+            Exposition text
+        """
+        lines = []
+        with self._lock:
+            self._render_histograms(lines, 'formgen_request_duration_seconds', 'Request latency by endpoint',
+                                    'endpoint', self.requests)
+            self._render_histograms(lines, 'formgen_stage_duration_seconds', 'Latency of instrumented stages',
+                                    'stage', self.stages)
+            self._render_histograms(lines, 'formgen_sql_statements_per_request', 'SQL statements per request',
+                                    'endpoint', self.statements)
+            lines.append('# HELP formgen_request_errors_total Requests answered with a 5xx status')
+            lines.append('# TYPE formgen_request_errors_total counter')
+            for endpoint, count in sorted(self.errors.items()):
+                lines.append(f'formgen_request_errors_total{{endpoint="{endpoint}"}} {count}')
+        for name, value in sorted((extra or {}).items()):
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_histograms(lines: List[str], name: str, help_text: str, label: str, table: Dict):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for key, histogram in sorted(table.items()):
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f'{name}_bucket{{{label}="{key}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{label}="{key}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{{label}="{key}"}} {histogram.total:.6f}')
+            lines.append(f'{name}_count{{{label}="{key}"}} {histogram.count}')
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def span(name: str):
+    """
+    Time a stage of request handling
+
+    The duration is added to the process-wide stage histogram and to the current
+    request's spans. Does nothing unless instrumentation is enabled.
+
+    Args:
+        name: Stage name, e.g. 'gemini.call' or 'parse_fields'
+    """
+    if not metrics.enabled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe_stage(name, elapsed)
+        record = _request.get()
+        if record is not None:
+            record.spans[name] += elapsed
+
+
+class SamplingProfiler:
+    """Samples the stacks of in-flight requests and keeps those of slow requests as folded stacks"""
+
+    def __init__(self, output_dir: str, interval: float = 0.005, slow_threshold: float = 1.0):
+        """
+        Initialize the profiler and start its sampling thread
+
+        Args:
+            output_dir: Directory receiving one .folded file per slow request
+            interval: Seconds between samples
+            slow_threshold: Requests taking at least this many seconds are written out
+        """
+        self.output_dir = output_dir
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self._active = {}
+        self._lock = threading.Lock()
+        self.dumps = 0
+        os.makedirs(output_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def start(self):
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+
+    def stop(self, endpoint: str, seconds: float) -> Optional[str]:
+        """
+        Stop sampling the current thread
+
+        Returns:
+            Path of the folded stack file written for a slow request, otherwise None
+        """
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if not samples or seconds < self.slow_threshold:
+            return None
+        path = os.path.join(self.output_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{endpoint}-{int(seconds * 1000)}ms.folded')
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in samples.most_common():
+                f.write(f'{stack} {count}\n')
+        with self._lock:
+            self.dumps += 1
+        return path
+
+    @staticmethod
+    def _fold(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, samples in active:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[self._fold(frame)] += 1
+
+
+def register_instrumentation(app, blueprint: str = 'main', profiler: Optional[SamplingProfiler] = None,
+                             sql_warn_threshold: int = 50):
+    """
+    Time every request of a blueprint, count its SQL statements and enable stage spans
+
+    Adds a Server-Timing header to each response and logs requests that run more
+    than sql_warn_threshold statements, which usually means an N+1 query.
+
+    Args:
+        app: Flask application
+        blueprint: Name of the blueprint whose requests are instrumented
+        profiler: Optional sampling profiler for slow requests
+        sql_warn_threshold: SQL statements per request above which a warning is logged
+    """
+    from flask import before_render_template, g, request, template_rendered
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    metrics.enabled = True
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_render_start, app, weak=False)
+    template_rendered.connect(_render_finish, app, weak=False)
+
+    @app.before_request
+    def start_request():
+        if request.blueprint != blueprint:
+            return
+        g.instrumentation_token = _request.set(RequestRecord(request.endpoint or 'unknown'))
+        if profiler is not None:
+            profiler.start()
+
+    @app.after_request
+    def finish_request(response):
+        token = g.pop('instrumentation_token', None)
+        if token is None:
+            return response
+        record = _request.get()
+        _request.reset(token)
+        elapsed = time.perf_counter() - record.started
+        endpoint = record.endpoint
+        if response.is_streamed:
+            # Streamed bodies are produced after this hook, so only the time to the first byte is known
+            endpoint = f'{endpoint}:ttfb'
+        metrics.observe_request(endpoint, response.status_code, elapsed, record.statements)
+        if profiler is not None:
+            profiler.stop(endpoint, elapsed)
+        if record.statements > sql_warn_threshold:
+            logger.warning('%s ran %d SQL statements in one request (possible N+1 query)',
+                           endpoint, record.statements)
+
+        timings = [f'total;dur={elapsed * 1000:.1f}',
+                   f'sql;dur={record.sql_time * 1000:.1f};desc="{record.statements} statements"']
+        timings.extend(f'{name.replace(".", "-")};dur={seconds * 1000:.1f}' for name, seconds in record.spans.items())
+        response.headers['Server-Timing'] = ', '.join(timings)
+        return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context, which is discarded with the statement even when it raises
+    context._instrumentation_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_instrumentation_started', None)
+    record = _request.get()
+    if record is not None and started is not None:
+        record.statements += 1
+        record.sql_time += time.perf_counter() - started
+
+
+def _render_start(sender, template, context, **extra):
+    _render_started.set(time.perf_counter())
+
+
+def _render_finish(sender, template, context, **extra):
+    started = _render_started.get()
+    if started is None:
+        return
+    _render_started.set(None)
+    elapsed = time.perf_counter() - started
+    metrics.observe_stage('template.render', elapsed)
+    record = _request.get()
+    if record is not None:
+        record.spans['template.render'] += elapsed
@@ -0,0 +1,270 @@
+import datetime
+import json
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict
+
+from .gemini_service import GeminiService
+from .response_cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+UNFINISHED_STATUSES = ('queued', 'running')
+
+
+class JobQueueFull(Exception):
+    """Raised when the queue already holds its maximum number of unfinished jobs"""
+
+
+class GenerationJobQueue:
+    """
+    Local worker pool that runs generation jobs in the background and persists their results
+
+    Each queue owns the jobs it accepted and refreshes their heartbeat while they are unfinished.
+    Jobs whose heartbeat stops, because their worker died or was restarted, are taken over and
+    run again by the next queue that notices, up to max_attempts runs per job. The heartbeat
+    thread is started by start(), in server workers or on first use, never by CLI commands.
+    """
+
+    def __init__(self, app, service, max_workers: int = 2, max_queued: int = 100,
+                 heartbeat_interval: float = 15.0, stale_after: float = 60.0, max_attempts: int = 3):
+        """
+        Initialize the queue
+
+        Args:
+            app: Flask application, used to open an app context in worker threads
+            service: Object providing generate_form_fields (a GeminiService or a fake)
+            max_workers: Number of jobs processed concurrently
+            max_queued: Maximum number of unfinished jobs before new ones are rejected
+            heartbeat_interval: Seconds between heartbeats, and between checks for abandoned jobs
+            stale_after: Seconds without a heartbeat after which an unfinished job is taken over
+            max_attempts: Runs of a job, including takeovers, before it is marked failed
+        """
+        self.app = app
+        self.service = service
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.instance_id = uuid.uuid4().hex
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='generation-job')
+        self._lock = threading.Lock()
+        self._in_flight = {}  # prompt key -> job id
+        self.enqueued = 0
+        self.deduplicated = 0
+        self.completed = 0
+        self.failed = 0
+        self.recovered = 0
+        self.abandoned = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the heartbeat thread, which first takes over jobs abandoned by stopped workers"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._maintain, name='generation-job-heartbeat', daemon=True)
+        self._thread.start()
+
+    def prompt_key(self, user_prompt: str) -> str:
+        if hasattr(self.service, 'prompt_key'):
+            return self.service.prompt_key(user_prompt)
+        return ResponseCache.make_key(getattr(self.service, 'model_name', ''), GeminiService.normalize_prompt(user_prompt))
+
+    def enqueue(self, user_prompt: str) -> str:
+        """
+        Queue a generation, reusing the in-flight job for an identical prompt
+
+        Args:
+            user_prompt: User's description of the form needed
+
+        Returns:
+            Id of the job that will produce the result
+
+        Raises:
+            JobQueueFull: If max_queued jobs are already unfinished
+        """
+        from app import db
+        from app.models import GenerationJob
+
+        self.start()
+        key = self.prompt_key(user_prompt)
+        with self._lock:
+            job_id = self._in_flight.get(key)
+            if job_id is not None:
+                self.deduplicated += 1
+                return job_id
+            if len(self._in_flight) >= self.max_queued:
+                raise JobQueueFull('Too many generation jobs in progress')
+
+            job_id = uuid.uuid4().hex
+            self._in_flight[key] = job_id
+            self.enqueued += 1
+
+        try:
+            db.session.add(GenerationJob(id=job_id, prompt_key=key, prompt=user_prompt, status='queued', attempts=1,
+                                         owner=self.instance_id, heartbeat_at=datetime.datetime.utcnow()))
+            db.session.commit()
+            self._pool.submit(self._process, job_id, key, user_prompt)
+        except Exception:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            raise
+        return job_id
+
+    def _process(self, job_id: str, key: str, user_prompt: str):
+        from app import db
+        from app.models import GenerationJob
+
+        with self.app.app_context():
+            try:
+                job = db.session.get(GenerationJob, job_id)
+                if job is None:
+                    return
+                job.status = 'running'
+                db.session.commit()
+
+                try:
+                    result = self.service.generate_form_fields(user_prompt)
+                except Exception as e:
+                    result = {'success': False, 'error': f'Server error: {str(e)}', 'fields': None}
+
+                job.status = 'done' if result.get('success') else 'failed'
+                job.result = json.dumps(result)
+                job.error = (result.get('error') or '')[:500] or None
+                job.completed_at = datetime.datetime.utcnow()
+                db.session.commit()
+
+                with self._lock:
+                    if result.get('success'):
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+            finally:
+                db.session.remove()
+                with self._lock:
+                    if self._in_flight.get(key) == job_id:
+                        del self._in_flight[key]
+
+    def _maintain(self):
+        while True:
+            self.maintain()
+            if self._stopped.wait(self.heartbeat_interval):
+                return
+
+    def maintain(self):
+        """Refresh the heartbeat of this queue's unfinished jobs and take over abandoned ones"""
+        from app import db
+        from app.models import GenerationJob
+
+        with self.app.app_context():
+            try:
+                now = datetime.datetime.utcnow()
+                db.session.execute(
+                    GenerationJob.__table__.update()
+                    .where(GenerationJob.owner == self.instance_id, GenerationJob.status.in_(UNFINISHED_STATUSES))
+                    .values(heartbeat_at=now)
+                )
+                db.session.commit()
+                self._recover_stale(now)
+            except Exception:
+                db.session.rollback()
+                logger.warning('Generation job heartbeat failed', exc_info=True)
+            finally:
+                db.session.remove()
+
+    def _recover_stale(self, now: datetime.datetime):
+        from app import db
+        from app.models import GenerationJob
+
+        cutoff = now - datetime.timedelta(seconds=self.stale_after)
+        last_seen = db.func.coalesce(GenerationJob.heartbeat_at, GenerationJob.timestamp)
+        attempts = db.func.coalesce(GenerationJob.attempts, 1)
+
+        # A prompt that keeps killing its worker must not be retried forever
+        error = f'Generation was interrupted {self.max_attempts} times. Please try again later.'
+        gave_up = db.session.execute(
+            GenerationJob.__table__.update()
+            .where(GenerationJob.status.in_(UNFINISHED_STATUSES), last_seen < cutoff, attempts >= self.max_attempts)
+            .values(status='failed', error=error, completed_at=now,
+                    result=json.dumps({'success': False, 'error': error, 'fields': None}))
+        ).rowcount
+        db.session.commit()
+        if gave_up:
+            logger.warning('Gave up on %d generation jobs interrupted %d times', gave_up, self.max_attempts)
+            with self._lock:
+                self.abandoned += gave_up
+
+        stale = db.session.execute(
+            db.select(GenerationJob.id, GenerationJob.prompt_key, GenerationJob.prompt)
+            .where(GenerationJob.status.in_(UNFINISHED_STATUSES), last_seen < cutoff)
+            .order_by(GenerationJob.timestamp)
+            .limit(self.max_queued)
+        ).all()
+        for job_id, key, user_prompt in stale:
+            with self._lock:
+                if len(self._in_flight) >= self.max_queued:
+                    return
+            # Conditional update, so only one worker takes over each job
+            claimed = db.session.execute(
+                GenerationJob.__table__.update()
+                .where(GenerationJob.id == job_id, GenerationJob.status.in_(UNFINISHED_STATUSES), last_seen < cutoff,
+                       attempts < self.max_attempts)
+                .values(status='queued', owner=self.instance_id, heartbeat_at=now, attempts=attempts + 1)
+            ).rowcount
+            db.session.commit()
+            if not claimed:
+                continue
+            logger.info('Requeued abandoned generation job %s', job_id)
+            with self._lock:
+                self._in_flight.setdefault(key, job_id)
+                self.recovered += 1
+            self._pool.submit(self._process, job_id, key, user_prompt)
+
+    def get(self, job_id: str) -> Optional[Dict[str, any]]:
+        """
+        Look up a job
+
+        Args:
+            job_id: Id returned by enqueue
+
+        Returns:
+            Dictionary with the job's status and, once finished, its result; None if unknown
+        """
+        from app import db
+        from app.models import GenerationJob
+
+        self.start()
+        job = db.session.get(GenerationJob, job_id)
+        if job is None:
+            return None
+        return {
+            'job_id': job.id,
+            'status': job.status,
+            'error': job.error,
+            'result': json.loads(job.result) if job.result else None,
+            'created_at': job.timestamp.isoformat() if job.timestamp else None,
+            'completed_at': job.completed_at.isoformat() if job.completed_at else None
+        }
+
+    def stats(self) -> Dict[str, int]:
+        """Return queue counters for the health endpoint"""
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'in_flight': len(self._in_flight),
+                'enqueued': self.enqueued,
+                'deduplicated': self.deduplicated,
+                'completed': self.completed,
+                'failed': self.failed,
+                'recovered': self.recovered,
+                'abandoned': self.abandoned
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._stopped.set()
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,190 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Iterable, Optional
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing pool already holds its maximum number of pending jobs"""
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords in a bounded process pool, off the request threads
+
+    Hashing is deliberately CPU-heavy; run on request threads, a burst of logins takes every
+    core and thread the worker has. The pool caps concurrent hashes at its size and runs them
+    at a lower scheduling priority, so other requests keep their CPU share. It runs werkzeug's
+    functions directly, so its processes never import the app.
+    """
+
+    def __init__(self, method: str = 'scrypt', workers: int = 2, max_pending: int = 16, timeout: float = 10.0,
+                 nice: int = 5):
+        """
+        Initialize the hasher
+
+        Args:
+            method: werkzeug hash method with its cost, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'
+            workers: Hashing processes, started by start() or the first hash; 0 hashes on the calling thread
+            max_pending: Maximum number of running plus queued hashes before new ones are rejected
+            timeout: Seconds a caller waits for a hash
+            nice: Niceness added to the hashing processes
+        """
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self.nice = nice
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._method_prefix = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self.hashed = 0
+        self.verified = 0
+        self.rehashed = 0
+        self.rejected = 0
+
+    def start(self):
+        """
+        Fork the hashing processes
+
+        Server workers call this through start_background_services before their request
+        threads exist: forking a threaded server is only safe before its threads hold locks.
+        Otherwise the first hash starts the pool, so CLI commands that never hash never fork.
+        The fork start method also spares the pool re-importing the main module, as spawn and
+        forkserver would. Where fork is unavailable, hashing stays on the calling thread.
+        """
+        with self._start_lock:
+            if not self.workers or self._pool is not None:
+                return
+            if 'fork' not in multiprocessing.get_all_start_methods():
+                self.workers = 0
+                return
+            pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('fork'),
+                                       initializer=os.nice, initargs=(self.nice,))
+            # With fork the executor starts all of its processes on the first submission
+            pool.submit(os.getpid).result()
+            self._pool = pool
+
+    def _run(self, fn, *args):
+        if self._pool is None and self.workers:
+            self.start()
+        if self._pool is None:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy('Too many password checks in progress')
+        try:
+            return self._pool.submit(fn, *args).result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise HasherBusy('Password check timed out')
+        finally:
+            self._slots.release()
+
+    def hash(self, password: str) -> str:
+        """Return a salted hash of the password with the configured method"""
+        result = self._run(generate_password_hash, password, self.method)
+        with self._lock:
+            self.hashed += 1
+        return result
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        """Check a password against a stored hash, whatever method produced it"""
+        if not password_hash:
+            return False
+        result = self._run(check_password_hash, password_hash, password)
+        with self._lock:
+            self.verified += 1
+        return result
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """Whether a stored hash was made with a different method or cost than the configured one"""
+        if self._method_prefix is None:
+            # werkzeug fills in default parameters ('scrypt' -> 'scrypt:32768:8:1'); hash once to learn them
+            self._method_prefix = self._run(generate_password_hash, '', self.method).split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._method_prefix
+
+    def count_rehash(self):
+        with self._lock:
+            self.rehashed += 1
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, any]:
+        with self._lock:
+            return {
+                'method': self.method,
+                'workers': self.workers,
+                'hashed': self.hashed,
+                'verified': self.verified,
+                'rehashed': self.rehashed,
+                'rejected': self.rejected
+            }
+
+
+class AttemptLimiter:
+    """Fixed-window counter of login attempts per key (client IP, email), checked before any hashing"""
+
+    def __init__(self, limits: Dict[str, int], window: float = 300.0, max_keys: int = 100000):
+        """
+        Initialize the limiter
+
+        Args:
+            limits: Attempts allowed per window for each kind of key, e.g. {'ip': 20, 'email': 5}
+            window: Window length in seconds
+            max_keys: Keys tracked before expired windows are pruned
+        """
+        self.limits = limits
+        self.window = window
+        self.max_keys = max_keys
+        self._windows = {}
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def allow(self, keys: Dict[str, Optional[str]]) -> bool:
+        """
+        Count an attempt against each key, or reject it if any key is over its limit
+
+        Args:
+            keys: Key value per kind, e.g. {'ip': '203.0.113.9', 'email': 'a@example.com'}; None values are skipped
+
+        Returns:
+            False if the attempt must be rejected
+        """
+        now = time.monotonic()
+        counted = [(kind, value) for kind, value in keys.items() if value and kind in self.limits]
+        with self._lock:
+            if len(self._windows) > self.max_keys:
+                self._prune(now)
+            for kind, value in counted:
+                started, count = self._windows.get((kind, value), (now, 0))
+                if now - started < self.window and count >= self.limits[kind]:
+                    self.rejected += 1
+                    return False
+            for kind, value in counted:
+                started, count = self._windows.get((kind, value), (now, 0))
+                if now - started >= self.window:
+                    started, count = now, 0
+                self._windows[(kind, value)] = (started, count + 1)
+        return True
+
+    def reset(self, keys: Iterable[tuple]):
+        """Forget the attempts of (kind, value) keys, e.g. an email after a successful login"""
+        with self._lock:
+            for key in keys:
+                self._windows.pop(key, None)
+
+    def _prune(self, now: float):
+        for key in [k for k, (started, _) in self._windows.items() if now - started >= self.window]:
+            del self._windows[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'keys': len(self._windows), 'rejected': self.rejected}
@@ -0,0 +1,207 @@
+import functools
+import inspect
+import re
+import threading
+from collections import namedtuple
+from typing import Dict, Optional, Tuple
+
+BuiltPrompt = namedtuple('BuiltPrompt', ['contents', 'max_output_tokens', 'input_tokens', 'truncated', 'field_count'])
+
+DEFAULT_FIELD_RANGE = (8, 12)
+MAX_FIELDS = 40
+
+# Rough output size of one field in each format, used to size max_output_tokens
+TOKENS_PER_FIELD = {'list': 40, 'json': 70}
+OUTPUT_OVERHEAD_TOKENS = 64
+
+# Thinking models spend part of max_output_tokens reasoning before they answer. When the
+# client cannot cap that with a thinking budget, the limit is kept at least this high
+UNCAPPED_THINKING_MIN_OUTPUT_TOKENS = 8192
+
+_THINKING_MODEL = re.compile(r'gemini-(?:2\.5|[3-9])|thinking', re.IGNORECASE)
+
+# Only an explicit "<n> fields" or "<n> questions" / "<n>-question" sizes the output limit
+_FIELD_COUNT = re.compile(r'\b(\d{1,2})[ -](?:fields|questions?)\b', re.IGNORECASE)
+
+LIST_INSTRUCTIONS = """Based on the above information, generate a comprehensive form with appropriate fields.
+
+IMPORTANT INSTRUCTIONS:
+- Provide 8-12 essential and important fields, unless a number of fields is requested
+- Focus on the most critical information needed for this form
+- Consider the target audience and purpose when selecting fields
+- Use appropriate data types for each field
+
+Format each field as a numbered list in comma-separated format:
+"field label, field description, field data type, validation rules, [enumerated values if dropdown/select]"
+
+Example format:
+1. Full Name, Enter your complete name, text, required min:2 max:50
+2. Email Address, Your contact email, email, required
+3. Country, Select your country, select, required, [USA, Canada, UK, India, Other]
+
+Provide ONLY the numbered list of fields. Keep it concise and user-friendly."""
+
+JSON_INSTRUCTIONS = """Based on the above information, generate a comprehensive form with appropriate fields.
+
+IMPORTANT INSTRUCTIONS:
+- Provide 8-12 essential and important fields, unless a number of fields is requested
+- Focus on the most critical information needed for this form
+- Consider the target audience and purpose when selecting fields
+- Use appropriate data types for each field
+
+Respond with ONLY a JSON array. Each element is an object with the keys
+"label", "description", "type" (text, email, number, tel, date, select, textarea, ...),
+"validation" (e.g. "required min:2 max:50") and "options" (array of strings, empty unless type is select).
+
+Example:
+[{"label": "Country", "description": "Select your country", "type": "select", "validation": "required", "options": ["USA", "Canada", "UK"]}]"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate Gemini token count (about four characters per token) without a network call"""
+    return (len(text) + 3) // 4
+
+
+@functools.lru_cache(maxsize=None)
+def supports_system_instruction() -> bool:
+    """Whether the installed client lets a model carry the static instructions as a system instruction"""
+    import google.generativeai as genai
+
+    return 'system_instruction' in inspect.signature(genai.GenerativeModel.__init__).parameters
+
+
+def is_thinking_model(model_name: str) -> bool:
+    """Whether a Gemini model thinks before answering, with thinking tokens counted as output"""
+    return bool(_THINKING_MODEL.search(model_name))
+
+
+def requested_field_count(user_prompt: str) -> Optional[int]:
+    """Return the number of fields the user asked for ("a 5-question survey", "15 fields"), if any"""
+    match = _FIELD_COUNT.search(user_prompt)
+    if not match:
+        return None
+    count = int(match.group(1))
+    return count if 0 < count <= MAX_FIELDS else None
+
+
+class PromptBuilder:
+    """Assembles model prompts: static instructions, a token-budgeted user prompt and an output limit"""
+
+    def __init__(self, structured: bool = False, max_input_tokens: int = 1000, use_system_instruction: bool = True):
+        """
+        Initialize the builder
+
+        Args:
+            structured: Build prompts for the JSON output mode instead of the numbered list
+            max_input_tokens: Budget for the user-supplied part of the prompt; longer prompts are truncated
+            use_system_instruction: Send the static instructions once as the model's system
+                instruction when the client supports it, instead of with every prompt
+        """
+        self.structured = structured
+        self.max_input_tokens = max_input_tokens
+        self.use_system_instruction = use_system_instruction
+        self.instructions = JSON_INSTRUCTIONS if structured else LIST_INSTRUCTIONS
+        self.instruction_tokens = estimate_tokens(self.instructions)
+
+    @property
+    def system_instruction(self) -> Optional[str]:
+        """The instructions to configure the model with, or None when they go inline with each prompt"""
+        if self.use_system_instruction and supports_system_instruction():
+            return self.instructions
+        return None
+
+    def truncate(self, user_prompt: str) -> Tuple[str, bool]:
+        """
+        Cut a prompt down to the input budget, at a word boundary where possible
+
+        Returns:
+            The prompt and whether it was truncated
+        """
+        if estimate_tokens(user_prompt) <= self.max_input_tokens:
+            return user_prompt, False
+        cut = user_prompt[:self.max_input_tokens * 4]
+        space = cut.rfind(' ')
+        if space > len(cut) * 0.8:
+            cut = cut[:space]
+        return cut.rstrip() + ' …', True
+
+    def max_output_tokens(self, field_count: Optional[int]) -> int:
+        """Output limit for a response of field_count fields (the top of the default range when unknown)"""
+        fields = field_count or DEFAULT_FIELD_RANGE[1]
+        # Allow a few extra fields so a slightly longer answer is not cut off mid-line
+        return (fields + 3) * TOKENS_PER_FIELD['json' if self.structured else 'list'] + OUTPUT_OVERHEAD_TOKENS
+
+    def build(self, cleaned_prompt: str) -> BuiltPrompt:
+        """
+        Build the prompt for one request
+
+        Args:
+            cleaned_prompt: User prompt after GeminiService.clean_prompt
+
+        Returns:
+            Contents to send, the output token limit, the estimated input tokens, whether the
+            user prompt was truncated and the requested field count
+        """
+        user_prompt, truncated = self.truncate(cleaned_prompt)
+        # Only sizes the output limit; the prompt itself is sent as the user wrote it
+        field_count = requested_field_count(user_prompt)
+
+        if self.system_instruction is not None:
+            contents = user_prompt
+            input_tokens = estimate_tokens(user_prompt)
+        else:
+            contents = f'{user_prompt}\n\n{self.instructions}'
+            input_tokens = estimate_tokens(contents)
+        return BuiltPrompt(contents, self.max_output_tokens(field_count), input_tokens, truncated, field_count)
+
+
+class TokenUsage:
+    """Running totals of the tokens sent to and received from the model"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.truncated = 0
+
+    def record(self, built: BuiltPrompt, output_text: str, metadata=None) -> Dict[str, any]:
+        """
+        Add one call to the totals
+
+        Args:
+            built: The prompt that was sent
+            output_text: Text the model returned
+            metadata: The response's usage_metadata, used instead of estimates when the client provides it
+
+        Returns:
+            Usage of this call
+        """
+        if metadata is not None:
+            usage = {
+                'input_tokens': metadata.prompt_token_count,
+                'output_tokens': metadata.candidates_token_count,
+                'estimated': False
+            }
+        else:
+            usage = {
+                'input_tokens': built.input_tokens,
+                'output_tokens': estimate_tokens(output_text),
+                'estimated': True
+            }
+        usage.update({'max_output_tokens': built.max_output_tokens, 'truncated': built.truncated})
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += usage['input_tokens']
+            self.output_tokens += usage['output_tokens']
+            self.truncated += int(built.truncated)
+        return usage
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'input_tokens': self.input_tokens,
+                'output_tokens': self.output_tokens,
+                'truncated_prompts': self.truncated
+            }
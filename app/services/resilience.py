@@ -0,0 +1,330 @@
+import random
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+RETRYABLE_ERRORS = ('overloaded', 'rate_limited', 'timeout')
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while the circuit breaker is open"""
+
+
+class RateLimitExceeded(Exception):
+    """Raised when no request token became available within the allowed wait"""
+
+
+def classify_error(error: Exception) -> str:
+    """
+    Sort an exception raised by the Gemini client into an error class
+
+    Args:
+        error: Exception raised while calling the model
+
+    Returns:
+        One of 'circuit_open', 'throttled', 'overloaded', 'rate_limited', 'timeout', 'auth' or 'other'
+    """
+    if isinstance(error, CircuitOpenError):
+        return 'circuit_open'
+    if isinstance(error, RateLimitExceeded):
+        return 'throttled'
+
+    message = str(error).lower()
+    if '503' in message or 'overloaded' in message or 'unavailable' in message:
+        return 'overloaded'
+    if '429' in message or 'quota' in message or 'rate limit' in message or 'resource exhausted' in message:
+        return 'rate_limited'
+    if 'timeout' in message or 'timed out' in message or 'deadline' in message or 'exceeded' in message:
+        return 'timeout'
+    if 'api key' in message or '401' in message or '403' in message:
+        return 'auth'
+    return 'other'
+
+
+class TokenBucket:
+    """Thread-safe token bucket whose refill rate backs off on 429s and recovers on success (AIMD)"""
+
+    def __init__(self, rate: float, capacity: int, min_rate: Optional[float] = None):
+        """
+        Initialize the bucket
+
+        Args:
+            rate: Tokens added per second, i.e. the request quota
+            capacity: Maximum burst size
+            min_rate: Lowest rate the bucket backs off to, defaults to a tenth of rate
+        """
+        self.max_rate = rate
+        self.min_rate = min_rate or rate / 10
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: float = 0.0) -> bool:
+        """
+        Take one token, waiting up to timeout seconds for it
+
+        Args:
+            timeout: Maximum number of seconds to wait
+
+        Returns:
+            True if a token was taken
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def penalize(self):
+        """Halve the rate after the provider reported we are over quota"""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def reward(self):
+        """Creep the rate back towards the configured quota after a success"""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class CircuitBreaker:
+    """Fails fast after repeated provider failures, then lets a single probe through after a cool-down"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Initialize the breaker
+
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a probe request is allowed
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_owner = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._probe_owner = threading.get_ident()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+    def release_probe(self):
+        """
+        End this thread's probe without a verdict: it hit a non-retryable error or was never sent
+
+        The circuit goes back to open with its cool-down already over, so the next call probes again.
+        """
+        with self._lock:
+            if self.state == 'half_open' and self._probe_owner == threading.get_ident():
+                self.state = 'open'
+                self._probe_owner = None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter for retryable errors"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0):
+        """
+        Initialize the policy
+
+        Args:
+            max_attempts: Total attempts, including the first one
+            base_delay: Backoff ceiling in seconds for the first retry
+            max_delay: Upper bound of the backoff ceiling
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """Return a random delay before retry number attempt (starting at 1)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class ResilientCaller:
+    """Wraps provider calls with rate limiting, retries with backoff and a circuit breaker"""
+
+    def __init__(self, rate_limiter: Optional[TokenBucket] = None, retry_policy: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None, rate_limit_wait: float = 5.0,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        Initialize the caller
+
+        Args:
+            rate_limiter: Optional client-side token bucket
+            retry_policy: Retry policy, defaults to no retries
+            breaker: Optional circuit breaker
+            rate_limit_wait: Seconds to wait for a rate limiter token before giving up
+            sleep: Function used to wait between retries (replaceable in tests)
+        """
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=1)
+        self.breaker = breaker
+        self.rate_limit_wait = rate_limit_wait
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self.errors = Counter()
+        self.calls = 0
+        self.successes = 0
+        self.retries = 0
+
+    def call(self, fn: Callable[[], any]):
+        """
+        Call fn, retrying retryable errors until the policy gives up
+
+        Args:
+            fn: Function performing one provider request
+
+        Returns:
+            The value returned by fn
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+            RateLimitExceeded: If no token became available in time
+            Exception: The last error raised by fn
+        """
+        attempt = 1
+        while True:
+            self._admit()
+            try:
+                result = fn()
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                attempt += 1
+                continue
+            except BaseException:
+                self._release_probe()
+                raise
+            self._record_success()
+            return result
+
+    def stream(self, fn: Callable[[], Iterable]) -> Iterator:
+        """
+        Iterate over a streamed response, with the breaker and rate limiter covering the whole stream
+
+        Errors raised before the first item are retried like in call. Later errors are recorded
+        the same way but re-raised, since the items already handed out cannot be taken back.
+
+        Args:
+            fn: Function starting one streamed provider request
+
+        Yields:
+            The items of the stream
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+            RateLimitExceeded: If no token became available in time
+            Exception: The last error raised by fn or by the stream
+        """
+        attempt = 1
+        while True:
+            self._admit()
+            started = False
+            try:
+                for item in fn():
+                    started = True
+                    yield item
+            except Exception as e:
+                if not self._should_retry(e, attempt, can_retry=not started):
+                    raise
+                attempt += 1
+                continue
+            except BaseException:
+                # Also reached when the consumer closes the stream early
+                self._release_probe()
+                raise
+            self._record_success()
+            return
+
+    def _admit(self):
+        """Check the breaker and take a rate limiter token before one attempt"""
+        if self.breaker is not None and not self.breaker.allow():
+            self._count_error('circuit_open')
+            raise CircuitOpenError('The AI service is temporarily unavailable')
+        # Every outcome after this records a success or failure or releases a half-open probe,
+        # so the breaker can never be left in half_open
+        if self.rate_limiter is not None and not self.rate_limiter.acquire(self.rate_limit_wait):
+            self._count_error('throttled')
+            self._release_probe()
+            raise RateLimitExceeded('Local rate limit exceeded')
+        with self._lock:
+            self.calls += 1
+
+    def _should_retry(self, error: Exception, attempt: int, can_retry: bool = True) -> bool:
+        """Record a failed attempt and, if it is to be retried, wait the backoff delay"""
+        error_class = classify_error(error)
+        self._count_error(error_class)
+        if error_class == 'rate_limited' and self.rate_limiter is not None:
+            self.rate_limiter.penalize()
+        if error_class in RETRYABLE_ERRORS and self.breaker is not None:
+            self.breaker.record_failure()
+        else:
+            self._release_probe()
+        if not can_retry or error_class not in RETRYABLE_ERRORS or attempt >= self.retry_policy.max_attempts:
+            return False
+        with self._lock:
+            self.retries += 1
+        self.sleep(self.retry_policy.delay(attempt))
+        return True
+
+    def _record_success(self):
+        with self._lock:
+            self.successes += 1
+        if self.rate_limiter is not None:
+            self.rate_limiter.reward()
+        if self.breaker is not None:
+            self.breaker.record_success()
+
+    def _release_probe(self):
+        if self.breaker is not None:
+            self.breaker.release_probe()
+
+    def _count_error(self, error_class: str):
+        with self._lock:
+            self.errors[error_class] += 1
+
+    def stats(self) -> Dict[str, any]:
+        """Return per-error-class counters for the health endpoint"""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'successes': self.successes,
+                'retries': self.retries,
+                'errors': dict(self.errors),
+                'circuit': self.breaker.state if self.breaker is not None else None,
+                'rate': round(self.rate_limiter.rate, 3) if self.rate_limiter is not None else None
+            }
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict
+
+
+class SQLiteCacheTier:
+    """Shared cache tier stored in a SQLite file so gunicorn workers can reuse each other's results"""
+
+    def __init__(self, path: str, ttl: int):
+        """
+        Initialize the SQLite tier and create its table if needed
+
+        Args:
+            path: Filesystem path of the SQLite database
+            ttl: Time to live for entries, in seconds
+        """
+        self.path = path
+        self.ttl = ttl
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS response_cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str) -> Optional[Dict[str, any]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT value, expires_at FROM response_cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                conn.execute('DELETE FROM response_cache WHERE key = ?', (key,))
+                return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Dict[str, any]):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), time.time() + self.ttl)
+            )
+
+    def purge_expired(self) -> int:
+        with self._connect() as conn:
+            cursor = conn.execute('DELETE FROM response_cache WHERE expires_at < ?', (time.time(),))
+            return cursor.rowcount
+
+
+class ResponseCache:
+    """In-memory LRU/TTL cache of parsed Gemini responses, optionally backed by a shared SQLite tier"""
+
+    def __init__(self, max_entries: int = 256, ttl: int = 3600, sqlite_path: Optional[str] = None):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Maximum number of entries kept in process memory
+            ttl: Time to live for entries, in seconds
+            sqlite_path: Optional path of a SQLite file shared across workers
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = SQLiteCacheTier(sqlite_path, ttl) if sqlite_path else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model_name: str, normalized_prompt: str) -> str:
+        """
+        Build the cache key for a prompt
+
+        Args:
+            model_name: Name of the Gemini model that produced the response
+            normalized_prompt: Prompt already normalized by GeminiService.normalize_prompt
+
+        Returns:
+            Hex digest identifying the (model, prompt) pair
+        """
+        return hashlib.sha256(f'{model_name}\n{normalized_prompt}'.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, any]]:
+        """
+        Look up a cached response, checking memory first and then the shared tier
+
+        Args:
+            key: Key built by make_key
+
+        Returns:
+            The cached value, or None on a miss
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self._store(key, value)
+                with self._lock:
+                    self.shared_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: Dict[str, any]):
+        """
+        Store a response in memory and in the shared tier
+
+        Args:
+            key: Key built by make_key
+            value: Dictionary holding 'fields' and 'raw_response'
+        """
+        self._store(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def _store(self, key: str, value: Dict[str, any]):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters for the health endpoint"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'shared': self.shared is not None
+            }
@@ -0,0 +1,103 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import selectinload
+
+from app import db
+from app.models import FormField, FormResponse, ResponseAnswer
+from app.services.answer_storage import decode_value, load_options, unpack
+from app.services.archive import archived_counts, form_archives, iter_archived_rows
+
+
+def form_fields(form_id: int) -> List[FormField]:
+    """
+    Load a form's fields in display order, with their options, in two queries
+
+    Args:
+        form_id: Id of the form
+
+    Returns:
+        List of FormField rows
+    """
+    return db.session.execute(
+        db.select(FormField).options(selectinload(FormField.choices))
+        .where(FormField.form_id == form_id).order_by(FormField.id)
+    ).scalars().all()
+
+
+def responses_page(form_id: int, field_ids: Sequence[int], after_id: Optional[int] = None,
+                   limit: int = 50) -> Tuple[List[Dict[str, any]], Optional[int]]:
+    """
+    Load one page of responses, pivoted into one row per response, with three queries
+
+    Archived responses are merged in by id, reading only the partitions past the cursor.
+
+    Args:
+        form_id: Id of the form
+        field_ids: Field ids in column order
+        after_id: Keyset cursor; only responses with a larger id are returned
+        limit: Maximum number of responses in the page
+
+    Returns:
+        The rows ({'id', 'timestamp', 'values'}) and the cursor for the next page, or None on the last page
+    """
+    query = db.select(FormResponse.id, FormResponse.timestamp, FormResponse.packed).where(FormResponse.form_id == form_id)
+    if after_id is not None:
+        query = query.where(FormResponse.id > after_id)
+    responses = db.session.execute(query.order_by(FormResponse.id).limit(limit + 1)).all()
+
+    archived = []
+    archives = form_archives(form_id)
+    if archives:
+        # Both sources are in id order, so limit + 1 rows of each are enough for the page
+        for response_id, timestamp, values in iter_archived_rows(form_id, field_ids, after_id, archives):
+            archived.append({'id': response_id, 'timestamp': timestamp, 'values': values})
+            if len(archived) > limit:
+                break
+
+    options = load_options(field_ids) if responses else {}
+    rows = {
+        response.id: {'id': response.id, 'timestamp': response.timestamp, 'values': unpack(response.packed, options)}
+        for response in responses
+    }
+    if rows:
+        answers = db.session.execute(
+            db.select(ResponseAnswer.response_id, ResponseAnswer.field_id, ResponseAnswer.value,
+                      ResponseAnswer.option_index)
+            .where(ResponseAnswer.response_id.in_(list(rows)))
+        )
+        for response_id, field_id, value, option_index in answers:
+            rows[response_id]['values'][field_id] = decode_value(field_id, value, option_index, options)
+
+    for row in rows.values():
+        values = row['values']
+        row['values'] = [values.get(field_id) for field_id in field_ids]
+
+    page = sorted(archived + list(rows.values()), key=lambda row: row['id']) if archived else list(rows.values())
+    next_after = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_after = page[-1]['id']
+    return page, next_after
+
+
+def response_counts(form_ids: Sequence[int]) -> Dict[int, int]:
+    """
+    Count responses for many forms, archived ones included, with two grouped queries
+
+    Args:
+        form_ids: Ids of the forms to count
+
+    Returns:
+        Mapping of form id to response count; forms without responses are omitted
+    """
+    if not form_ids:
+        return {}
+    counts = db.session.execute(
+        db.select(FormResponse.form_id, db.func.count(FormResponse.id))
+        .where(FormResponse.form_id.in_(list(form_ids)))
+        .group_by(FormResponse.form_id)
+    )
+    totals = dict(counts.all())
+    for form_id, count in archived_counts(form_ids).items():
+        totals[form_id] = totals.get(form_id, 0) + count
+    return totals
@@ -0,0 +1,181 @@
+import datetime
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+class _Call:
+    """A call in progress whose result is shared with concurrent duplicates"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class DatabaseLockBackend:
+    """Cross-worker lock stored in the generation_lock table of the app database"""
+
+    def __init__(self, app, lease: float = 60.0, wait_timeout: float = 30.0, poll_interval: float = 0.1):
+        """
+        Initialize the backend
+
+        Args:
+            app: Flask application whose database holds the lock table
+            lease: Seconds after which a lock left behind by a crashed worker is considered stale
+            wait_timeout: Maximum seconds to wait for another worker's lock
+            poll_interval: Seconds between lock checks while waiting
+        """
+        self.app = app
+        self.lease = lease
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+
+    def acquire(self, key: str) -> bool:
+        """
+        Try to take the lock for a key without waiting
+
+        Args:
+            key: Normalized prompt key
+
+        Returns:
+            True if this worker now holds the lock
+        """
+        from sqlalchemy.exc import IntegrityError
+        from app import db
+        from app.models import GenerationLock
+
+        table = GenerationLock.__table__
+        now = datetime.datetime.utcnow()
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.key == key, table.c.expires_at < now))
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(table.insert().values(
+                        key=key,
+                        owner=self.owner,
+                        expires_at=now + datetime.timedelta(seconds=self.lease)
+                    ))
+            except IntegrityError:
+                return False
+        return True
+
+    def release(self, key: str):
+        from app import db
+        from app.models import GenerationLock
+
+        table = GenerationLock.__table__
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.key == key, table.c.owner == self.owner))
+
+    def wait(self, key: str):
+        """Block until the lock for a key is released, expires or wait_timeout elapses"""
+        from app import db
+        from app.models import GenerationLock
+
+        table = GenerationLock.__table__
+        deadline = time.monotonic() + self.wait_timeout
+        with self.app.app_context():
+            while time.monotonic() < deadline:
+                with db.engine.connect() as conn:
+                    expires_at = conn.execute(
+                        table.select().with_only_columns(table.c.expires_at).where(table.c.key == key)
+                    ).scalar()
+                if expires_at is None or expires_at < datetime.datetime.utcnow():
+                    return
+                time.sleep(self.poll_interval)
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls so only the first one does the work"""
+
+    def __init__(self, lock_backend: Optional[DatabaseLockBackend] = None):
+        """
+        Initialize the coalescer
+
+        Args:
+            lock_backend: Optional cross-worker lock; without it calls are only coalesced within this process
+        """
+        self.lock_backend = lock_backend
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.collapsed = 0
+        self.collapsed_across_workers = 0
+
+    def do(self, key: str, fn: Callable[[], any], lookup: Optional[Callable[[], any]] = None):
+        """
+        Run fn once for all concurrent callers using the same key
+
+        Args:
+            key: Identifies duplicate calls (the normalized prompt key)
+            fn: Function performing the call
+            lookup: Returns a result stored by another worker (e.g. from the shared cache), or None
+
+        Returns:
+            The result of fn, shared with every concurrent caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.collapsed += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run(key, fn, lookup)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _run(self, key: str, fn: Callable[[], any], lookup: Optional[Callable[[], any]]):
+        if self.lock_backend is None:
+            return fn()
+
+        if not self.lock_backend.acquire(key):
+            self.lock_backend.wait(key)
+            if lookup is not None:
+                result = lookup()
+                if result is not None:
+                    with self._lock:
+                        self.collapsed_across_workers += 1
+                    return result
+            if not self.lock_backend.acquire(key):
+                return fn()
+
+        try:
+            return fn()
+        finally:
+            self.lock_backend.release(key)
+
+    def stats(self) -> Dict[str, int]:
+        """Return coalescing counters for the health endpoint"""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'collapsed': self.collapsed,
+                'collapsed_across_workers': self.collapsed_across_workers,
+                'in_flight': len(self._calls),
+                'shared': self.lock_backend is not None
+            }
@@ -0,0 +1,86 @@
+import secrets
+import string
+from typing import Sequence
+
+from sqlalchemy.exc import IntegrityError
+
+SLUG_ALPHABET = string.ascii_letters + string.digits
+SLUG_LENGTH = 8
+
+
+class SlugAllocationError(Exception):
+    """Raised when no unused slug was found within the allowed attempts"""
+
+
+def new_slug(length: int = SLUG_LENGTH) -> str:
+    """Return a random, unguessable base62 slug (about 47 bits of entropy at 8 characters)"""
+    return ''.join(secrets.choice(SLUG_ALPHABET) for _ in range(length))
+
+
+def _is_slug_conflict(error: IntegrityError) -> bool:
+    return 'url_slug' in str(error.orig)
+
+
+def insert_with_unique_slug(form, max_attempts: int = 5):
+    """
+    Insert a form under a fresh random slug, relying on the unique index instead of a pre-check
+
+    The insert is flushed inside a savepoint; if another worker already took the slug the
+    savepoint is rolled back and a new slug is drawn, leaving the rest of the caller's
+    transaction (e.g. other forms of a batch) intact. No query is spent looking slugs up.
+
+    Args:
+        form: Pending Form without a slug
+        max_attempts: Slugs tried before giving up
+
+    Returns:
+        The form, flushed with its slug and id
+
+    Raises:
+        SlugAllocationError: If every attempt collided
+    """
+    from app import db
+    from app.services.database import begin_write
+
+    begin_write(db.session)
+    for _ in range(max_attempts):
+        form.url_slug = new_slug()
+        try:
+            with db.session.begin_nested():
+                db.session.add(form)
+        except IntegrityError as e:
+            if not _is_slug_conflict(e):
+                raise
+            continue
+        return form
+    raise SlugAllocationError(f'No free slug after {max_attempts} attempts')
+
+
+def insert_with_unique_slugs(forms: Sequence, max_attempts: int = 5):
+    """
+    Insert many forms under fresh random slugs with one flush
+
+    All forms are flushed in a single savepoint; only if one of their slugs collides does
+    this fall back to insert_with_unique_slug for each form.
+
+    Args:
+        forms: Pending Forms without slugs
+        max_attempts: Slugs tried per form before giving up
+    """
+    from app import db
+    from app.services.database import begin_write
+
+    if not forms:
+        return
+    begin_write(db.session)
+    for form in forms:
+        form.url_slug = new_slug()
+    try:
+        with db.session.begin_nested():
+            db.session.add_all(forms)
+        return
+    except IntegrityError as e:
+        if not _is_slug_conflict(e):
+            raise
+    for form in forms:
+        insert_with_unique_slug(form, max_attempts)
@@ -0,0 +1,353 @@
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+FormFieldIds = namedtuple('FormFieldIds', ['form_id', 'field_ids', 'field_types', 'option_indexes'])
+
+
+class FieldIdCache:
+    """LRU/TTL cache mapping a form slug to its form id and ordered field ids"""
+
+    def __init__(self, max_entries: int = 1024, ttl: int = 300):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Maximum number of forms kept
+            ttl: Seconds an entry stays valid, bounding staleness in other workers
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, slug: str) -> Optional[FormFieldIds]:
+        """
+        Return the form id and field ids for a slug, loading them with a single query on a miss
+
+        Args:
+            slug: Public URL slug of the form
+
+        Returns:
+            Form id with its field ids, types and option lookups in display order, or None if no such form exists
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(slug)
+            if entry is not None and entry[0] >= now:
+                self._entries.move_to_end(slug)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = self._load(slug)
+        if value is not None:
+            with self._lock:
+                self._entries[slug] = (now + self.ttl, value)
+                self._entries.move_to_end(slug)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    @staticmethod
+    def _load(slug: str) -> Optional[FormFieldIds]:
+        from app import db
+        from app.models import Form, FormField
+        from app.services.answer_storage import option_indexes
+
+        rows = db.session.execute(
+            db.select(Form.id, FormField.id, FormField.field_type)
+            .outerjoin(FormField, FormField.form_id == Form.id)
+            .where(Form.url_slug == slug)
+            .order_by(FormField.id)
+        ).all()
+        if not rows:
+            return None
+        fields = [(field_id, field_type) for _, field_id, field_type in rows if field_id is not None]
+        field_ids = tuple(field_id for field_id, _ in fields)
+        field_types = tuple(field_type for _, field_type in fields)
+        return FormFieldIds(rows[0][0], field_ids, field_types, option_indexes(field_ids, field_types))
+
+    def invalidate(self, slug: Optional[str] = None, form_id: Optional[int] = None):
+        """Drop the entry for a slug or form id"""
+        with self._lock:
+            if slug is not None:
+                self._entries.pop(slug, None)
+            if form_id is not None:
+                for key in [k for k, (_, value) in self._entries.items() if value[0] == form_id]:
+                    del self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+def register_invalidation(cache: FieldIdCache):
+    """Invalidate cached field lists whenever a form or its fields change in this process"""
+    from sqlalchemy import event
+    from app.models import Form, FormField
+
+    def form_changed(mapper, connection, target):
+        cache.invalidate(slug=target.url_slug, form_id=target.id)
+
+    def field_changed(mapper, connection, target):
+        cache.invalidate(form_id=target.form_id)
+
+    for name in ('after_update', 'after_delete'):
+        event.listen(Form, name, form_changed)
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(FormField, name, field_changed)
+
+
+def _existing_forms(submissions: Sequence[tuple]) -> Dict[int, int]:
+    """
+    Open the write transaction and find which of the submissions' forms still exist
+
+    A form deleted by another worker may still be cached. The forms are locked against an
+    analytics backfill until the transaction ends.
+
+    Returns:
+        Mapping of existing form id to its analytics epoch
+    """
+    from app import db
+    from app.services.analytics import form_epochs
+    from app.services.database import begin_write
+
+    begin_write(db.session)
+    return form_epochs({submission[0] for submission in submissions})
+
+
+def _insert_responses(submissions: Sequence[tuple], on_insert: Optional[Callable[[Sequence[tuple]], None]] = None):
+    from flask import current_app
+    from app import db
+    from app.models import FormResponse, ResponseAnswer
+    from app.services.answer_storage import encode
+
+    mode = current_app.config['RESPONSE_STORAGE_MODE']
+    max_packed_length = current_app.config['RESPONSE_PACKED_MAX_LENGTH']
+    response_table = FormResponse.__table__
+    answer_rows = []
+    for form_id, field_ids, values, timestamp, field_types, indexes in submissions:
+        packed, rows = encode(field_ids, values, field_types, indexes, mode, max_packed_length)
+        result = db.session.execute(
+            response_table.insert().values(form_id=form_id, timestamp=timestamp, packed=packed)
+        )
+        response_id = result.inserted_primary_key[0]
+        answer_rows.extend(dict(row, response_id=response_id) for row in rows)
+    if answer_rows:
+        db.session.execute(ResponseAnswer.__table__.insert(), answer_rows)
+    if on_insert is not None:
+        on_insert(submissions)
+
+
+def record_response(fields: FormFieldIds, values: Sequence[Optional[str]],
+                    on_insert: Optional[Callable[[Sequence[tuple]], None]] = None,
+                    on_commit: Optional[Callable[[Sequence[tuple], Dict[int, int]], None]] = None) -> bool:
+    """
+    Store one submission with a single bulk insert for its answers and commit
+
+    Args:
+        fields: Form and field ids returned by FieldIdCache.get
+        values: Submitted values, aligned with fields.field_ids
+        on_insert: Optional hook run in the same transaction with the
+            (form_id, field_ids, values, timestamp, field_types, option_indexes) tuples written
+        on_commit: Optional hook run after the commit with the same tuples and the forms'
+            analytics epochs, e.g. AggregateBuffer.add
+
+    Returns:
+        False if the form no longer exists
+    """
+    from app import db
+
+    submission = (fields.form_id, fields.field_ids, values, datetime.datetime.utcnow(), fields.field_types,
+                  fields.option_indexes)
+    epochs = _existing_forms([submission])
+    if not epochs:
+        db.session.rollback()
+        return False
+    _insert_responses([submission], on_insert)
+    db.session.commit()
+    if on_commit is not None:
+        on_commit([submission], epochs)
+    return True
+
+
+class WriteBehindBuffer:
+    """Batches submissions from many requests into one transaction with bounded flush latency"""
+
+    def __init__(self, app, max_batch: int = 200, max_latency: float = 0.05, max_queued: int = 10000,
+                 on_insert: Optional[Callable[[Sequence[tuple]], None]] = None,
+                 field_cache: Optional[FieldIdCache] = None, dead_letter_path: Optional[str] = None):
+        """
+        Initialize the buffer; its flush thread starts with start() or the first submission
+
+        Args:
+            app: Flask application, used to open an app context in the flush thread
+            max_batch: Maximum submissions written per transaction
+            max_latency: Maximum seconds a submission waits before being flushed
+            max_queued: Submissions buffered before submit blocks the caller
+            on_insert: Optional hook run in each batch's transaction, see record_response
+            field_cache: Cache whose entries are dropped when a flush finds their form deleted
+            dead_letter_path: JSON Lines file receiving submissions that cannot be written; None only logs them
+        """
+        self.app = app
+        self.on_insert = on_insert
+        self.field_cache = field_cache
+        self.dead_letter_path = dead_letter_path
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self.flushed = 0
+        self.batches = 0
+        self.failed = 0
+        self.retried = 0
+        self.orphaned = 0
+        self._thread = None
+
+    def start(self):
+        """Start the flush thread"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='response-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, fields: FormFieldIds, values: Sequence[Optional[str]]):
+        """Queue a submission; it is committed within max_latency seconds"""
+        self.start()
+        self._queue.put((fields.form_id, fields.field_ids, list(values), datetime.datetime.utcnow(),
+                         fields.field_types, fields.option_indexes))
+
+    def _run(self):
+        while not self._stopped.is_set() or not self._queue.empty():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch: List[tuple]):
+        """
+        Write a batch in one transaction
+
+        Submissions were acknowledged when queued, so a failing batch is not dropped: it is
+        retried one submission per transaction and only the submissions that fail again go to
+        the dead-letter file. Submissions to forms deleted meanwhile are dropped.
+        """
+        from app import db
+
+        with self.app.app_context():
+            try:
+                existing = _existing_forms(batch)
+                orphans = [submission for submission in batch if submission[0] not in existing]
+                if orphans:
+                    self._drop_orphans(orphans)
+                    batch = [submission for submission in batch if submission[0] in existing]
+                if not batch:
+                    return
+                try:
+                    _insert_responses(batch, self.on_insert)
+                    db.session.commit()
+                    with self._lock:
+                        self.flushed += len(batch)
+                        self.batches += 1
+                    return
+                except Exception:
+                    db.session.rollback()
+                    logger.warning('Failed to write %d buffered responses at once; retrying them one by one',
+                                   len(batch), exc_info=True)
+
+                with self._lock:
+                    self.retried += len(batch)
+                for submission in batch:
+                    try:
+                        if not _existing_forms([submission]):
+                            db.session.rollback()
+                            self._drop_orphans([submission])
+                            continue
+                        _insert_responses([submission], self.on_insert)
+                        db.session.commit()
+                        with self._lock:
+                            self.flushed += 1
+                    except Exception as e:
+                        db.session.rollback()
+                        self._dead_letter(submission, e)
+                with self._lock:
+                    self.batches += 1
+            except Exception:
+                # The database is unreachable: nothing in the batch could be written
+                db.session.rollback()
+                logger.exception('Failed to write %d buffered responses', len(batch))
+                for submission in batch:
+                    self._dead_letter(submission, None)
+            finally:
+                db.session.remove()
+
+    def _drop_orphans(self, orphans: List[tuple]):
+        form_ids = sorted({submission[0] for submission in orphans})
+        if self.field_cache is not None:
+            for form_id in form_ids:
+                self.field_cache.invalidate(form_id=form_id)
+        with self._lock:
+            self.orphaned += len(orphans)
+        logger.warning('Dropped %d buffered responses to deleted forms %s', len(orphans), form_ids)
+
+    def _dead_letter(self, submission: tuple, error: Optional[Exception]):
+        with self._lock:
+            self.failed += 1
+        form_id, field_ids, values, timestamp, _, _ = submission
+        record = {'form_id': form_id, 'field_ids': list(field_ids), 'values': list(values),
+                  'timestamp': timestamp.isoformat(), 'error': str(error) if error is not None else None}
+        logger.error('Could not write a buffered response to form %s: %s', form_id, error)
+        if self.dead_letter_path is None:
+            logger.error('Lost response: %s', json.dumps(record))
+            return
+        try:
+            directory = os.path.dirname(self.dead_letter_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._lock, open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+        except OSError:
+            logger.exception('Lost response: %s', json.dumps(record))
+
+    def close(self, timeout: float = 5.0):
+        """Stop accepting work and flush everything still queued"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'flushed': self.flushed,
+                'batches': self.batches,
+                'retried': self.retried,
+                'failed': self.failed,
+                'orphaned': self.orphaned
+            }
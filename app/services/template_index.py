@@ -0,0 +1,277 @@
+import datetime
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional
+
+from .answer_storage import stored_options
+
+logger = logging.getLogger(__name__)
+
+TemplateMatch = namedtuple('TemplateMatch', ['form_id', 'score', 'fields'])
+
+# Overlap of consecutive syncs, covering clock skew between workers and uncommitted writes
+SYNC_OVERLAP = datetime.timedelta(seconds=60)
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+# Words that say "this is a form" and carry no meaning for matching
+STOP_WORDS = frozenset((
+    'a', 'an', 'and', 'the', 'for', 'of', 'to', 'with', 'in', 'on', 'my', 'our', 'i', 'need', 'want',
+    'create', 'make', 'build', 'form', 'forms', 'survey', 'questionnaire', 'please'
+))
+
+
+def _tokens(text: str) -> List[str]:
+    words = [word for word in _WORD.findall(text.lower()) if word not in STOP_WORDS]
+    grams = list(words)
+    for word in words:
+        padded = f'#{word}#'
+        grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _bucket(token: str, dimensions: int) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=4).digest(), 'little') % dimensions
+
+
+def _stored_fields(rows) -> List[Dict[str, any]]:
+    """Convert FormField rows to the field dictionaries returned by GeminiService.parse_fields"""
+    return [
+        {
+            'label': row.label or '',
+            'description': '',
+            'type': row.field_type or 'text',
+            'validation': 'required' if row.required else '',
+            'options': [option for option in stored_options(row.options) if option]
+        }
+        for row in rows
+    ]
+
+
+class TemplateIndex:
+    """
+    In-memory similarity index over finalized forms, used to reuse a field set for similar prompts
+
+    Forms are indexed per owner and a prompt is only matched against its author's own forms,
+    so one user's forms are never handed to another. The index is kept up to date on a
+    background thread: forms changed in this process are re-vectorized on the next lookup,
+    and every refresh_interval the forms updated by other workers are picked up and deleted
+    ones dropped. Lookups never wait for a sync; until the first one completes they miss.
+    """
+
+    def __init__(self, app, threshold: float = 0.75, dimensions: int = 4096, refresh_interval: int = 300,
+                 max_forms: int = 20000):
+        """
+        Initialize the index; it is built from the database on first use
+
+        Args:
+            app: Flask application, used to open an app context when syncing
+            threshold: Minimum cosine similarity for a prompt to reuse a stored form
+            dimensions: Size of the hashed word and character trigram vectors
+            refresh_interval: Seconds between syncs with changes made by other workers
+            max_forms: Most recent forms indexed
+        """
+        self.app = app
+        self.threshold = threshold
+        self.dimensions = dimensions
+        self.refresh_interval = refresh_interval
+        self.max_forms = max_forms
+        self._entries = {}  # user id -> {form id: (title vector, content vector, fields)}
+        self._owners = {}  # form id -> user id
+        self._matrices = {}  # user id -> (form ids, title matrix, content matrix)
+        self._pending = set()
+        self._synced_at = None
+        self._checked_at = None
+        self._syncing = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def vectorize(self, text: str):
+        """
+        Embed text as an L2-normalized, TF-weighted vector of hashed words and character trigrams
+
+        Args:
+            text: Prompt or form description
+
+        Returns:
+            numpy vector of length dimensions
+        """
+        import numpy as np
+
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in _tokens(text):
+            vector[_bucket(token, self.dimensions)] += 1.0
+        np.log1p(vector, out=vector)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def mark_stale(self, form_ids: Iterable[int]):
+        """Re-index these forms on the next lookup, e.g. after they were finalized, edited or deleted"""
+        with self._lock:
+            self._pending.update(form_id for form_id in form_ids if form_id is not None)
+
+    def sync(self) -> int:
+        """
+        Bring the index up to date with the database
+
+        The first sync indexes the most recent max_forms forms; later ones only re-vectorize
+        forms changed in this process or updated since the previous sync, and drop deleted ones.
+
+        Returns:
+            Number of forms (re)indexed
+        """
+        from app import db
+        from app.models import Form, FormField
+
+        started = datetime.datetime.utcnow()
+        with self._lock:
+            pending, self._pending = self._pending, set()
+            since = self._synced_at
+        full_check = since is None or time.monotonic() - (self._checked_at or 0) > self.refresh_interval
+
+        with self.app.app_context():
+            query = db.select(Form.id, Form.user_id, Form.title, Form.description)
+            if since is None:
+                query = query.order_by(Form.id.desc()).limit(self.max_forms)
+            else:
+                changed = Form.updated_at >= since - SYNC_OVERLAP if full_check else db.false()
+                query = query.where(db.or_(Form.id.in_(pending), changed))
+            forms = [form for form in db.session.execute(query).all() if form.user_id is not None]
+            fields = {}
+            if forms:
+                for row in db.session.execute(
+                        db.select(FormField.form_id, FormField.label, FormField.field_type,
+                                  FormField.options, FormField.required)
+                        .where(FormField.form_id.in_([form.id for form in forms]))
+                        .order_by(FormField.id)):
+                    fields.setdefault(row.form_id, []).append(row)
+            live = None
+            if full_check and since is not None:
+                live = set(db.session.execute(
+                    db.select(Form.id).order_by(Form.id.desc()).limit(self.max_forms)).scalars())
+            db.session.remove()
+
+        entries = {}
+        for form in forms:
+            rows = fields.get(form.id)
+            if not rows:
+                continue
+            heading = ' '.join(part for part in (form.title, form.description) if part)
+            entries[form.id] = (form.user_id, self.vectorize(heading),
+                                self.vectorize(' '.join([heading] + [row.label or '' for row in rows])),
+                                _stored_fields(rows))
+
+        with self._lock:
+            removed = set(pending) | {form.id for form in forms}
+            if live is not None:
+                removed |= set(self._owners) - live
+            changed_users = set()
+            for form_id in removed:
+                user_id = self._owners.pop(form_id, None)
+                if user_id is not None:
+                    self._entries[user_id].pop(form_id, None)
+                    changed_users.add(user_id)
+            for form_id, (user_id, title, content, stored) in entries.items():
+                self._entries.setdefault(user_id, {})[form_id] = (title, content, stored)
+                self._owners[form_id] = user_id
+                changed_users.add(user_id)
+            for user_id in changed_users:
+                self._rebuild_matrix(user_id)
+            self._synced_at = started
+            if full_check:
+                self._checked_at = time.monotonic()
+        return len(entries)
+
+    def _rebuild_matrix(self, user_id: int):
+        import numpy as np
+
+        forms = self._entries.get(user_id)
+        if not forms:
+            self._entries.pop(user_id, None)
+            self._matrices.pop(user_id, None)
+            return
+        form_ids = list(forms)
+        self._matrices[user_id] = (form_ids, np.stack([forms[f][0] for f in form_ids]),
+                                   np.stack([forms[f][1] for f in form_ids]))
+
+    def _ensure_fresh(self):
+        with self._lock:
+            expired = self._synced_at is None or time.monotonic() - (self._checked_at or 0) > self.refresh_interval
+            if self._syncing or not (self._pending or expired):
+                return
+            self._syncing = True
+
+        def run():
+            try:
+                self.sync()
+            except Exception:
+                logger.exception('Failed to sync template index')
+                with self._lock:
+                    self._checked_at = time.monotonic()
+            finally:
+                with self._lock:
+                    self._syncing = False
+
+        threading.Thread(target=run, name='template-index-sync', daemon=True).start()
+
+    def match(self, prompt: str, user_id: Optional[int]) -> Optional[TemplateMatch]:
+        """
+        Find the form of user_id most similar to a prompt
+
+        A prompt is compared with each form's title and description, and with those plus its
+        field labels, so both "staff feedback survey" and "form with name, email and phone"
+        can match; the higher similarity counts.
+
+        Args:
+            prompt: User's description of the form needed
+            user_id: Id of the requesting user; anonymous prompts (None) never match
+
+        Returns:
+            The best match if its similarity clears the threshold, otherwise None
+        """
+        import numpy as np
+
+        self._ensure_fresh()
+        with self._lock:
+            matrices = self._matrices.get(user_id) if user_id is not None else None
+            if matrices is None:
+                self.misses += 1
+                return None
+            form_ids, titles, contents = matrices
+
+        query = self.vectorize(prompt)
+        scores = np.maximum(titles @ query, contents @ query)
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        with self._lock:
+            if score < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            fields = self._entries.get(user_id, {}).get(form_ids[best], (None, None, []))[2]
+        return TemplateMatch(form_ids[best], round(score, 4), [dict(field) for field in fields])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._owners), 'users': len(self._matrices)}
+
+
+def register_staleness(index: TemplateIndex):
+    """Queue a form for re-indexing whenever it or its fields change in this process"""
+    from sqlalchemy import event
+    from app.models import Form, FormField
+
+    def form_changed(mapper, connection, target):
+        index.mark_stale([target.id])
+
+    def field_changed(mapper, connection, target):
+        index.mark_stale([target.form_id])
+
+    for model, listener in ((Form, form_changed), (FormField, field_changed)):
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, name, listener)
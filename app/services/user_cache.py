@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from flask import has_request_context, session
+from flask_login import UserMixin
+
+SESSION_KEY = '_user_claims'
+
+
+class UserSnapshot(UserMixin):
+    """Detached, read-only stand-in for a User row, enough for current_user checks"""
+
+    def __init__(self, id: int, email: str):
+        self.id = id
+        self.email = email
+
+    def __repr__(self):
+        return '<User {}>'.format(self.email)
+
+
+class UserCache:
+    """
+    LRU/TTL cache of user snapshots behind Flask-Login's user_loader
+
+    Optionally the snapshot is also carried as claims in the signed session cookie, so an
+    authenticated request needs neither a query nor a cache entry in the worker serving it.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: int = 300, session_claims: bool = False,
+                 claims_ttl: int = 900):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Maximum number of users kept
+            ttl: Seconds an entry stays valid, bounding staleness in other workers
+            session_claims: Store the user's id and email in the session and trust them until claims_ttl
+            claims_ttl: Seconds session claims are trusted before the user is loaded again
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.session_claims = session_claims
+        self.claims_ttl = claims_ttl
+        self._entries = OrderedDict()
+        self._revoked = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.claim_hits = 0
+        self.misses = 0
+
+    def load(self, user_id: int) -> Optional[UserSnapshot]:
+        """
+        Return the snapshot of a user from the session claims, the cache or the database
+
+        Args:
+            user_id: Id stored in the session by Flask-Login
+
+        Returns:
+            User snapshot, or None if no such user exists
+        """
+        snapshot = self._from_claims(user_id)
+        if snapshot is not None:
+            return snapshot
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] >= now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                snapshot = entry[1]
+            else:
+                self.misses += 1
+
+        if snapshot is None:
+            snapshot = self._load(user_id)
+            if snapshot is None:
+                return None
+            with self._lock:
+                self._entries[user_id] = (now + self.ttl, snapshot)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        if self.session_claims and has_request_context():
+            session[SESSION_KEY] = {'id': snapshot.id, 'email': snapshot.email, 'iat': time.time()}
+        return snapshot
+
+    def _from_claims(self, user_id: int) -> Optional[UserSnapshot]:
+        if not self.session_claims or not has_request_context():
+            return None
+        claims = session.get(SESSION_KEY)
+        if not claims or claims.get('id') != user_id:
+            return None
+        issued = claims.get('iat', 0)
+        with self._lock:
+            if time.time() - issued > self.claims_ttl or issued <= self._revoked.get(user_id, 0):
+                return None
+            self.claim_hits += 1
+        return UserSnapshot(user_id, claims.get('email'))
+
+    @staticmethod
+    def _load(user_id: int) -> Optional[UserSnapshot]:
+        from app import db
+        from app.models import User
+
+        row = db.session.execute(db.select(User.id, User.email).where(User.id == user_id)).first()
+        return UserSnapshot(row.id, row.email) if row else None
+
+    def invalidate(self, user_id: int):
+        """Drop the cached snapshot of a user and reject session claims issued before now"""
+        now = time.time()
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._revoked[user_id] = now
+            for key in [k for k, revoked in self._revoked.items() if now - revoked > self.claims_ttl]:
+                del self._revoked[key]
+        if self.session_claims and has_request_context():
+            claims = session.get(SESSION_KEY)
+            if claims and claims.get('id') == user_id:
+                session.pop(SESSION_KEY)
+
+    @staticmethod
+    def clear_session():
+        """Forget the claims of the current session, e.g. on logout"""
+        if has_request_context():
+            session.pop(SESSION_KEY, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'claim_hits': self.claim_hits,
+                'misses': self.misses
+            }
+
+
+def register_invalidation(cache: UserCache):
+    """Invalidate a user's snapshot whenever their email or password changes (or they are deleted) in this process"""
+    from flask_login import user_logged_out
+    from sqlalchemy import event, inspect
+    from app.models import User
+
+    def user_changed(mapper, connection, target):
+        state = inspect(target)
+        if state.attrs.email.history.has_changes() or state.attrs.password_hash.history.has_changes():
+            cache.invalidate(target.id)
+
+    def user_deleted(mapper, connection, target):
+        cache.invalidate(target.id)
+
+    event.listen(User, 'after_update', user_changed)
+    event.listen(User, 'after_delete', user_deleted)
+    user_logged_out.connect(lambda sender, user=None, **extra: cache.clear_session(), weak=False)
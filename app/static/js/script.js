@@ -152,6 +152,11 @@ async function generateFormFields() {
         if (formContextData.purpose) enhancedPrompt += `\nPurpose: ${formContextData.purpose}`;
         if (formContextData.targetAudience) enhancedPrompt += `\nTarget Audience: ${formContextData.targetAudience}`;
         
+        if (window.ReadableStream && window.TextDecoder) {
+            await streamFormFields(enhancedPrompt);
+            return;
+        }
+
         const response = await fetch('/generate', {
             method: 'POST',
             headers: {
@@ -183,13 +188,150 @@ async function generateFormFields() {
     }
 }
 
+/**
+ * Generate fields through the streaming endpoint, rendering each field as it arrives
+ */
+async function streamFormFields(enhancedPrompt) {
+    const response = await fetch('/generate/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ prompt: enhancedPrompt })
+    });
+
+    if (!response.ok) {
+        let data = {};
+        try {
+            data = await response.json();
+        } catch(jsonErr) {
+            // Non-JSON error body
+        }
+        showError(data.error || 'An error occurred while generating fields');
+        return;
+    }
+
+    fieldsContainer.innerHTML = '';
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let finished = false;
+
+    while (!finished) {
+        const { value, done } = await reader.read();
+        if (done) {
+            buffer += decoder.decode();
+        } else {
+            buffer += decoder.decode(value, { stream: true });
+        }
+
+        const lines = buffer.split('\n');
+        buffer = done ? '' : lines.pop();
+
+        for (const line of lines) {
+            if (!line.trim()) continue;
+            finished = handleStreamEvent(JSON.parse(line)) || finished;
+        }
+
+        if (done) break;
+    }
+}
+
+/**
+ * Handle one event from /generate/stream; returns true once the stream is finished
+ */
+function handleStreamEvent(event) {
+    if (event.event === 'field') {
+        const field = serverFieldToClient(event.field, fieldsData.length + 1);
+        fieldsData.push(field);
+        fieldsContainer.appendChild(createFieldElement(field, fieldsData.length - 1));
+        if (fieldsData.length === 1) {
+            resultSection.style.display = 'block';
+            resultSection.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
+        }
+        return false;
+    }
+
+    if (event.event === 'done') {
+        if (fieldsData.length === 0) {
+            showError('No fields could be parsed from the response');
+        } else {
+            displayFields();
+        }
+        rawResponse.textContent = typeof event.raw_response === 'string' ? event.raw_response : '';
+        return true;
+    }
+
+    if (event.event === 'error') {
+        showError(event.error || 'An error occurred while generating fields');
+        return true;
+    }
+
+    return false;
+}
+
+/**
+ * Split editor option text into option values, keeping commas inside "quotes"
+ * (mirrors field_parser.parse_options on the server)
+ */
+function parseOptions(text) {
+    const options = [];
+    let current = '';
+    let closingQuote = null;
+    for (const char of (text || '').trim().replace(/^\[(.*)\]$/, '$1')) {
+        if (closingQuote) {
+            if (char === closingQuote) closingQuote = null;
+            else current += char;
+        } else if (char === '"' || char === '“') {
+            closingQuote = char === '"' ? '"' : '”';
+        } else if (char === ',') {
+            options.push(current.trim());
+            current = '';
+        } else {
+            current += char;
+        }
+    }
+    if (closingQuote) {
+        // Unbalanced quote: fall back to a plain split rather than swallowing the rest
+        return (text || '').split(',').map(opt => opt.trim()).filter(opt => opt);
+    }
+    options.push(current.trim());
+    return options.filter(opt => opt);
+}
+
+/**
+ * Join option values into editor text, quoting options that contain a comma
+ * (mirrors field_parser.format_options on the server)
+ */
+function formatOptions(options) {
+    return options.map(opt => {
+        if (!/[,\[\]"“”]/.test(opt)) return opt;
+        return opt.includes('"') ? `“${opt}”` : `"${opt}"`;
+    }).join(', ');
+}
+
+/**
+ * Convert a field parsed by the server into the shape used by the editor
+ */
+function serverFieldToClient(field, number) {
+    return {
+        number: String(number),
+        label: field.label || '',
+        description: field.description || '',
+        dataType: field.type || '',
+        validation: field.validation || '',
+        enumValues: Array.isArray(field.options) ? formatOptions(field.options) : (field.options || ''),
+        selected: true
+    };
+}
+
 /**
  * Parse the response and display fields
  */
 function parseAndDisplayFields(fields, rawText) {
-    // If fields is already an array (from structured backend), use directly
+    // If fields is already an array (parsed by the backend), convert it to the editor's shape
     if (Array.isArray(fields)) {
-        fieldsData = fields;
+        fieldsData = fields.map((field, index) => serverFieldToClient(field, index + 1));
     } else if (typeof fields === 'string') {
         fieldsData = parseFields(fields);
     } else {
@@ -302,7 +444,7 @@ function renderFormPreview() {
         switch (field.dataType && field.dataType.toLowerCase()) {
             case 'select':
                 inputElement = document.createElement('select');
-                const options = (field.enumValues || '').split(',').map(opt => opt.trim());
+                const options = parseOptions(field.enumValues);
                 options.forEach(opt => {
                     const option = document.createElement('option');
                     option.value = opt;
@@ -363,7 +505,7 @@ async function finalizeForm() {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
-                fields: selectedFields,
+                fields: selectedFields.map(field => ({ ...field, options: parseOptions(field.enumValues) })),
                 theme: theme,
                 title: title
             })
@@ -0,0 +1,124 @@
+"""
+Benchmark the response storage modes.
+
+Usage:
+    python -m benchmarks.answer_storage [--responses N] [--batch N]
+
+For each of RESPONSE_STORAGE_MODE rows, compact and packed, a fresh SQLite database
+receives N submissions of a typical form (text, email, select, radio, number and
+textarea fields) through the same bulk insert path as the write-behind buffer. It
+reports the insert rate, the ResponseAnswer row count, the on-disk size of the
+response tables and checks that the read path returns the submitted values.
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+
+FIELDS = [
+    ('Full Name', 'text', None),
+    ('Email', 'email', None),
+    ('Country', 'select', 'United States, Canada, United Kingdom, Germany, India, Brazil, Japan'),
+    ('Satisfaction', 'radio', 'Very satisfied, Satisfied, Neutral, Dissatisfied, Very dissatisfied'),
+    ('Age', 'number', None),
+    ('Comments', 'textarea', None),
+]
+RESPONSE_TABLES = ('form_response', 'response_answer')
+
+
+def submission(rng, index):
+    return [
+        f'Respondent {index}',
+        f'respondent{index}@example.com',
+        rng.choice(FIELDS[2][2].split(', ')),
+        rng.choice(FIELDS[3][2].split(', ')),
+        str(rng.randint(18, 90)),
+        'Great experience overall. ' * rng.randint(0, 12),
+    ]
+
+
+def table_bytes(db):
+    try:
+        rows = db.session.execute(db.text(
+            "SELECT name, SUM(pgsize) FROM dbstat WHERE name IN ('form_response', 'response_answer') "
+            "OR name IN (SELECT name FROM sqlite_master WHERE tbl_name IN ('form_response', 'response_answer')) "
+            "GROUP BY name"
+        )).all()
+        return sum(size for _, size in rows)
+    except Exception:
+        return None
+
+
+def run(mode, responses, batch):
+    path = tempfile.mktemp(suffix='.db')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+        GEMINI_API_KEY = None
+        RESPONSE_STORAGE_MODE = mode
+        ANALYTICS_ENABLED = False
+        FORM_CACHE_ENABLED = False
+
+    from app import create_app, db
+    from app.models import Form, FormField
+    from app.services.answer_storage import field_choices
+    from app.services.responses import responses_page
+    from app.services.submissions import FieldIdCache, _insert_responses
+
+    app = create_app(BenchConfig)
+    rng = random.Random(0)
+    with app.app_context():
+        db.create_all()
+        form = Form(title='Customer survey', url_slug='bench')
+        db.session.add(form)
+        for label, field_type, options in FIELDS:
+            field = FormField(label=label, field_type=field_type, options=options, form=form)
+            field.choices = field_choices(field)
+            db.session.add(field)
+        db.session.commit()
+
+        fields = FieldIdCache().get('bench')
+        submitted = [submission(rng, i) for i in range(responses)]
+        start = time.perf_counter()
+        for offset in range(0, responses, batch):
+            _insert_responses([
+                (fields.form_id, fields.field_ids, values, datetime.datetime.utcnow(), fields.field_types,
+                 fields.option_indexes)
+                for values in submitted[offset:offset + batch]
+            ])
+            db.session.commit()
+        elapsed = time.perf_counter() - start
+
+        rows, _ = responses_page(fields.form_id, fields.field_ids, limit=len(submitted))
+        assert [row['values'] for row in rows] == submitted, f'{mode}: read path returned different values'
+
+        answer_rows = db.session.execute(db.text('SELECT COUNT(*) FROM response_answer')).scalar()
+        size = table_bytes(db)
+        db.session.remove()
+    db_size = os.path.getsize(path)
+    os.remove(path)
+    return responses / elapsed, answer_rows, size, db_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--responses', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=200)
+    args = parser.parse_args()
+
+    for mode in ('rows', 'compact', 'packed'):
+        rate, answer_rows, size, db_size = run(mode, args.responses, args.batch)
+        tables = f'{size / 1024:,.0f} KiB' if size is not None else 'n/a (no dbstat)'
+        print(f'{mode:>8}: {rate:,.0f} responses/s, {answer_rows:,} answer rows, '
+              f'response tables {tables}, database {db_size / 1024:,.0f} KiB')
+
+
+if __name__ == '__main__':
+    main()
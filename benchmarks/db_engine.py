@@ -0,0 +1,128 @@
+"""
+Benchmark database engine settings under concurrent form submissions.
+
+Usage:
+    python -m benchmarks.db_engine [--writers N] [--readers N] [--submissions N] [--database-url URL]
+
+Without --database-url each profile runs against a fresh SQLite file:
+
+  * sqlite-default: rollback journal and synchronous=FULL, SQLite's own defaults
+  * sqlite-tuned: the shipped defaults (WAL, synchronous=NORMAL, busy timeout)
+
+With a PostgreSQL --database-url the profiles compare pool sizes instead (the schema
+is created in that database and its tables are dropped afterwards, so point it at a
+scratch database). Writer threads post view_form submissions while reader threads
+load the public form page with the page cache off, so every view reads the database.
+The script reports submissions per second, reader p95 latency and failed requests
+per profile.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+
+SQLITE_PROFILES = {
+    'sqlite-default': {'SQLITE_WAL': False, 'SQLITE_SYNCHRONOUS': 'FULL'},
+    'sqlite-tuned': {},
+}
+POSTGRES_PROFILES = {
+    'pool-5': {'DB_POOL_SIZE': 5, 'DB_MAX_OVERFLOW': 0},
+    'pool-10+5': {},
+    'no-pre-ping': {'DB_POOL_PRE_PING': False},
+}
+
+
+def run_profile(url, overrides, args):
+    settings = dict(overrides, SQLALCHEMY_DATABASE_URI=url, GEMINI_API_KEY=None, GEMINI_FAKE=False,
+                    RESPONSE_WRITE_BEHIND=False, FORM_CACHE_ENABLED=False)
+    config = type('BenchConfig', (Config,), settings)
+
+    from app import create_app, db
+    from app.models import Form, FormField
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+        form = Form(title='Engine benchmark', url_slug=f'eng{os.getpid() % 10000}')
+        db.session.add(form)
+        fields = [FormField(label=f'Question {i}', field_type='text', form=form) for i in range(6)]
+        db.session.add_all(fields)
+        db.session.commit()
+        slug, field_ids = form.url_slug, [field.id for field in fields]
+
+    failures = 0
+    read_latencies = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def writer(count):
+        nonlocal failures
+        client = app.test_client()
+        for i in range(count):
+            response = client.post(f'/form/{slug}', data={f'field-{f}': f'value {i}' for f in field_ids})
+            if response.status_code != 200:
+                with lock:
+                    failures += 1
+
+    def reader():
+        nonlocal failures
+        client = app.test_client()
+        while not done.is_set():
+            started = time.perf_counter()
+            response = client.get(f'/form/{slug}')
+            with lock:
+                read_latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    failures += 1
+
+    per_writer = args.submissions // args.writers
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.writers + args.readers) as pool:
+        readers = [pool.submit(reader) for _ in range(args.readers)]
+        for future in [pool.submit(writer, per_writer) for _ in range(args.writers)]:
+            future.result()
+        done.set()
+        for future in readers:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        db.drop_all()
+        db.engine.dispose()
+
+    read_latencies.sort()
+    p95 = read_latencies[int(len(read_latencies) * 0.95)] * 1000 if read_latencies else 0.0
+    return per_writer * args.writers / elapsed, p95, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--submissions', type=int, default=2000)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    if args.database_url:
+        profiles = [(name, args.database_url, overrides) for name, overrides in POSTGRES_PROFILES.items()]
+    else:
+        profiles = [(name, 'sqlite:///' + tempfile.mktemp(suffix='.db'), overrides)
+                    for name, overrides in SQLITE_PROFILES.items()]
+
+    for name, url, overrides in profiles:
+        rate, p95, failures = run_profile(url, overrides, args)
+        print(f'{name:>15}: {rate:,.0f} submissions/s, reader p95 {p95:.1f} ms, {failures} failed requests')
+        if url.startswith('sqlite:///'):
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(url[len('sqlite:///'):] + suffix):
+                    os.remove(url[len('sqlite:///'):] + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""
+Load test the full application against the local fake Gemini backend.
+
+Usage:
+    python -m benchmarks.loadtest [--scale N] [--concurrency N] [--latency S] [--error-rate P]
+                                  [--save-baseline PATH] [--compare PATH] [--tolerance F]
+
+The app is built with create_app and GEMINI_FAKE=1 on a fresh SQLite database and
+driven in-process through Flask test clients, one per simulated user thread. The
+scenarios run in order:
+
+  * generate: /generate with a mix of repeated and unique prompts
+  * finalize: /finalize_form of the generated fields
+  * submit: view_form submissions spread over the finalized forms
+  * responses: /form/<id>/responses and the JSON API on a form holding --large-form responses
+  * dashboard: /dashboard of a user owning all the forms
+
+Each scenario reports requests, errors, throughput and p50/p95/p99 latency. With
+--save-baseline the results are written as JSON; with --compare the run fails
+(exit status 1) when a scenario's p95 latency or throughput is more than
+--tolerance worse than the baseline.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+
+PROMPTS = [
+    'customer feedback form', 'job application', 'event registration with dietary requirements',
+    'employee onboarding checklist', 'contact form for a dental clinic', 'newsletter signup',
+    'product return request', 'volunteer signup', 'course evaluation', 'bug report form'
+]
+EMAIL = 'loadtest@example.com'
+PASSWORD = 'loadtest'
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not samples:
+        return None
+    index = max(0, min(len(samples) - 1, int(round(fraction * len(samples) + 0.5)) - 1))
+    return samples[index]
+
+
+class Scenario:
+    """Collects latencies and failures of one scenario's requests"""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, started, ok):
+        latency = time.perf_counter() - started
+        with self._lock:
+            self.latencies.append(latency)
+            if not ok:
+                self.errors += 1
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        return {
+            'requests': len(latencies),
+            'errors': self.errors,
+            'throughput': len(latencies) / self.elapsed if self.elapsed else 0.0,
+            'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else None,
+            'p95_ms': percentile(latencies, 0.95) * 1000 if latencies else None,
+            'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None
+        }
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.path = tempfile.mktemp(suffix='.db')
+
+        class LoadTestConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + self.path
+            GEMINI_API_KEY = None
+            GEMINI_FAKE = True
+            GEMINI_FAKE_LATENCY = args.latency
+            GEMINI_FAKE_ERROR_RATE = args.error_rate
+            GEMINI_CACHE_SQLITE_PATH = None
+            GEMINI_RATE_LIMIT_RPM = 1e9
+            GEMINI_RATE_LIMIT_BURST = 1000000
+            GENERATION_MAX_PENDING = max(Config.GENERATION_MAX_PENDING, args.concurrency * 2)
+            PROFILER_ENABLED = False
+
+        from app import create_app, db
+        self.db = db
+        self.app = create_app(LoadTestConfig)
+        with self.app.app_context():
+            db.create_all()
+            from app.models import User
+            user = User(email=EMAIL)
+            user.set_password(PASSWORD)
+            db.session.add(user)
+            db.session.commit()
+        self.rng = random.Random(args.seed)
+        self.local = threading.local()
+        self.generated = []
+        self.slugs = []
+
+    def client(self):
+        """Logged-in test client of the current thread; logging in is not part of any measurement"""
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+            client.post('/login', data={'email': EMAIL, 'password': PASSWORD})
+        return client
+
+    def run(self, scenario, tasks):
+        """Run the task callables on --concurrency threads and time the whole scenario"""
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            for future in [pool.submit(task, scenario) for task in tasks]:
+                future.result()
+        scenario.elapsed = time.perf_counter() - started
+        return scenario
+
+    def generate(self, prompt):
+        def task(scenario):
+            client = self.client()
+            started = time.perf_counter()
+            response = client.post('/generate', json={'prompt': prompt})
+            ok = response.status_code == 200 and response.get_json().get('success')
+            scenario.record(started, ok)
+            if ok:
+                self.generated.append((prompt, response.get_json()['fields']))
+        return task
+
+    def finalize(self, prompt, fields):
+        def task(scenario):
+            editor_fields = [
+                {'label': f['label'], 'dataType': f['type'], 'enumValues': ', '.join(f['options']),
+                 'validation': f['validation']}
+                for f in fields
+            ]
+            client = self.client()
+            started = time.perf_counter()
+            response = client.post('/finalize_form', json={'title': prompt.title(), 'fields': editor_fields})
+            ok = response.status_code == 200 and response.get_json().get('success')
+            scenario.record(started, ok)
+            if ok:
+                self.slugs.append(response.get_json()['url'].rsplit('/', 1)[1])
+        return task
+
+    def submit(self, slug, field_ids, values):
+        def task(scenario):
+            client = self.client()
+            started = time.perf_counter()
+            response = client.post(f'/form/{slug}', data={f'field-{i}': v for i, v in zip(field_ids, values)})
+            scenario.record(started, response.status_code == 200)
+        return task
+
+    def get(self, url):
+        def task(scenario):
+            client = self.client()
+            started = time.perf_counter()
+            response = client.get(url)
+            scenario.record(started, response.status_code == 200)
+        return task
+
+    def seed_large_form(self, form_id, field_ids, count):
+        """Bulk insert responses for the view_responses scenario without going through HTTP"""
+        from app.services.submissions import FieldIdCache, _insert_responses
+        with self.app.app_context():
+            from app.models import Form
+            fields = FieldIdCache().get(self.db.session.get(Form, form_id).url_slug)
+            now = datetime.datetime.utcnow()
+            for offset in range(0, count, 1000):
+                _insert_responses([
+                    (fields.form_id, fields.field_ids, self.values(fields.field_ids, i), now, fields.field_types,
+                     fields.option_indexes)
+                    for i in range(offset, min(count, offset + 1000))
+                ])
+                self.db.session.commit()
+
+    @staticmethod
+    def values(field_ids, index):
+        return [f'answer {index}-{position}' for position in range(len(field_ids))]
+
+    def form_field_ids(self, slug):
+        with self.app.app_context():
+            from app.models import Form, FormField
+            form = Form.query.filter_by(url_slug=slug).first()
+            return form.id, [f.id for f in FormField.query.filter_by(form_id=form.id).order_by(FormField.id)]
+
+    def execute(self):
+        args = self.args
+        results = {}
+
+        prompts = [self.rng.choice(PROMPTS) if self.rng.random() < 0.5 else f'{self.rng.choice(PROMPTS)} #{i}'
+                   for i in range(args.scale)]
+        results['generate'] = self.run(Scenario('generate'), [self.generate(p) for p in prompts])
+
+        results['finalize'] = self.run(Scenario('finalize'), [self.finalize(p, f) for p, f in self.generated])
+
+        forms = [self.form_field_ids(slug) + (slug,) for slug in self.slugs]
+        submissions = []
+        for i in range(args.scale * 20):
+            form_id, field_ids, slug = self.rng.choice(forms)
+            submissions.append(self.submit(slug, field_ids, self.values(field_ids, i)))
+        results['submit'] = self.run(Scenario('submit'), submissions)
+
+        large_id, large_fields, _ = forms[0]
+        self.seed_large_form(large_id, large_fields, args.large_form)
+        pages = []
+        for _ in range(args.scale):
+            pages.append(self.get(f'/form/{large_id}/responses'))
+            pages.append(self.get(f'/form/{large_id}/responses.json?limit=200'))
+        results['responses'] = self.run(Scenario('responses'), pages)
+
+        results['dashboard'] = self.run(Scenario('dashboard'), [self.get('/dashboard') for _ in range(args.scale)])
+
+        with self.app.app_context():
+            self.db.engine.dispose()
+        os.remove(self.path)
+        return {name: scenario.summary() for name, scenario in results.items()}
+
+
+def compare(results, baseline, tolerance):
+    """Return the regressions of results against a baseline"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        if previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']:.1f} ms vs baseline {previous['p95_ms']:.1f} ms")
+        if current['throughput'] < previous['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: {current['throughput']:.1f} req/s vs baseline {previous['throughput']:.1f} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=100, help='generate/finalize requests; submissions are 20x this')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds per fake Gemini call')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--large-form', type=int, default=20000, help='responses seeded for the responses scenario')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save-baseline', metavar='PATH')
+    parser.add_argument('--compare', metavar='PATH')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = LoadTest(args).execute()
+
+    print(f"{'scenario':>10} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, r in results.items():
+        print(f"{name:>10} {r['requests']:>9} {r['errors']:>7} {r['throughput']:>9.1f} "
+              f"{r['p50_ms'] or 0:>9.1f} {r['p95_ms'] or 0:>9.1f} {r['p99_ms'] or 0:>9.1f}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({'arguments': {k: v for k, v in vars(args).items() if k not in ('save_baseline', 'compare')},
+                       'scenarios': results}, f, indent=2)
+        print(f'baseline written to {args.save_baseline}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print(f'no regressions against {args.compare}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Fuzz and benchmark suite for the Gemini response parser.
+
+Usage:
+    python -m benchmarks.parse_fields [--iterations N] [--fuzz N]
+
+Runs three stages over the response corpus in benchmarks/corpus:
+  * accuracy: fields and option counts recovered by the line/comma heuristic that
+    parse_fields used originally versus the current tokenizer
+  * fuzz: random mutations of the corpus must never raise and must always yield
+    well-formed field dictionaries
+  * benchmark: parse time per response for both parsers
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.field_parser import FIELD_KEYS, parse_response  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus', 'gemini_responses.json')
+NOISE = [',', '"', '[', ']', '\n', '1. ', '“', '”', '**', ' ', 'é', '\t']
+
+
+def legacy_parse(response_text):
+    """The original split-on-newline-and-comma parser, kept as the baseline"""
+    fields = []
+    for line in response_text.strip().split('\n'):
+        line = line.strip()
+        if not line or not line[0].isdigit():
+            continue
+        parts = line.split('.', 1)
+        if len(parts) < 2:
+            continue
+        field_parts = [p.strip() for p in parts[1].strip().split(',')]
+        if len(field_parts) < 3:
+            continue
+        field = {
+            'label': field_parts[0],
+            'description': field_parts[1],
+            'type': field_parts[2],
+            'validation': field_parts[3] if len(field_parts) > 3 else '',
+            'options': field_parts[4] if len(field_parts) > 4 else []
+        }
+        if isinstance(field['options'], str) and field['options'].startswith('[') and field['options'].endswith(']'):
+            field['options'] = [opt.strip() for opt in field['options'][1:-1].split(',')]
+        fields.append(field)
+    return fields
+
+
+def load_corpus():
+    with open(CORPUS_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def accuracy(parser, corpus):
+    correct = total = 0
+    for entry in corpus:
+        fields = parser(entry['text'])
+        got = [(f['label'], len(f['options']) if isinstance(f['options'], list) else -1) for f in fields]
+        expected = [tuple(item) for item in entry['expected']]
+        total += len(expected)
+        correct += sum(1 for item in expected if item in got)
+    return correct, total
+
+
+def mutate(text, rng):
+    chars = list(text)
+    for _ in range(rng.randint(1, 8)):
+        position = rng.randrange(len(chars) + 1)
+        action = rng.random()
+        if action < 0.5:
+            chars.insert(position, rng.choice(NOISE))
+        elif action < 0.8 and chars:
+            del chars[min(position, len(chars) - 1)]
+        else:
+            chars[position:position] = list(rng.choice(text.split('\n')))
+    return ''.join(chars)
+
+
+def fuzz(corpus, iterations, seed=0):
+    rng = random.Random(seed)
+    for i in range(iterations):
+        text = mutate(rng.choice(corpus)['text'], rng)
+        try:
+            fields = parse_response(text)
+        except Exception as e:
+            raise AssertionError(f'parser raised {e!r} on fuzz case {i}: {text!r}')
+        for field in fields:
+            assert set(field) == set(FIELD_KEYS), field
+            assert all(isinstance(field[key], str) for key in FIELD_KEYS if key != 'options'), field
+            assert isinstance(field['options'], list) and all(isinstance(o, str) for o in field['options']), field
+    return iterations
+
+
+def benchmark(parser, corpus, iterations):
+    texts = [entry['text'] for entry in corpus]
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for text in texts:
+            parser(text)
+    elapsed = time.perf_counter() - start
+    return elapsed / (iterations * len(texts)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--fuzz', type=int, default=5000)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    for name, fn in (('legacy', legacy_parse), ('tokenizer', parse_response)):
+        correct, total = accuracy(fn, corpus)
+        print(f'{name:>10}: {correct}/{total} fields recovered, {benchmark(fn, corpus, args.iterations):.1f} us/response')
+    print(f'fuzz: {fuzz(corpus, args.fuzz)} mutated responses parsed without errors')
+
+
+if __name__ == '__main__':
+    main()
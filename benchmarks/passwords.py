@@ -0,0 +1,130 @@
+"""
+Benchmark the effect of a login burst on other requests.
+
+Usage:
+    python -m benchmarks.passwords [--logins N] [--login-threads N] [--readers N] [--method METHOD]
+
+Reader threads load a public form page (page cache off) for the whole run while
+login threads post --logins valid logins. Each profile runs in a fresh interpreter
+on a fresh SQLite database:
+
+  * idle: readers only, the reference latency
+  * inline: PASSWORD_HASH_WORKERS=0, hashing on the request threads as before
+  * pool: the shipped default, hashing in the niced process pool
+
+The script reports reader p50/p95 latency, login throughput and failed logins (e.g.
+rejected by a saturated pool) per profile. The attempt limiter is disabled so every
+login reaches the hasher.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROFILES = {
+    'idle': {'PASSWORD_HASH_WORKERS': 0},
+    'inline': {'PASSWORD_HASH_WORKERS': 0},
+    'pool': {},
+}
+USERS = 20
+PASSWORD = 'benchmark'
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] if samples else 0.0
+
+
+def run_profile(name, args):
+    from config import Config
+    settings = dict(PROFILES[name], SQLALCHEMY_DATABASE_URI='sqlite:///' + tempfile.mktemp(suffix='.db'),
+                    GEMINI_API_KEY=None, GEMINI_FAKE=False, FORM_CACHE_ENABLED=False, LOGIN_LIMIT_ENABLED=False,
+                    PASSWORD_HASH_METHOD=args.method, INSTRUMENTATION_ENABLED=False)
+    config = type('BenchConfig', (Config,), settings)
+
+    from app import create_app, db
+    from app.models import Form, FormField, User
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+        form = Form(title='Password benchmark', url_slug='pwbench1')
+        db.session.add(form)
+        db.session.add_all([FormField(label=f'Question {i}', field_type='text', form=form) for i in range(6)])
+        for i in range(USERS):
+            user = User(email=f'user{i}@example.com')
+            user.set_password(PASSWORD)
+            db.session.add(user)
+        db.session.commit()
+
+    latencies = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def reader():
+        client = app.test_client()
+        while not done.is_set():
+            started = time.perf_counter()
+            client.get('/form/pwbench1')
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    def login(index):
+        client = app.test_client()
+        response = client.post('/login', data={'email': f'user{index % USERS}@example.com', 'password': PASSWORD})
+        return response.status_code == 302 and response.location.endswith('/')
+
+    with ThreadPoolExecutor(max_workers=args.readers + args.login_threads) as pool:
+        readers = [pool.submit(reader) for _ in range(args.readers)]
+        started = time.perf_counter()
+        failed = 0
+        if name == 'idle':
+            time.sleep(args.idle_seconds)
+        else:
+            with ThreadPoolExecutor(max_workers=args.login_threads) as logins:
+                failed = list(logins.map(login, range(args.logins))).count(False)
+        elapsed = time.perf_counter() - started
+        done.set()
+        for future in readers:
+            future.result()
+
+    latencies.sort()
+    return {
+        'reader_p50_ms': percentile(latencies, 0.50) * 1000,
+        'reader_p95_ms': percentile(latencies, 0.95) * 1000,
+        'logins_per_s': 0.0 if name == 'idle' else args.logins / elapsed,
+        'failed_logins': failed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=40)
+    parser.add_argument('--login-threads', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--method', default='scrypt')
+    parser.add_argument('--idle-seconds', type=float, default=3.0)
+    parser.add_argument('--profile', choices=PROFILES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profile:
+        print(json.dumps(run_profile(args.profile, args)))
+        return
+
+    print(f"{'profile':>8} {'reader p50 ms':>14} {'reader p95 ms':>14} {'logins/s':>9} {'failed':>7}")
+    for name in PROFILES:
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.passwords', '--profile', name] + sys.argv[1:],
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                capture_output=True, text=True, check=True).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(f"{name:>8} {r['reader_p50_ms']:>14.1f} {r['reader_p95_ms']:>14.1f} {r['logins_per_s']:>9.1f} "
+              f"{r['failed_logins']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark cold-start time with eager and lazy Gemini client initialization.
+
+Usage:
+    python -m benchmarks.startup [--runs N] [--top N] [--save-baseline PATH] [--compare PATH] [--tolerance F]
+
+Each run starts a fresh interpreter with `-X importtime` that builds the app with
+create_app and serves one request to a non-AI route (GET /login), the way a worker
+after an autoscale event would. Two profiles are compared:
+
+  * eager: GEMINI_LAZY_INIT=0, google.generativeai is imported and configured at boot
+  * lazy: the shipped default, the client is imported on the first generation
+
+The script reports the median import, create_app, first-request and total process
+time of each profile, and the slowest imports of the eager profile (cumulative time
+of modules at most --depth levels deep in the import tree). With --save-baseline
+the medians are written as JSON; with --compare the run fails (exit status 1) when
+a profile's total time is more than --tolerance slower than the baseline.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFILES = {
+    'eager': {'GEMINI_LAZY_INIT': '0'},
+    'lazy': {'GEMINI_LAZY_INIT': '1'},
+}
+
+CHILD = """
+import json, time
+started = time.perf_counter()
+from app import create_app, db
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+with app.app_context():
+    db.create_all()
+client = app.test_client()
+requested = time.perf_counter()
+status = client.get('/login').status_code
+served = time.perf_counter()
+print(json.dumps({'imports': imported - started, 'create_app': created - imported,
+                  'first_request': served - requested, 'status': status}))
+"""
+
+
+def parse_importtime(stderr, depth):
+    """Return (cumulative seconds, module) of the imports at most depth levels deep, slowest first"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        if level <= depth:
+            entries.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(entries, reverse=True)
+
+
+def run_once(overrides):
+    path = tempfile.mktemp(suffix='.db')
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + path, GEMINI_API_KEY='startup-benchmark', GEMINI_FAKE='0',
+               GEMINI_PREWARM='0', PROFILER_ENABLED='0', **overrides)
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD], cwd=ROOT, env=env,
+                             capture_output=True, text=True)
+    total = time.perf_counter() - started
+    if os.path.exists(path):
+        os.remove(path)
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.splitlines()[-1] if process.stderr else 'child failed')
+    timings = json.loads(process.stdout.strip().splitlines()[-1])
+    timings['total'] = total
+    return timings, process.stderr
+
+
+def compare(results, baseline, tolerance):
+    """Return the regressions of results against a baseline"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get('profiles', {}).get(name)
+        if previous and current['total'] > previous['total'] * (1 + tolerance):
+            regressions.append(f"{name}: {current['total'] * 1000:.0f} ms vs baseline {previous['total'] * 1000:.0f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='slowest imports listed')
+    parser.add_argument('--depth', type=int, default=2, help='import tree depth considered for the listing')
+    parser.add_argument('--save-baseline', metavar='PATH')
+    parser.add_argument('--compare', metavar='PATH')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = {}
+    importtime = None
+    for name, overrides in PROFILES.items():
+        runs = []
+        for _ in range(args.runs):
+            timings, stderr = run_once(overrides)
+            runs.append(timings)
+            if name == 'eager' and importtime is None:
+                importtime = stderr
+        results[name] = {key: statistics.median(run[key] for run in runs)
+                         for key in ('imports', 'create_app', 'first_request', 'total')}
+
+    print(f"{'profile':>8} {'imports':>9} {'create_app':>11} {'first req':>10} {'total':>9}   (median ms)")
+    for name, r in results.items():
+        print(f"{name:>8} {r['imports'] * 1000:>9.0f} {r['create_app'] * 1000:>11.0f} "
+              f"{r['first_request'] * 1000:>10.0f} {r['total'] * 1000:>9.0f}")
+
+    print('\nslowest imports (eager, cumulative ms):')
+    for seconds, module in parse_importtime(importtime, args.depth)[:args.top]:
+        print(f'{seconds * 1000:>9.1f}  {module}')
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({'arguments': {'runs': args.runs}, 'profiles': results}, f, indent=2)
+        print(f'baseline written to {args.save_baseline}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print(f'no regressions against {args.compare}')
+
+
+if __name__ == '__main__':
+    main()
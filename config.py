@@ -19,3 +19,162 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Engine tuning; see "Database" in README.md. SQLALCHEMY_ENGINE_OPTIONS is derived
+    # from these in create_app unless a config sets it explicitly
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') != '0'
+    DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', '0') == '1'
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+    SQLITE_WAL = os.environ.get('SQLITE_WAL', '1') != '0'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+
+    # Gemini response cache
+    GEMINI_CACHE_ENABLED = os.environ.get('GEMINI_CACHE_ENABLED', '1') != '0'
+    GEMINI_CACHE_MAX_ENTRIES = int(os.environ.get('GEMINI_CACHE_MAX_ENTRIES', 256))
+    GEMINI_CACHE_TTL = int(os.environ.get('GEMINI_CACHE_TTL', 3600))
+    GEMINI_CACHE_SQLITE_PATH = os.environ.get('GEMINI_CACHE_SQLITE_PATH')
+
+    # Replace Gemini with the deterministic local fake (load tests and offline development)
+    GEMINI_FAKE = os.environ.get('GEMINI_FAKE', '0') == '1'
+    GEMINI_FAKE_LATENCY = float(os.environ.get('GEMINI_FAKE_LATENCY', 1.0))
+    GEMINI_FAKE_ERROR_RATE = float(os.environ.get('GEMINI_FAKE_ERROR_RATE', 0.0))
+
+    # Ask Gemini for a JSON array of fields (using response schemas when the client supports them)
+    GEMINI_STRUCTURED_OUTPUT = os.environ.get('GEMINI_STRUCTURED_OUTPUT', '0') == '1'
+
+    # Token budget for the user's part of a prompt (estimated; longer prompts are truncated)
+    GEMINI_MAX_INPUT_TOKENS = int(os.environ.get('GEMINI_MAX_INPUT_TOKENS', 1000))
+    # Thinking tokens allowed to thinking models (Gemini 2.5+) on top of the answer's output limit;
+    # clients that cannot set a thinking budget get a limit of at least 8192 tokens instead
+    GEMINI_THINKING_BUDGET = int(os.environ.get('GEMINI_THINKING_BUDGET', 1024))
+
+    # Import and configure the Gemini client on first use instead of at boot, optionally
+    # warming it on a background thread GEMINI_PREWARM_DELAY seconds after startup
+    GEMINI_LAZY_INIT = os.environ.get('GEMINI_LAZY_INIT', '1') == '1'
+    GEMINI_PREWARM = os.environ.get('GEMINI_PREWARM', '0') == '1'
+    GEMINI_PREWARM_DELAY = float(os.environ.get('GEMINI_PREWARM_DELAY', 2.0))
+
+    # Bounded executor for LLM calls (see gunicorn.conf.py for worker settings)
+    GENERATION_MAX_WORKERS = int(os.environ.get('GENERATION_MAX_WORKERS', 4))
+    GENERATION_MAX_PENDING = int(os.environ.get('GENERATION_MAX_PENDING', 16))
+    GENERATION_TIMEOUT = float(os.environ.get('GENERATION_TIMEOUT', 30))
+    # Streams (POST /generate/stream) hold their request thread until the last field, so keep
+    # GENERATION_STREAM_MAX below the gunicorn threads per worker; the whole stream must end in
+    # GENERATION_STREAM_TIMEOUT seconds
+    GENERATION_STREAM_MAX = int(os.environ.get('GENERATION_STREAM_MAX', 4))
+    GENERATION_STREAM_TIMEOUT = float(os.environ.get('GENERATION_STREAM_TIMEOUT', 50))
+
+    # Reuse the fields of a similar form finalized by the same user instead of calling Gemini
+    TEMPLATE_REUSE_ENABLED = os.environ.get('TEMPLATE_REUSE_ENABLED', '0') == '1'
+    TEMPLATE_MATCH_THRESHOLD = float(os.environ.get('TEMPLATE_MATCH_THRESHOLD', 0.75))
+    TEMPLATE_INDEX_REFRESH = int(os.environ.get('TEMPLATE_INDEX_REFRESH', 300))
+    TEMPLATE_BACKGROUND_REFRESH = os.environ.get('TEMPLATE_BACKGROUND_REFRESH', '0') == '1'
+
+    # POST /generate/batch
+    GENERATION_BATCH_MAX_ITEMS = int(os.environ.get('GENERATION_BATCH_MAX_ITEMS', 50))
+    GENERATION_BATCH_MAX_PARALLELISM = int(os.environ.get('GENERATION_BATCH_MAX_PARALLELISM', 8))
+    # Whole-batch deadline; keep it below the gunicorn worker timeout (GUNICORN_TIMEOUT, 60 s)
+    GENERATION_BATCH_TIMEOUT = float(os.environ.get('GENERATION_BATCH_TIMEOUT', 50))
+
+    # Background generation jobs (POST /generate with "async": true)
+    JOB_QUEUE_WORKERS = int(os.environ.get('JOB_QUEUE_WORKERS', 2))
+    JOB_QUEUE_MAX_QUEUED = int(os.environ.get('JOB_QUEUE_MAX_QUEUED', 100))
+    # Workers refresh their unfinished jobs every JOB_QUEUE_HEARTBEAT seconds; jobs not refreshed for
+    # JOB_QUEUE_STALE_AFTER seconds (their worker died or restarted) are requeued by another worker,
+    # up to JOB_QUEUE_MAX_ATTEMPTS runs per job
+    JOB_QUEUE_HEARTBEAT = float(os.environ.get('JOB_QUEUE_HEARTBEAT', 15))
+    JOB_QUEUE_STALE_AFTER = float(os.environ.get('JOB_QUEUE_STALE_AFTER', 60))
+    JOB_QUEUE_MAX_ATTEMPTS = int(os.environ.get('JOB_QUEUE_MAX_ATTEMPTS', 3))
+
+    # Coalescing of identical concurrent generations; the cross-worker mode uses the
+    # generation_lock table and needs GEMINI_CACHE_SQLITE_PATH to share results
+    SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', '1') != '0'
+    SINGLE_FLIGHT_DB_LOCKS = os.environ.get('SINGLE_FLIGHT_DB_LOCKS', '0') == '1'
+    SINGLE_FLIGHT_WAIT_TIMEOUT = float(os.environ.get('SINGLE_FLIGHT_WAIT_TIMEOUT', 30))
+
+    # Client-side rate limiting, retries and circuit breaker around Gemini calls
+    GEMINI_RATE_LIMIT_RPM = float(os.environ.get('GEMINI_RATE_LIMIT_RPM', 60))
+    GEMINI_RATE_LIMIT_BURST = int(os.environ.get('GEMINI_RATE_LIMIT_BURST', 10))
+    GEMINI_RATE_LIMIT_WAIT = float(os.environ.get('GEMINI_RATE_LIMIT_WAIT', 5))
+    GEMINI_MAX_ATTEMPTS = int(os.environ.get('GEMINI_MAX_ATTEMPTS', 3))
+    GEMINI_RETRY_BASE_DELAY = float(os.environ.get('GEMINI_RETRY_BASE_DELAY', 0.5))
+    GEMINI_RETRY_MAX_DELAY = float(os.environ.get('GEMINI_RETRY_MAX_DELAY', 8))
+    GEMINI_BREAKER_THRESHOLD = int(os.environ.get('GEMINI_BREAKER_THRESHOLD', 5))
+    GEMINI_BREAKER_RESET = float(os.environ.get('GEMINI_BREAKER_RESET', 30))
+
+    # view_form submission pipeline
+    SUBMISSION_FIELD_CACHE_SIZE = int(os.environ.get('SUBMISSION_FIELD_CACHE_SIZE', 1024))
+    SUBMISSION_FIELD_CACHE_TTL = int(os.environ.get('SUBMISSION_FIELD_CACHE_TTL', 300))
+    RESPONSE_WRITE_BEHIND = os.environ.get('RESPONSE_WRITE_BEHIND', '0') == '1'
+    RESPONSE_BUFFER_MAX_BATCH = int(os.environ.get('RESPONSE_BUFFER_MAX_BATCH', 200))
+    RESPONSE_BUFFER_MAX_LATENCY = float(os.environ.get('RESPONSE_BUFFER_MAX_LATENCY', 0.05))
+    # Buffered submissions that still fail when written one by one are appended here as JSON Lines
+    RESPONSE_DEAD_LETTER_PATH = os.environ.get('RESPONSE_DEAD_LETTER_PATH',
+                                               os.path.join(basedir, 'failed_responses.jsonl'))
+
+    # How answers are stored: 'rows' (one text row per answer), 'compact' (option answers stored
+    # as an index into FieldOption) or 'packed' (compact, with short answers in one JSON blob)
+    RESPONSE_STORAGE_MODE = os.environ.get('RESPONSE_STORAGE_MODE', 'rows')
+    RESPONSE_PACKED_MAX_LENGTH = int(os.environ.get('RESPONSE_PACKED_MAX_LENGTH', 200))
+
+    # Per-form response analytics, updated with each write-behind batch, or every
+    # ANALYTICS_FLUSH_INTERVAL seconds when responses are written synchronously
+    ANALYTICS_ENABLED = os.environ.get('ANALYTICS_ENABLED', '1') != '0'
+    ANALYTICS_HISTOGRAM_BUCKET_WIDTH = float(os.environ.get('ANALYTICS_HISTOGRAM_BUCKET_WIDTH', 10))
+    ANALYTICS_FLUSH_INTERVAL = float(os.environ.get('ANALYTICS_FLUSH_INTERVAL', 1.0))
+
+    # `flask responses-archive` moves whole months of responses older than a form's retention
+    # (Form.retention_days, else ARCHIVE_RETENTION_DAYS; 0 keeps them) into compressed files
+    # under ARCHIVE_DIR. ARCHIVE_FORMAT is 'auto' (Parquet when pyarrow is installed), 'parquet' or 'jsonl'
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', os.path.join(basedir, 'archive'))
+    ARCHIVE_FORMAT = os.environ.get('ARCHIVE_FORMAT', 'auto')
+    ARCHIVE_RETENTION_DAYS = int(os.environ.get('ARCHIVE_RETENTION_DAYS', 365))
+
+    # Request timing, SQL statement counts and /metrics
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', '1') != '0'
+    INSTRUMENTATION_SQL_WARN = int(os.environ.get('INSTRUMENTATION_SQL_WARN', 50))
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', '0') == '1'
+    PROFILER_DIR = os.environ.get('PROFILER_DIR', os.path.join(basedir, 'profiles'))
+    PROFILER_INTERVAL = float(os.environ.get('PROFILER_INTERVAL', 0.005))
+    PROFILER_SLOW_THRESHOLD = float(os.environ.get('PROFILER_SLOW_THRESHOLD', 1.0))
+
+    # Rendered public form pages
+    FORM_CACHE_ENABLED = os.environ.get('FORM_CACHE_ENABLED', '1') != '0'
+    FORM_CACHE_SIZE = int(os.environ.get('FORM_CACHE_SIZE', 512))
+    FORM_CACHE_DIR = os.environ.get('FORM_CACHE_DIR')
+    FORM_CACHE_VERSION_TTL = float(os.environ.get('FORM_CACHE_VERSION_TTL', 5))
+    FORM_CACHE_MAX_AGE = int(os.environ.get('FORM_CACHE_MAX_AGE', 60))
+
+    # Serve the content-hashed, precompressed static files written by `flask assets-build`
+    # (when their manifest exists) with a year-long immutable Cache-Control
+    ASSETS_ENABLED = os.environ.get('ASSETS_ENABLED', '1') != '0'
+    ASSETS_MAX_AGE = int(os.environ.get('ASSETS_MAX_AGE', 31536000))
+
+    # Cache of logged-in users for Flask-Login, so authenticated requests skip the user query;
+    # USER_SESSION_CLAIMS also keeps them in the signed session cookie for USER_SESSION_CLAIMS_TTL seconds
+    USER_CACHE_ENABLED = os.environ.get('USER_CACHE_ENABLED', '1') != '0'
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 300))
+    USER_SESSION_CLAIMS = os.environ.get('USER_SESSION_CLAIMS', '0') == '1'
+    USER_SESSION_CLAIMS_TTL = int(os.environ.get('USER_SESSION_CLAIMS_TTL', 900))
+
+    # Password hashing in a process pool (0 workers hashes on the request thread); stored
+    # hashes made with another method or cost are upgraded on the next successful login
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 16))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+    PASSWORD_HASH_NICE = int(os.environ.get('PASSWORD_HASH_NICE', 5))
+
+    # Login attempts allowed per client IP and per email within LOGIN_LIMIT_WINDOW seconds;
+    # LOGIN_TRUSTED_PROXIES is the number of proxies whose X-Forwarded-For entries are trusted
+    LOGIN_LIMIT_ENABLED = os.environ.get('LOGIN_LIMIT_ENABLED', '1') != '0'
+    LOGIN_LIMIT_PER_IP = int(os.environ.get('LOGIN_LIMIT_PER_IP', 30))
+    LOGIN_LIMIT_PER_EMAIL = int(os.environ.get('LOGIN_LIMIT_PER_EMAIL', 10))
+    LOGIN_LIMIT_WINDOW = float(os.environ.get('LOGIN_LIMIT_WINDOW', 300))
+    LOGIN_TRUSTED_PROXIES = int(os.environ.get('LOGIN_TRUSTED_PROXIES', 0))
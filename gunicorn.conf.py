@@ -0,0 +1,27 @@
+import os
+
+# gunicorn reads this file automatically when started from the project root
+# (the .replit deployment runs `gunicorn --bind=0.0.0.0:5000 --reuse-port run:app`).
+#
+# Threaded workers let a slow /generate call occupy one thread while the other
+# threads of the same worker keep serving login, view_form submissions and
+# /health. Gemini calls additionally go through the bounded GenerationExecutor
+# (GENERATION_MAX_WORKERS / GENERATION_MAX_PENDING), so at most that many
+# threads per worker can be tied up waiting on the AI service; excess requests
+# get a fast 503 instead of queueing behind them.
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Must exceed GENERATION_TIMEOUT so a worker is never killed mid-request
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+
+def post_worker_init(worker):
+    # Background threads start in each worker once the app is loaded, before the worker's
+    # request threads exist; flask CLI commands that build the app never start them
+    from app import start_background_services
+    start_background_services()
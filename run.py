@@ -1,5 +1,5 @@
-from app import create_app, db
-from app.models import User, Form, FormField, FormResponse, ResponseAnswer
+from app import create_app, db, start_background_services
+from app.models import User, Form, FormField, FormResponse, ResponseAnswer, ResponseArchive
 
 app = create_app()
 
@@ -11,8 +11,10 @@ def make_shell_context():
         'Form': Form,
         'FormField': FormField,
         'FormResponse': FormResponse,
-        'ResponseAnswer': ResponseAnswer
+        'ResponseAnswer': ResponseAnswer,
+        'ResponseArchive': ResponseArchive
     }
 
 if __name__ == '__main__':
+    start_background_services()
     app.run(debug=True, host='0.0.0.0', port=5000)
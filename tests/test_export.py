@@ -0,0 +1,14 @@
+from app.services.export import _csv_cell
+
+
+def test_formulas_are_escaped():
+    assert _csv_cell('=1+2') == "'=1+2"
+    assert _csv_cell('@SUM(A1)') == "'@SUM(A1)"
+    assert _csv_cell('-2+3') == "'-2+3"
+
+
+def test_numbers_and_plain_text_are_kept():
+    assert _csv_cell('-5') == '-5'
+    assert _csv_cell('+1.5e3') == '+1.5e3'
+    assert _csv_cell('hello') == 'hello'
+    assert _csv_cell(None) == ''
@@ -0,0 +1,45 @@
+from app.services.field_parser import format_options, parse_field_line, parse_options, split_top_level
+
+
+def test_split_ignores_commas_inside_quotes_and_brackets():
+    assert split_top_level('Name, "Last, first", text, [A, B]') == ['Name', 'Last, first', 'text', '[A, B]']
+
+
+def test_split_keeps_quotes_inside_brackets():
+    assert split_top_level('[Yes, "No, never"]') == ['[Yes, "No, never"]']
+
+
+def test_split_handles_curly_quotes():
+    assert split_top_level('“a, b”, c') == ['a, b', 'c']
+
+
+def test_split_falls_back_on_unclosed_quote():
+    assert split_top_level('5" screen, large, text') == ['5" screen', 'large', 'text']
+
+
+def test_parse_options():
+    assert parse_options('Yes, "No, never", , Maybe') == ['Yes', 'No, never', 'Maybe']
+    assert parse_options('[Red, Green]') == ['Red', 'Green']
+    assert parse_options('') == []
+    assert parse_options(None) == []
+
+
+def test_format_options_round_trips():
+    options = ['Yes', 'No, never', 'Say "hi"', '[x]']
+    assert parse_options(format_options(options)) == options
+
+
+def test_parse_field_line():
+    field = parse_field_line('4. Country, Select your country, select, required, [USA, "Korea, South", Other]')
+    assert field == {
+        'label': 'Country',
+        'description': 'Select your country',
+        'type': 'select',
+        'validation': 'required',
+        'options': ['USA', 'Korea, South', 'Other']
+    }
+
+
+def test_parse_field_line_rejects_other_lines():
+    assert parse_field_line('Here are your fields:') is None
+    assert parse_field_line('1. Name, text') is None
@@ -0,0 +1,106 @@
+import datetime
+import threading
+import time
+
+from app import db
+from app.models import GenerationJob
+from app.services.fake_gemini import FakeGenerativeModel
+from app.services.gemini_service import GeminiService
+from app.services.job_queue import GenerationJobQueue
+
+
+class BlockingModel(FakeGenerativeModel):
+    """Fake model that holds every call until released"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        self.release.wait(5)
+        return super().generate_content(contents, stream=stream, **kwargs)
+
+
+def make_queue(app, model, **kwargs):
+    service = GeminiService('fake', lazy=True)
+    service.model = model
+    return GenerationJobQueue(app, service, **kwargs)
+
+
+def wait_for(queue, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] not in ('queued', 'running'):
+            return job
+        db.session.remove()
+        time.sleep(0.02)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+def test_enqueue_process_result(app):
+    queue = make_queue(app, FakeGenerativeModel())
+    try:
+        job = wait_for(queue, queue.enqueue('A contact form'))
+        assert job['status'] == 'done'
+        assert job['result']['success']
+        assert [field['label'] for field in job['result']['fields']][:2] == ['Full Name', 'Email Address']
+        assert queue.stats()['completed'] == 1
+    finally:
+        queue.shutdown()
+
+
+def test_identical_prompts_share_a_job(app):
+    model = BlockingModel()
+    queue = make_queue(app, model)
+    try:
+        first = queue.enqueue('A contact form')
+        second = queue.enqueue('  a CONTACT form ')
+        other = queue.enqueue('A job application')
+        assert second == first
+        assert other != first
+        model.release.set()
+        assert wait_for(queue, first)['status'] == 'done'
+        assert wait_for(queue, other)['status'] == 'done'
+        assert model.calls == 2
+        assert queue.stats()['deduplicated'] == 1
+    finally:
+        queue.shutdown()
+
+
+def test_model_errors_fail_the_job(app):
+    queue = make_queue(app, FakeGenerativeModel(error_rate=1.0))
+    try:
+        job = wait_for(queue, queue.enqueue('A contact form'))
+        assert job['status'] == 'failed'
+        assert not job['result']['success']
+    finally:
+        queue.shutdown()
+
+
+def test_abandoned_jobs_are_recovered_up_to_max_attempts(app):
+    stale = datetime.datetime.utcnow() - datetime.timedelta(minutes=5)
+    db.session.add_all([
+        GenerationJob(id='abandoned', prompt_key='k1', prompt='A contact form', status='running',
+                      owner='gone', heartbeat_at=stale, attempts=1),
+        GenerationJob(id='poison', prompt_key='k2', prompt='A survey', status='running',
+                      owner='gone', heartbeat_at=stale, attempts=3),
+        GenerationJob(id='alive', prompt_key='k3', prompt='A signup form', status='running',
+                      owner='other', heartbeat_at=datetime.datetime.utcnow(), attempts=1)
+    ])
+    db.session.commit()
+
+    queue = make_queue(app, FakeGenerativeModel(), stale_after=60, max_attempts=3)
+    try:
+        queue.maintain()
+        recovered = wait_for(queue, 'abandoned')
+        assert recovered['status'] == 'done'
+        poison = queue.get('poison')
+        assert poison['status'] == 'failed'
+        assert not poison['result']['success']
+        assert queue.get('alive')['status'] == 'running'
+        assert db.session.get(GenerationJob, 'abandoned').attempts == 2
+        assert queue.stats()['recovered'] == 1
+        assert queue.stats()['abandoned'] == 1
+    finally:
+        queue.shutdown()
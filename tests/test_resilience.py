@@ -0,0 +1,70 @@
+from app.services import resilience
+from app.services.resilience import CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_breaker(monkeypatch, **kwargs):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience.time, 'monotonic', clock)
+    return CircuitBreaker(**kwargs), clock
+
+
+def test_opens_after_threshold_failures(monkeypatch):
+    breaker, _ = make_breaker(monkeypatch, failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+        assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+
+def test_success_resets_failure_count(monkeypatch):
+    breaker, _ = make_breaker(monkeypatch, failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+
+
+def test_half_open_probe_closes_on_success(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch, failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == 'half_open'
+    # Only one probe at a time
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+
+def test_half_open_probe_reopens_on_failure(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch, failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+
+def test_released_probe_lets_next_call_probe(monkeypatch):
+    breaker, clock = make_breaker(monkeypatch, failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.state == 'open'
+    assert breaker.allow()
+    assert breaker.state == 'half_open'